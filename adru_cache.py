@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+
+# Results of merges and exports per decoded file, the file version (from get_file_version in adru_db_utils)
+# is stored with each result so a result made before the messages changed is never returned.
+# key -> (file version, result), the most recently used entry last
+_result_cache = OrderedDict()
+
+_cache_settings = {"max_entries": 32, "cache_dir": None, "max_disk_entries": 256}
+
+
+def configure_result_cache(max_entries: int = 32, cache_dir: Path | None = None, max_disk_entries: int = 256):
+    """
+    Sets the size of the result cache and where it is kept on disk.
+
+    Args:
+        max_entries (int): Number of results kept in memory, the least recently used one is dropped first
+        cache_dir (Path | None): Folder to also keep the results in between runs, or None for memory only
+        max_disk_entries (int): Number of result files kept in cache_dir
+    """
+    _cache_settings.update(max_entries=max_entries, cache_dir=Path(cache_dir) if cache_dir else None,
+                           max_disk_entries=max_disk_entries)
+    while len(_result_cache) > max_entries:
+        _result_cache.popitem(last=False)
+
+
+def _file_key(db_path: Path, amf_id: int) -> str:
+    content = json.dumps([str(Path(db_path).resolve()), amf_id])
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _cache_key(db_path: Path, amf_id: int, kind: str, columns: dict | None, local_ids: list[int] | None) -> str:
+    # Starts with the key of the file, so all results of a file can be found when it is removed
+    content = json.dumps([kind, columns, local_ids], sort_keys=True)
+    return f"{_file_key(db_path, amf_id)}-{hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()}"
+
+
+def _disk_path(key: str) -> Path | None:
+    cache_dir = _cache_settings["cache_dir"]
+    return cache_dir / f"{key}.pkl" if cache_dir else None
+
+
+def _remember(key: str, version: tuple, result):
+    _result_cache[key] = (version, result)
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > _cache_settings["max_entries"]:
+        _result_cache.popitem(last=False)
+
+
+def get_cached_result(db_path: Path, amf_id: int, kind: str, version: tuple, columns: dict | None = None,
+                      local_ids: list[int] | None = None):
+    """
+    Looks up a stored result, first in memory and then on disk. A result stored before the messages of the
+    file changed is not returned.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        kind (str): Name of the kind of result, e.g. "enrich"
+        version (tuple): Current version of the file from get_file_version
+        columns (dict | None): Attributes per section the result was made for
+        local_ids (list[int] | None): Messages the result was made for
+
+    Returns:
+        The stored result, or None if there is none for the current version of the file
+    """
+    version = tuple(version)
+    key = _cache_key(db_path, amf_id, kind, columns, local_ids)
+
+    if key in _result_cache:
+        cached_version, result = _result_cache[key]
+        if cached_version == version:
+            _result_cache.move_to_end(key)
+            return result
+        del _result_cache[key]
+
+    path = _disk_path(key)
+    if path and path.exists():
+        try:
+            with path.open("rb") as f:
+                cached_version, result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if tuple(cached_version) == version:
+            # The modification time is used to drop the least recently used files
+            os.utime(path)
+            _remember(key, version, result)
+            return result
+        path.unlink(missing_ok=True)
+
+    return None
+
+
+def store_cached_result(db_path: Path, amf_id: int, kind: str, version: tuple, result, columns: dict | None = None,
+                        local_ids: list[int] | None = None):
+    """
+    Stores a result in memory, and on disk when a cache folder is set.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        kind (str): Name of the kind of result, e.g. "enrich"
+        version (tuple): Version of the file the result was made from, from get_file_version
+        result: The result, it has to be picklable to be kept on disk
+        columns (dict | None): Attributes per section the result was made for
+        local_ids (list[int] | None): Messages the result was made for
+    """
+    version = tuple(version)
+    key = _cache_key(db_path, amf_id, kind, columns, local_ids)
+    _remember(key, version, result)
+
+    path = _disk_path(key)
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".part")
+    with tmp_path.open("wb") as f:
+        pickle.dump((version, result), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    # Drop the least recently used files, other processes (parallel exports) may remove files at the same time
+    files = []
+    for cache_path in path.parent.glob("*.pkl"):
+        try:
+            files.append((cache_path.stat().st_mtime_ns, cache_path))
+        except FileNotFoundError:
+            continue
+    files.sort()
+    for _, old_path in files[:max(len(files) - _cache_settings["max_disk_entries"], 0)]:
+        old_path.unlink(missing_ok=True)
+
+
+def forget_file_results(db_path: Path, amf_id: int):
+    """
+    Removes the results of a decoded file from memory and from the cache folder. Called when the file is
+    removed from the database.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+    """
+    prefix = f"{_file_key(db_path, amf_id)}-"
+    for key in [key for key in _result_cache if key.startswith(prefix)]:
+        del _result_cache[key]
+    cache_dir = _cache_settings["cache_dir"]
+    if cache_dir and cache_dir.exists():
+        for path in cache_dir.glob(f"{prefix}*.pkl"):
+            path.unlink(missing_ok=True)
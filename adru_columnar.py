@@ -0,0 +1,329 @@
+import hashlib
+import json
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from adru_db_utils import iter_file_messages, get_populated_columns, get_file_version, numeric_value, \
+    SECTION_TABLES, SUMMARY_TIME_ATTRIBUTES
+
+# Folder with the columnar copy of the decoded files, None when the copy is not built or used
+_columnar_settings = {"cache_dir": None}
+
+
+def configure_columnar_cache(cache_dir: Path | None):
+    """
+    Sets the folder for the columnar copy of the decoded files.
+
+    Args:
+        cache_dir (Path | None): Folder for the copies, or None to not build or use them
+    """
+    _columnar_settings["cache_dir"] = Path(cache_dir) if cache_dir else None
+
+
+def _cache_folder(db_path: Path, amf_id: int) -> Path | None:
+    cache_dir = _columnar_settings["cache_dir"]
+    if cache_dir is None:
+        return None
+    # The same database name can be used in other folders (e.g. shards), so the full path is part of the name
+    resolved = str(Path(db_path).resolve())
+    database = f"{Path(db_path).stem}-{hashlib.blake2b(resolved.encode('utf-8'), digest_size=4).hexdigest()}"
+    return cache_dir / database / str(amf_id)
+
+
+def _read_meta(folder: Path) -> dict | None:
+    try:
+        with (folder / "meta.json").open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def message_times(values: dict[tuple[str, str], np.ndarray], count: int) -> np.ndarray:
+    """
+    Seconds since 1970 of each message from the JRU date and time attributes, carried over from the last
+    message that had them, NaN before the first one. The same times as the SQL of adru_timeseries.
+
+    Args:
+        values (dict): (section, attribute) -> numeric value of each message, NaN when it is not set
+        count (int): Number of messages
+
+    Returns:
+        np.ndarray: The time of each message
+    """
+    parts = [values.get(("jru", a), np.full(count, np.nan)) for a in SUMMARY_TIME_ATTRIBUTES]
+    year, month, day, hour, minute, second, millisecond = parts
+    known = ~np.isnan(np.column_stack(parts[:6])).any(axis=1)
+    # The dates and times julianday accepts, hour 24 is midnight of the next day
+    known &= (year >= 0) & (year < 10000) & (month >= 1) & (month < 13) & (day >= 1) & (day < 32)
+    known &= (hour >= 0) & (hour < 25) & (minute >= 0) & (minute < 60) & (second >= 0) & (second < 60)
+
+    year, month, day, hour, minute, second = (part[known].astype(np.int64) for part in parts[:6])
+    dates = ((year - 1970).astype("M8[Y]") + (month - 1).astype("m8[M]")).astype("M8[D]") + (day - 1).astype("m8[D]")
+    seconds = dates.astype(np.int64) * 86400 + hour * 3600 + minute * 60 + second
+    times = np.full(count, np.nan)
+    times[known] = np.round(seconds + np.nan_to_num(millisecond[known]) / 1000.0, 3)
+
+    if known.any():
+        times = times[np.maximum.accumulate(np.where(known, np.arange(count), 0))]
+        times[:np.argmax(known)] = np.nan
+    return times
+
+
+def build_columnar_cache(db_path: Path, amf_id: int, force: bool = False, chunk_size: int = 5000) -> int:
+    """
+    Writes a columnar copy of the messages of a decoded file: for each attribute that has a value in the
+    file a NumPy .npy file with the numeric value, one with the null mask and one with the text of each
+    message, so analytic queries read only the attributes they need from memory mapped files instead of
+    whole rows from SQLite. The copy is skipped when it is up to date, unless force is set.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        force (bool): Build the copy even if it is up to date
+        chunk_size (int): Number of messages read from the database per query
+
+    Returns:
+        int: Number of messages in the copy, 0 if it was up to date or no cache folder is set
+    """
+    folder = _cache_folder(db_path, amf_id)
+    if folder is None:
+        return 0
+    version = list(get_file_version(db_path, amf_id))
+    meta = _read_meta(folder)
+    if not force and meta and meta["version"] == version:
+        return 0
+
+    columns = get_populated_columns(db_path, amf_id)
+    keys = [(section, attribute) for section in SECTION_TABLES for attribute in columns[section]]
+    count = version[0]
+
+    tmp_folder = folder.with_name(folder.name + ".part")
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    tmp_folder.mkdir(parents=True)
+
+    # The codes are written to memory mapped files while they are read, so the memory use does not depend on
+    # the size of the file. Code n is the nth distinct text of the attribute, -1 is no value.
+    local_ids = np.zeros(count, dtype=np.int64)
+    am_ids = np.zeros(count, dtype=np.int64)
+    codes = {}
+    for n, key in enumerate(keys):
+        codes[key] = np.lib.format.open_memmap(tmp_folder / f"{n}.codes.npy", mode="w+", dtype=np.int32,
+                                               shape=(count,))
+        codes[key][:] = -1
+    texts = {key: {} for key in keys}
+
+    read = 0
+    for message in iter_file_messages(db_path, amf_id, chunk_size, columns):
+        # Messages added while the copy is built are left out, the copy is then built again next time
+        if read == count:
+            break
+        local_ids[read], am_ids[read] = message["am_local_id"], message["am_id"]
+        for section in SECTION_TABLES:
+            for attribute, value in message.get(section, {}).items():
+                key = (section, attribute)
+                lookup = texts[key]
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(lookup)
+                codes[key][read] = code
+        read += 1
+        if read % chunk_size == 0:
+            print(f"\r🧱 Building the columnar copy of amf_id {amf_id}: {read} of {count} messages", end="")
+
+    values = {}
+    for n, key in enumerate(keys):
+        key_codes = np.array(codes[key][:read])
+        mask = key_codes >= 0
+        text = np.array(list(texts[key]), dtype=str)
+        numbers = np.array([numeric_value(value) for value in texts[key]], dtype=np.float64)
+        values[key] = np.where(mask, numbers[np.maximum(key_codes, 0)] if len(numbers) else np.nan, np.nan)
+
+        codes[key].flush()
+        del codes[key]
+        if read < count:
+            np.save(tmp_folder / f"{n}.codes.npy", key_codes)
+        np.save(tmp_folder / f"{n}.mask.npy", mask)
+        np.save(tmp_folder / f"{n}.values.npy", values[key])
+        np.save(tmp_folder / f"{n}.text.npy", text)
+
+    np.save(tmp_folder / "local_id.npy", local_ids[:read])
+    np.save(tmp_folder / "am_id.npy", am_ids[:read])
+    np.save(tmp_folder / "time.npy", message_times(values, read))
+    with (tmp_folder / "meta.json").open("w", encoding="utf-8") as f:
+        json.dump({"amf_id": amf_id, "version": version, "message_count": read,
+                   "attributes": {f"{section}.{attribute}": n for n, (section, attribute) in enumerate(keys)},
+                   "created_at": datetime.now().isoformat()}, f, ensure_ascii=False)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    try:
+        tmp_folder.rename(folder)
+    except OSError as e:
+        # An old copy that is still open (memory mapped) by another process can not be removed on Windows
+        print(f"\n⚠️ Could not replace the columnar copy of amf_id {amf_id}: {e}")
+        return 0
+
+    print(f"\r✅ Columnar copy of amf_id {amf_id}: {read} messages, {len(keys)} attributes" + " " * 20)
+    return read
+
+
+def remove_columnar_cache(db_path: Path, amf_id: int):
+    """
+    Removes the columnar copy of a decoded file, e.g. when the file is deleted from the database.
+    """
+    folder = _cache_folder(db_path, amf_id)
+    if folder is not None:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+class ColumnarFile:
+    """
+    Reader for the columnar copy of a decoded file. Every array is loaded memory mapped the first time it is
+    used, so only the pages of the requested attributes are read from disk, without a copy.
+    Attributes are named "section.attribute", e.g. "etcs.CURRENT_SPEED_1KPH".
+    """
+
+    def __init__(self, folder: Path, meta: dict):
+        self.folder = folder
+        self.message_count = meta["message_count"]
+        self.version = tuple(meta["version"])
+        self._files = meta["attributes"]
+        self._arrays = {}
+
+    @property
+    def attributes(self) -> list[str]:
+        return list(self._files)
+
+    def _load(self, name: str) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(self.folder / f"{name}.npy", mmap_mode="r")
+        return array
+
+    def _file(self, attribute: str) -> int:
+        if attribute not in self._files:
+            raise KeyError(f"No values for {attribute} in the columnar copy")
+        return self._files[attribute]
+
+    @property
+    def local_ids(self) -> np.ndarray:
+        # am_local_id of each message, the messages are in am_local_id order
+        return self._load("local_id")
+
+    @property
+    def am_ids(self) -> np.ndarray:
+        return self._load("am_id")
+
+    @property
+    def times(self) -> np.ndarray:
+        # Seconds since 1970 of each message, NaN before the first JRU time
+        return self._load("time")
+
+    def mask(self, attribute: str) -> np.ndarray:
+        """
+        True for the messages where the attribute has a value.
+        """
+        return self._load(f"{self._file(attribute)}.mask")
+
+    def values(self, attribute: str) -> np.ndarray:
+        """
+        The number the value of each message starts with (like numeric_sql), NaN when it has no number.
+        """
+        return self._load(f"{self._file(attribute)}.values")
+
+    def codes(self, attribute: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The text values as (code of each message, distinct texts), the code is -1 when there is no value.
+        """
+        n = self._file(attribute)
+        return self._load(f"{n}.codes"), self._load(f"{n}.text")
+
+    def load(self, attributes: list[str]) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns { attribute: (values, mask) } for the requested attributes.
+        """
+        return {attribute: (self.values(attribute), self.mask(attribute)) for attribute in attributes}
+
+    def iter_messages(self, columns: dict[str, list[str]], chunk_size: int = 5000):
+        """
+        Streams the text values of the messages like iter_file_messages, without reading the database.
+
+        Args:
+            columns (dict[str, list[str]]): Attributes per section, the ones without values are left out
+            chunk_size (int): Number of messages converted at a time
+
+        Yields:
+            dict: { am_id, am_local_id, jru: {...}, etcs: {...}, dru: {...} }, empty sections are left out
+        """
+        keys = [(section, attribute) for section, attributes in columns.items() for attribute in attributes
+                if f"{section}.{attribute}" in self._files]
+        arrays = [self.codes(f"{section}.{attribute}") for section, attribute in keys]
+
+        for start in range(0, self.message_count, chunk_size):
+            end = min(start + chunk_size, self.message_count)
+            chunk = []
+            for key_codes, text in arrays:
+                key_codes = np.asarray(key_codes[start:end])
+                chunk.append((text[np.maximum(key_codes, 0)].tolist() if len(text) else [None] * (end - start),
+                              (key_codes >= 0).tolist()))
+
+            for i, (am_id, local_id) in enumerate(zip(self.am_ids[start:end].tolist(),
+                                                      self.local_ids[start:end].tolist())):
+                message = {"am_id": am_id, "am_local_id": local_id}
+                for (section, attribute), (texts, has_value) in zip(keys, chunk):
+                    if has_value[i]:
+                        message.setdefault(section, {})[attribute] = texts[i]
+                yield message
+
+
+def open_columnar_file(db_path: Path, amf_id: int) -> ColumnarFile | None:
+    """
+    Opens the columnar copy of a decoded file.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+
+    Returns:
+        ColumnarFile | None: The copy, None if there is none or the messages of the file changed since it
+            was built
+    """
+    folder = _cache_folder(db_path, amf_id)
+    meta = _read_meta(folder) if folder else None
+    if meta is None or meta["version"] != list(get_file_version(db_path, amf_id)):
+        return None
+    return ColumnarFile(folder, meta)
+
+
+def attribute_statistics(db_path: Path, amf_id: int, attributes: list[str] | None = None) -> list[dict] | None:
+    """
+    Computes figures of the numeric values of attributes from the columnar copy of a decoded file.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        attributes (list[str] | None): "section.attribute" names, all attributes of the file if None
+
+    Returns:
+        list[dict] | None: [{ section, attribute, non_null_count, numeric_count, min_value, max_value,
+            mean_value, std_value }], None if the file has no up to date columnar copy
+    """
+    columnar = open_columnar_file(db_path, amf_id)
+    if columnar is None:
+        return None
+
+    statistics = []
+    for attribute in attributes if attributes is not None else columnar.attributes:
+        values, mask = columnar.load([attribute])[attribute]
+        numbers = values[~np.isnan(values)]
+        section, _, name = attribute.partition(".")
+        figures = {"section": section, "attribute": name, "non_null_count": int(np.count_nonzero(mask)),
+                   "numeric_count": len(numbers), "min_value": None, "max_value": None, "mean_value": None,
+                   "std_value": None}
+        if len(numbers):
+            figures.update(min_value=float(numbers.min()), max_value=float(numbers.max()),
+                           mean_value=float(numbers.mean()), std_value=float(numbers.std()))
+        statistics.append(figures)
+    return statistics
@@ -1,13 +1,90 @@
+import json
+import re
 import sqlite3
+from bisect import bisect_right
 from datetime import datetime
 from pathlib import Path
 
 import pandas as pd
 
-from adru_utils import compute_md5_cached, count_msg_in_txt
+from adru_cache import get_cached_result, store_cached_result, forget_file_results
+from adru_utils import compute_md5_cached, count_msg_in_txt, find_txt_files, iter_message_blocks, \
+    parse_message_block, compute_file_sample, find_files_with_md5, MessageOffsets
 
 
-def initialize_adru_database(db_path: Path, jru_attributes: list, etcs_attributes: list, dru_attributes: list):
+def connect_db(db_path: Path, read_only: bool = False, timeout: float = 30.0,
+               check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Opens a connection to an ADRU database. Read only connections never take a write lock, so in WAL mode
+    they can query finished files while another process is inserting messages.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        read_only (bool): Open the database in read only mode
+        timeout (float): Seconds to wait for a lock before "database is locked" is raised
+        check_same_thread (bool): Only allow the connection to be used in the thread that opened it
+
+    Returns:
+        sqlite3.Connection: Open connection
+    """
+    if read_only:
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=timeout,
+                               check_same_thread=check_same_thread)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
+    """
+    Checks if a table exists, without creating it.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+
+def enable_wal_mode(db_path: Path):
+    """
+    Switches the database to WAL journal mode. The mode is stored in the database file, so this only
+    needs to run once per database. With WAL, readers do not block the writer and the writer does not
+    block readers.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+    """
+    with connect_db(db_path) as conn:
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    if mode.lower() != "wal":
+        print(f"⚠️ Could not enable WAL mode for {db_path.name}, using journal mode {mode}.")
+
+
+def checkpoint_wal(db_path: Path, mode: str = "PASSIVE") -> tuple[int, int, int]:
+    """
+    Copies the pages from the WAL file back into the database, so the WAL file does not keep growing.
+    PASSIVE never waits for readers, TRUNCATE waits for them and then empties the WAL file.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        mode (str): "PASSIVE", "FULL", "RESTART" or "TRUNCATE"
+
+    Returns:
+        tuple[int, int, int]: (busy, pages in the WAL, pages checkpointed), see PRAGMA wal_checkpoint
+    """
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+
+    conn = connect_db(db_path)
+    try:
+        return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    finally:
+        conn.close()
+
+
+def initialize_adru_database(db_path: Path, jru_attributes: list, etcs_attributes: list, dru_attributes: list,
+                             wal_mode: bool = True):
     """
     Creates the ADRU database with the specified schema and inserts unique JRU and ETCS attributes
     as columns in their respective tables if the database does not already exist.
@@ -17,16 +94,23 @@ def initialize_adru_database(db_path: Path, jru_attributes: list, etcs_attribute
         jru_attributes (list): List of unique JRU attribute names
         etcs_attributes (list): List of unique ETCS attribute names
         dru_attributes (list): List of unique DRU attribute names
+        wal_mode (bool): Use WAL journal mode, so the database can be read while messages are inserted
     """
     if db_path.exists():
         print("📦 Database already exists. No action taken.")
+        ensure_message_indexes(db_path)
+        if wal_mode:
+            enable_wal_mode(db_path)
         return
 
     print("🛠️ Creating new database and tables...")
 
-    with sqlite3.connect(db_path) as conn:
+    with connect_db(db_path) as conn:
         cursor = conn.cursor()
 
+        # Let free pages be returned to the file system in steps, see compact_database
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
         # Create adru_file table
         cursor.execute("""
             CREATE TABLE adru_file (
@@ -93,9 +177,79 @@ def initialize_adru_database(db_path: Path, jru_attributes: list, etcs_attribute
             )
         """)
 
+    ensure_message_indexes(db_path)
+    if wal_mode:
+        enable_wal_mode(db_path)
     print("✅ Database and tables created successfully.")
 
 
+# Indexes for the lookups by file and by message, name -> (table, columns)
+MESSAGE_INDEXES = {
+    "idx_adru_messages_amf_local": ("adru_messages", "am_amf_id, am_local_id"),
+    "idx_adru_message_jru_am": ("adru_message_jru", "amj_am_id"),
+    "idx_adru_message_etcs_am": ("adru_message_etcs", "ame_am_id"),
+    "idx_adru_message_dru_am": ("adru_message_dru", "amd_am_id"),
+    "idx_adru_message_file_af": ("adru_message_file", "amf_af_id"),
+}
+
+
+def ensure_message_indexes(db_path: Path):
+    """
+    Creates the indexes used to look up the messages of one file, and the section rows of one message,
+    if they do not exist. Databases created before the indexes were added get them on the next start.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+    """
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        existing = {row[0] for row in cursor.fetchall()}
+
+        for name, (table, columns) in MESSAGE_INDEXES.items():
+            if name in existing:
+                continue
+            print(f"🛠️ Creating index {name}...")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def _record_message_file_sample(cursor: sqlite3.Cursor, amf_id: int, file_path: Path):
+    """
+    Stores the sample (size, start and end MD5) of a decoded txt file, used to skip the full hash of files
+    that can not match when the txt files are searched again.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS adru_message_file_sample (
+            amfs_amf_id INTEGER PRIMARY KEY,
+            amfs_size INTEGER,
+            amfs_head_md5 TEXT,
+            amfs_tail_md5 TEXT,
+            FOREIGN KEY (amfs_amf_id) REFERENCES adru_message_file (amf_id)
+        )
+    """)
+    cursor.execute("SELECT 1 FROM adru_message_file_sample WHERE amfs_amf_id = ? AND amfs_size IS NOT NULL",
+                   (amf_id,))
+    if cursor.fetchone():
+        return
+    cursor.execute("INSERT OR REPLACE INTO adru_message_file_sample VALUES (?, ?, ?, ?)",
+                   (amf_id, *compute_file_sample(file_path)))
+
+
+def _get_message_file_samples(cursor: sqlite3.Cursor, amf_ids: list[int]) -> list[tuple] | None:
+    """
+    Returns the samples of the decoded files, or None if one of them has no complete sample (added before
+    the samples were stored, or only known compressed), then all txt files have to be hashed.
+    """
+    if not amf_ids or not table_exists(cursor, "adru_message_file_sample"):
+        return None
+    cursor.execute(f"""
+        SELECT amfs_size, amfs_head_md5, amfs_tail_md5 FROM adru_message_file_sample
+        WHERE amfs_amf_id IN ({", ".join("?" for _ in amf_ids)}) AND amfs_size IS NOT NULL
+    """, amf_ids)
+    samples = cursor.fetchall()
+    return samples if len(samples) == len(amf_ids) else None
+
+
 def add_message_file_to_db(db_path: Path, file_path: Path, adru_file_id: int) -> tuple[int, int]:
     """
     Check if a file exists in the database by MD5. If it does, return its af_id and message count.
@@ -112,7 +266,7 @@ def add_message_file_to_db(db_path: Path, file_path: Path, adru_file_id: int) ->
     print(f"🧮 Calculating MD5 hash for file: {file_path.name} (size: {file_path.stat().st_size} bytes)")
     md5_hash = compute_md5_cached(file_path)
 
-    with sqlite3.connect(db_path) as conn:
+    with connect_db(db_path) as conn:
         cursor = conn.cursor()
 
         # Check for existing file
@@ -120,6 +274,7 @@ def add_message_file_to_db(db_path: Path, file_path: Path, adru_file_id: int) ->
         row = cursor.fetchone()
         if row:
             print(f"✅ File already exists in DB (af_id={row[0]})")
+            _record_message_file_sample(cursor, row[0], file_path)
             return row[0], row[1]
 
         # If not found, count messages and insert
@@ -131,6 +286,7 @@ def add_message_file_to_db(db_path: Path, file_path: Path, adru_file_id: int) ->
             VALUES (?, ?, ?, ?, ?)
         """, (file_path.name, md5_hash, total_messages, now, adru_file_id))
         amf_id = cursor.lastrowid
+        _record_message_file_sample(cursor, amf_id, file_path)
         print(f"🆕 Added new file entry to DB with amf_id={amf_id}")
         return amf_id, total_messages
 
@@ -150,7 +306,7 @@ def add_adru_file_to_db(db_path: Path, file_path: Path) -> int:
     print(f"🧮 Calculating MD5 hash for file: {file_path.name} (size: {file_path.stat().st_size} bytes)")
     md5_hash = compute_md5_cached(file_path)
 
-    with sqlite3.connect(db_path) as conn:
+    with connect_db(db_path) as conn:
         cursor = conn.cursor()
 
         # Check for existing file
@@ -173,7 +329,7 @@ def add_adru_file_to_db(db_path: Path, file_path: Path) -> int:
         return af_id
 
 
-def exist_txt_file_for_adru(adru_file_id: int, db_path: Path, output_folder: Path) -> bool:
+def exist_txt_file_for_adru(adru_file_id: int, db_path: Path, output_folder: Path, workers: int = 4) -> bool:
     """
     Checks if a .txt file already exists in the output folder that matches a known MD5 hash
     for a given adru_file (via its associated adru_message_file entries).
@@ -181,29 +337,31 @@ def exist_txt_file_for_adru(adru_file_id: int, db_path: Path, output_folder: Pat
     Args:
         adru_file_id (int): The af_id from adru_file
         db_path (Path): Path to the SQLite database
-        output_folder (Path): Path to the output folder containing .txt files
+        output_folder (Path): Path to the output folder containing .txt files (plain or compressed)
+        workers (int): Number of threads hashing the .txt files
 
     Returns:
         bool: True if a matching .txt file exists, False otherwise
     """
     print("🔍 Searching for existing .txt files for adru_file_id:", adru_file_id)
 
-    with sqlite3.connect(db_path) as conn:
+    with connect_db(db_path, read_only=True) as conn:
         cursor = conn.cursor()
 
         # Get all known txt file MD5 hashes for this adru file
         cursor.execute("""
-            SELECT amf_md5_hash FROM adru_message_file WHERE amf_af_id = ?
+            SELECT amf_md5_hash, amf_id FROM adru_message_file WHERE amf_af_id = ?
         """, (adru_file_id,))
-        known_hashes = {row[0] for row in cursor.fetchall()}
+        rows = cursor.fetchall()
+        known_hashes = {row[0] for row in rows}
+        known_samples = _get_message_file_samples(cursor, [row[1] for row in rows])
 
-    # Check if any .txt file in the output folder matches
-    for txt_file in Path(output_folder).glob("*.txt"):
-        file_md5 = compute_md5_cached(txt_file)
-        if file_md5 in known_hashes:
-            return True
+    if not known_hashes:
+        return False
 
-    return False
+    # Check if any .txt file in the output folder matches, the files are hashed in parallel
+    matches = find_files_with_md5(find_txt_files(Path(output_folder)), known_hashes, known_samples, workers)
+    return bool(matches)
 
 
 def get_all_adru_files_that_has_txt_files_and_latest_txt(db_path: Path) -> list[dict]:
@@ -214,7 +372,7 @@ def get_all_adru_files_that_has_txt_files_and_latest_txt(db_path: Path) -> list[
     Returns:
         list[dict]: [{ file_id, file_name, latest_txt_file }]
     """
-    with sqlite3.connect(db_path) as conn:
+    with connect_db(db_path, read_only=True) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT af.af_id, af.af_name
@@ -240,15 +398,17 @@ def get_all_adru_files_that_has_txt_files_and_latest_txt(db_path: Path) -> list[
     return results
 
 
-def fetch_newest_txt_file_for_adru(adru_file_id: int, db_path: Path, output_folder: Path) -> tuple[int, Path, int, int]:
+def fetch_newest_txt_file_for_adru(adru_file_id: int, db_path: Path, output_folder: Path,
+                                   workers: int = 4) -> tuple[int, Path, int, int]:
     """
     Fetches the newest known .txt file for a given ADRU file ID based on the latest amf_created_at timestamp
-    in the adru_message_file table, and returns the matching file from the output folder.
+    in the adru_message_file table, and returns the matching file from the output folder. The .txt files are
+    hashed in parallel with workers threads.
 
     Raises:
         ValueError: If no known hashes exist or no matching file is found
     """
-    with sqlite3.connect(db_path) as conn:
+    with connect_db(db_path, read_only=True) as conn:
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -259,6 +419,7 @@ def fetch_newest_txt_file_for_adru(adru_file_id: int, db_path: Path, output_fold
             LIMIT 1
         """, (adru_file_id,))
         row = cursor.fetchone()
+        known_samples = _get_message_file_samples(cursor, [row[1]]) if row else None
 
     if not row:
         raise ValueError(f"No .txt file entries found in DB for adru_file_id {adru_file_id}")
@@ -267,10 +428,9 @@ def fetch_newest_txt_file_for_adru(adru_file_id: int, db_path: Path, output_fold
 
     newest_md5 = row[0]
 
-    for txt_file in Path(output_folder).glob("*.txt"):
-        file_md5 = compute_md5_cached(txt_file)
-        if file_md5 == newest_md5:
-            return row[0], txt_file, row[2], row[1]  # Return (md5, path, message_count, amf_id)
+    matches = find_files_with_md5(find_txt_files(Path(output_folder)), {newest_md5}, known_samples, workers)
+    for txt_file in matches:
+        return row[0], txt_file, row[2], row[1]  # Return (md5, path, message_count, amf_id)
 
     raise ValueError(f"No matching .txt file found in {output_folder} for newest MD5 {newest_md5}")
 
@@ -284,7 +444,7 @@ def is_txt_content_in_db_with_entries(db_path: Path, amf_id: int) -> bool:
         txt_path (Path): Path to the decoded .txt file.
         amf_id (int): ID from adru_message_file table for this txt file.
     """
-    with sqlite3.connect(db_path) as conn:
+    with connect_db(db_path, read_only=True) as conn:
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -301,127 +461,387 @@ def is_txt_content_in_db_with_entries(db_path: Path, amf_id: int) -> bool:
     return True
 
 
-def insert_messages_from_txt(txt_path: Path, db_path: Path, amf_id: int, total_messages: int):
+def _complete_file_sql(alias: str = "mf") -> str:
+    """
+    SQL condition that is true for the adru_message_file rows (with this alias) that have all their messages
+    in the database, the same check as is_txt_content_complete_in_db. A file is registered before its
+    messages are inserted, so it can have none or only some of them.
     """
-    Reads a decoded .txt file and inserts each Msg block into the database.
+    return (f"(SELECT COUNT(*) FROM adru_messages WHERE am_amf_id = {alias}.amf_id) "
+            f">= MAX({alias}.amf_message_count, 1)")
+
+
+def is_txt_content_complete_in_db(db_path: Path, amf_id: int) -> bool:
+    """
+    Checks if all messages of a .txt file are in the database. Messages are committed in batches, so a file
+    whose insert was stopped can have only some of its messages in the database.
 
     Args:
-        txt_path (Path): Path to the decoded .txt file.
         db_path (Path): Path to the SQLite database.
         amf_id (int): ID from adru_message_file table for this txt file.
-        total_messages (int): Total number of messages in the file, used for progress tracking.
     """
-    conn = sqlite3.connect(db_path)
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT amf_message_count FROM adru_message_file WHERE amf_id = ?", (amf_id,))
+        row = cursor.fetchone()
+        if not row:
+            return False
+
+        cursor.execute("SELECT COUNT(*) FROM adru_messages WHERE am_amf_id = ?", (amf_id,))
+        stored_count = cursor.fetchone()[0]
+
+    return stored_count > 0 and stored_count >= row[0]
+
+
+def delete_file_messages(db_path: Path, amf_id: int, batch_size: int = 20000) -> int:
+    """
+    Deletes the messages of a decoded file from adru_messages and the JRU, ETCS and DRU tables. The rows are
+    deleted in am_id ranges with a commit after each range, so readers and other writers are never blocked
+    for long.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        batch_size (int): Number of am_id values deleted per transaction
+
+    Returns:
+        int: Number of deleted messages
+    """
+    conn = connect_db(db_path)
     cursor = conn.cursor()
 
-    current_msg_local_id = None
-    current_jru_data = {}
-    current_etcs_data = {}
-    current_dru_data = {}
-    inside_dru = inside_jru = inside_etcs = False
-    inserted_count = 0
+    cursor.execute("SELECT MIN(am_id), MAX(am_id) FROM adru_messages WHERE am_amf_id = ?", (amf_id,))
+    first_id, last_id = cursor.fetchone()
+    delta_storage = table_exists(cursor, "adru_message_delta")
+    deleted = 0
+
+    if first_id is not None:
+        for low in range(first_id, last_id + 1, batch_size):
+            high = low + batch_size - 1
+            for table, prefix in SECTION_TABLES.values():
+                cursor.execute(f"""
+                    DELETE FROM {table}
+                    WHERE {prefix}_am_id IN (
+                        SELECT am_id FROM adru_messages WHERE am_id BETWEEN ? AND ? AND am_amf_id = ?
+                    )
+                """, (low, high, amf_id))
+            if delta_storage:
+                cursor.execute("""
+                    DELETE FROM adru_message_delta
+                    WHERE amdl_am_id IN (
+                        SELECT am_id FROM adru_messages WHERE am_id BETWEEN ? AND ? AND am_amf_id = ?
+                    )
+                """, (low, high, amf_id))
+            cursor.execute("DELETE FROM adru_messages WHERE am_id BETWEEN ? AND ? AND am_amf_id = ?",
+                           (low, high, amf_id))
+            deleted += cursor.rowcount
+            conn.commit()
+            print(f"\r🗑️ Deleted {deleted} messages of amf_id {amf_id}", end="")
+        print()
+
+    # The fingerprints used by adru_diff point to the deleted messages
+    if table_exists(cursor, "adru_message_fingerprint"):
+        cursor.execute("DELETE FROM adru_message_fingerprint WHERE amfp_amf_id = ?", (amf_id,))
+        conn.commit()
+
+    conn.close()
+    return deleted
+
+
+# (section, attribute names) -> INSERT statement, the messages of a file mostly have the same attributes
+_insert_statements = {}
+_MAX_INSERT_STATEMENTS = 4096
 
-    def insert_current_msg():
-        nonlocal inserted_count
-        if current_msg_local_id is None:
-            return
 
-        inserted_count += 1
-        print(f"\r📝 Inserting message {inserted_count} of {total_messages}", end="")
+def _insert_sql(section: str, attributes: tuple[str, ...]) -> str:
+    sql = _insert_statements.get((section, attributes))
+    if sql is None:
+        table, prefix = SECTION_TABLES[section]
+        cols = ", ".join(f'"{attribute}"' for attribute in attributes)
+        placeholders = ", ".join("?" for _ in attributes)
+        sql = f"INSERT INTO {table} ({prefix}_am_id, {cols}) VALUES (?, {placeholders})"
+        if len(_insert_statements) >= _MAX_INSERT_STATEMENTS:
+            _insert_statements.clear()
+        _insert_statements[(section, attributes)] = sql
+    return sql
 
-        # Insert message reference
-        cursor.execute(
-            "INSERT INTO adru_messages (am_local_id, am_amf_id) VALUES (?, ?)",
-            (current_msg_local_id, amf_id)
+
+def insert_message(cursor: sqlite3.Cursor, amf_id: int, local_id: int, jru_data: dict, etcs_data: dict,
+                   dru_data: dict) -> int:
+    """
+    Inserts one parsed Msg block and its JRU, ETCS and DRU attributes into the database.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor in an open write transaction
+        amf_id (int): ID from adru_message_file table for the txt file the message belongs to
+        local_id (int): The id from the Msg annotation in the txt file
+        jru_data (dict): JRU attribute names and values
+        etcs_data (dict): ETCS attribute names and values
+        dru_data (dict): DRU attribute names and values
+
+    Returns:
+        int: am_id of the new message
+    """
+    # Insert message reference
+    cursor.execute(
+        "INSERT INTO adru_messages (am_local_id, am_amf_id) VALUES (?, ?)",
+        (local_id, amf_id)
+    )
+    am_id = cursor.lastrowid
+
+    # JRU, ETCS and DRU
+    for section, data in (("jru", jru_data), ("etcs", etcs_data), ("dru", dru_data)):
+        if data:
+            cursor.execute(_insert_sql(section, tuple(data)), (am_id, *data.values()))
+
+    return am_id
+
+
+# Number of messages between two full keyframes in delta storage mode
+DELTA_KEYFRAME_INTERVAL = 1000
+
+
+def set_delta_storage(cursor: sqlite3.Cursor, amf_id: int, keyframe_interval: int | None):
+    """
+    Records if the messages of a file are stored in delta mode, before they are inserted.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor in an open write transaction
+        amf_id (int): ID from adru_message_file table
+        keyframe_interval (int | None): Messages between two keyframes, or None for full rows
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS adru_delta_file (
+            adf_amf_id INTEGER PRIMARY KEY,
+            adf_keyframe_interval INTEGER,
+            FOREIGN KEY (adf_amf_id) REFERENCES adru_message_file (amf_id)
         )
-        am_id = cursor.lastrowid
-
-        # JRU
-        if current_jru_data:
-            cols = ", ".join(f'"{k}"' for k in current_jru_data)
-            placeholders = ", ".join("?" for _ in current_jru_data)
-            cursor.execute(
-                f"INSERT INTO adru_message_jru (amj_am_id, {cols}) VALUES (?, {placeholders})",
-                (am_id, *current_jru_data.values())
-            )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS adru_message_delta (
+            amdl_am_id INTEGER PRIMARY KEY,
+            amdl_keyframe INTEGER,
+            amdl_removed TEXT,
+            FOREIGN KEY (amdl_am_id) REFERENCES adru_messages (am_id)
+        )
+    """)
+    cursor.execute("DELETE FROM adru_delta_file WHERE adf_amf_id = ?", (amf_id,))
+    if keyframe_interval:
+        cursor.execute("INSERT INTO adru_delta_file VALUES (?, ?)", (amf_id, keyframe_interval))
 
-        # ETCS
-        if current_etcs_data:
-            cols = ", ".join(f'"{k}"' for k in current_etcs_data)
-            placeholders = ", ".join("?" for _ in current_etcs_data)
-            cursor.execute(
-                f"INSERT INTO adru_message_etcs (ame_am_id, {cols}) VALUES (?, {placeholders})",
-                (am_id, *current_etcs_data.values())
-            )
 
-        # DRU
-        if current_dru_data:
-            cols = ", ".join(f'"{k}"' for k in current_dru_data)
-            placeholders = ", ".join("?" for _ in current_dru_data)
-            cursor.execute(
-                f"INSERT INTO adru_message_dru (amd_am_id, {cols}) VALUES (?, {placeholders})",
-                (am_id, *current_dru_data.values())
-            )
+class MessageDeltaEncoder:
+    """
+    Inserts the messages of one file in delta storage mode. Every keyframe_interval messages all attributes
+    are stored (a keyframe), in between only the attributes that changed since the previous message. The
+    attributes that a message no longer has are listed in adru_message_delta, so the reader can drop them.
+    """
 
-    with txt_path.open("r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            line = line.strip()
-
-            if line.startswith("Msg "):
-                insert_current_msg()
-                current_msg_local_id = int(line.split(" ")[1].rstrip(":"))
-                current_jru_data.clear()
-                current_etcs_data.clear()
-                current_dru_data.clear()
-                inside_dru = inside_jru = inside_etcs = False
-                continue
+    def __init__(self, keyframe_interval: int = DELTA_KEYFRAME_INTERVAL):
+        self.keyframe_interval = max(keyframe_interval, 1)
+        self._count = 0
+        self._previous = ({}, {}, {})
+
+    def insert(self, cursor: sqlite3.Cursor, amf_id: int, local_id: int, jru_data: dict, etcs_data: dict,
+               dru_data: dict) -> int:
+        """
+        Same as insert_message, for the next message of the file.
+        """
+        current = (jru_data, etcs_data, dru_data)
+        keyframe = self._count % self.keyframe_interval == 0
+        self._count += 1
+
+        stored, removed = current, {}
+        if not keyframe:
+            stored = tuple({attribute: value for attribute, value in data.items() if previous.get(attribute) != value}
+                           for data, previous in zip(current, self._previous))
+            for section, data, previous in zip(SECTION_TABLES, current, self._previous):
+                gone = [attribute for attribute in previous if attribute not in data]
+                if gone:
+                    removed[section] = gone
+        self._previous = current
+
+        am_id = insert_message(cursor, amf_id, local_id, *stored)
+        if keyframe or removed:
+            cursor.execute("INSERT INTO adru_message_delta VALUES (?, ?, ?)",
+                           (am_id, int(keyframe), json.dumps(removed) if removed else None))
+        return am_id
+
+
+def record_file_columns(cursor: sqlite3.Cursor, amf_id: int, columns: dict[str, set[str]]):
+    """
+    Stores which attributes have a value in a decoded file, so merge and export only read those columns
+    of the section tables. Attributes that are already recorded for the file are kept.
 
-            # Section openers
-            if line == "DRU ETCS (":
-                inside_dru, inside_jru, inside_etcs = True, False, False
-                continue
-            if line == "JRU (":
-                inside_jru, inside_dru, inside_etcs = True, False, False
-                continue
-            if line == "ETCS ON-BOARD PROPRIETARY JURIDICAL DATA (":
-                inside_etcs, inside_jru, inside_dru = True, False, False
-                continue
+    Args:
+        cursor (sqlite3.Cursor): Cursor in an open write transaction
+        amf_id (int): ID from adru_message_file table
+        columns (dict[str, set[str]]): section ("jru", "etcs", "dru") -> attributes seen in the messages
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS adru_file_columns (
+            afc_amf_id INTEGER,
+            afc_section TEXT,
+            afc_attribute TEXT,
+            PRIMARY KEY (afc_amf_id, afc_section, afc_attribute),
+            FOREIGN KEY (afc_amf_id) REFERENCES adru_message_file (amf_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.executemany("INSERT OR IGNORE INTO adru_file_columns VALUES (?, ?, ?)",
+                       [(amf_id, section, attribute) for section, attributes in columns.items()
+                        for attribute in attributes])
+
+
+def get_populated_columns(db_path: Path, amf_id: int) -> dict[str, list[str]]:
+    """
+    Returns the attributes that have a value in a decoded file, per section. They are recorded when the
+    messages are inserted, for files added before that they are taken from the attribute summary (which is
+    computed if needed) and recorded.
 
-            # Section closers
-            if line == ")" and (inside_dru or inside_etcs or inside_jru):
-                inside_dru = inside_etcs = inside_jru = False
-                continue
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
 
-            # Determine split character position
-            first_colon = line.find(":")
-            first_equal = line.find("=")
+    Returns:
+        dict[str, list[str]]: section -> sorted attribute names, for use as the columns of iter_file_messages
+    """
+    rows = []
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        if table_exists(cursor, "adru_file_columns"):
+            cursor.execute("SELECT afc_section, afc_attribute FROM adru_file_columns WHERE afc_amf_id = ?",
+                           (amf_id,))
+            rows = cursor.fetchall()
+    conn.close()
 
-            if first_colon == -1 and first_equal == -1:
-                continue  # No known delimiter
+    if not rows:
+        refresh_file_summary(db_path, amf_id)
+        rows = [(a["section"], a["attribute"]) for a in get_attribute_summary(db_path, amf_id)]
+        if rows:
+            with connect_db(db_path) as conn:
+                record_file_columns(conn.cursor(), amf_id, {section: {a for s, a in rows if s == section}
+                                                            for section in SECTION_TABLES})
+            conn.close()
 
-            if first_equal != -1 and (first_colon == -1 or first_equal < first_colon):
-                parts = line.split("=", 1)
-            else:
-                parts = line.split(":", 1)
+    columns = {section: [] for section in SECTION_TABLES}
+    for section, attribute in sorted(rows):
+        columns[section].append(attribute)
+    return columns
 
-            if len(parts) == 2:
-                attr = parts[0].strip()
-                value = parts[1].strip()
-                if inside_jru:
-                    current_jru_data[attr] = value
-                elif inside_etcs:
-                    current_etcs_data[attr] = value
-                elif inside_dru:
-                    current_dru_data[attr] = value
 
-    # Insert final message
-    insert_current_msg()
+def get_file_version(db_path: Path, amf_id: int) -> tuple[int, int | None, str | None, str | None]:
+    """
+    Returns the number of messages, the highest am_id, the MD5 hash and the creation time of a decoded file.
+    Inserting or deleting messages always changes it, because new messages get a higher am_id, so cached
+    results are checked against it. SQLite can give the ids of a deleted file to a file added later, the
+    hash and creation time keep the versions of the two files apart.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+
+    Returns:
+        tuple[int, int | None, str | None, str | None]: (message count, highest am_id, MD5 hash, creation time)
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*), MAX(am_id),
+                   (SELECT amf_md5_hash FROM adru_message_file WHERE amf_id = ?),
+                   (SELECT amf_created_at FROM adru_message_file WHERE amf_id = ?)
+            FROM adru_messages WHERE am_amf_id = ?
+        """, (amf_id, amf_id, amf_id))
+        version = cursor.fetchone()
+    conn.close()
+    return version
+
 
+def insert_messages_from_txt(txt_path: Path, db_path: Path, amf_id: int, total_messages: int,
+                             commit_every: int = 5000, delta_keyframe_interval: int | None = None,
+                             offsets: MessageOffsets | None = None):
+    """
+    Reads a decoded .txt file (plain or compressed) and inserts each Msg block into the database.
+
+    Args:
+        txt_path (Path): Path to the decoded .txt file.
+        db_path (Path): Path to the SQLite database.
+        amf_id (int): ID from adru_message_file table for this txt file.
+        total_messages (int): Total number of messages in the file, used for progress tracking.
+        commit_every (int): Commit after this many messages, so the write lock is not held for the whole file.
+        delta_keyframe_interval (int | None): Store the messages in delta mode with a keyframe every this many
+            messages, see MessageDeltaEncoder. Full rows are stored if None.
+        offsets (MessageOffsets | None): Filled with the byte offset of every Msg block while the file is read,
+            see store_message_offsets in adru_offsets
+    """
+    conn = connect_db(db_path)
+    cursor = conn.cursor()
+    set_delta_storage(cursor, amf_id, delta_keyframe_interval)
+    insert = MessageDeltaEncoder(delta_keyframe_interval).insert if delta_keyframe_interval else insert_message
+
+    inserted_count = 0
+    present = {section: set() for section in SECTION_TABLES}
+    for block in iter_message_blocks(txt_path, commit_every, offsets):
+        for local_id, jru_data, etcs_data, dru_data in parse_message_block(block):
+            inserted_count += 1
+            print(f"\r📝 Inserting message {inserted_count} of {total_messages}", end="")
+            insert(cursor, amf_id, local_id, jru_data, etcs_data, dru_data)
+            present["jru"].update(jru_data)
+            present["etcs"].update(etcs_data)
+            present["dru"].update(dru_data)
+            if inserted_count % commit_every == 0:
+                record_file_columns(cursor, amf_id, present)
+                conn.commit()
+
+    record_file_columns(cursor, amf_id, present)
     conn.commit()
     conn.close()
     print("\n✅ All messages inserted successfully.")
 
 
+# Number of CSV rows enriched with one query per section
+_ENRICH_CHUNK = 500
+
+
+def _csv_local_id(value) -> int | None:
+    # The N° column of a CSV file as am_local_id, None for an empty or non numeric cell
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fetch_enrich_values(db_path: Path, amf_id: int, local_ids: list[int],
+                         columns: dict[str, list[str]]) -> dict[int, dict]:
+    """
+    Reads the attributes of the messages of a file for a CSV merge.
+
+    Returns:
+        dict[int, dict]: local_id -> { attribute: value } of the JRU, ETCS and DRU sections together
+    """
+    values = {}
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+
+        # local_id (N°) -> am_id, the first message if a local_id is used twice
+        cursor.execute("SELECT am_local_id, am_id FROM adru_messages WHERE am_amf_id = ? ORDER BY am_id DESC",
+                       (amf_id,))
+        am_ids = dict(cursor.fetchall())
+
+        found = [local_id for local_id in local_ids if local_id in am_ids]
+        for start in range(0, len(found), _ENRICH_CHUNK):
+            chunk = found[start:start + _ENRICH_CHUNK]
+            print(f"\r🔍 Enriching row {start + len(chunk)} of {len(found)}...", end="")
+            messages = fetch_messages_by_id(cursor, [am_ids[local_id] for local_id in chunk], columns)
+            for local_id in chunk:
+                message = messages.get(am_ids[local_id], {})
+                values[local_id] = {attribute: value for section in ("jru", "etcs", "dru")
+                                    for attribute, value in message.get(section, {}).items()}
+    conn.close()
+
+    print()
+    return values
+
+
 def enrich_dataframe_with_db_values(df: pd.DataFrame, db_path: Path, adru_file_id: int) -> pd.DataFrame:
     """
     Enrich the given DataFrame with additional values from the SQLite database for matching messages,
@@ -435,7 +855,7 @@ def enrich_dataframe_with_db_values(df: pd.DataFrame, db_path: Path, adru_file_i
     Returns:
         pd.DataFrame: A new DataFrame with missing columns filled in from the database
     """
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path, read_only=True)
     cursor = conn.cursor()
 
     # Get amf_id for this ADRU file
@@ -447,59 +867,25 @@ def enrich_dataframe_with_db_values(df: pd.DataFrame, db_path: Path, adru_file_i
 
     amf_id = row[0]
     print(f"🔗 Using amf_id {amf_id} for adru_file_id {adru_file_id}")
+    conn.close()
 
-    all_new_columns = set()
-    enriched_rows = []
-
-    for i, (_, row) in enumerate(df.iterrows(), start=1):
-        print(f"\r🔍 Enriching row {i} of {len(df)} (local_id (N°) {row['N°']})...", end="")
-        local_id = row["N°"]
-
-        # Start with existing CSV data
-        enriched_data = row.to_dict()
+    # Only the attributes that have a value in this file are read, instead of every column of the sections
+    columns = get_populated_columns(db_path, amf_id)
+    all_new_columns = {attribute for attributes in columns.values() for attribute in attributes}
 
-        # Get message ID
-        cursor.execute("""
-            SELECT am_id FROM adru_messages WHERE am_local_id = ? AND am_amf_id = ?
-        """, (local_id, amf_id))
-        result = cursor.fetchone()
-
-        if not result:
-            enriched_rows.append(enriched_data)
-            continue
-
-        am_id = result[0]
-
-        # JRU
-        cursor.execute("SELECT * FROM adru_message_jru WHERE amj_am_id = ?", (am_id,))
-        jru = cursor.fetchone()
-        if jru:
-            col_names = [desc[0] for desc in cursor.description]
-            for col, val in zip(col_names, jru):
-                if col not in ("amj_id", "amj_am_id"):
-                    enriched_data[col] = val
-                    all_new_columns.add(col)
-
-        # ETCS
-        cursor.execute("SELECT * FROM adru_message_etcs WHERE ame_am_id = ?", (am_id,))
-        etcs = cursor.fetchone()
-        if etcs:
-            col_names = [desc[0] for desc in cursor.description]
-            for col, val in zip(col_names, etcs):
-                if col not in ("ame_id", "ame_am_id"):
-                    enriched_data[col] = val
-                    all_new_columns.add(col)
-
-        # DRU
-        cursor.execute("SELECT * FROM adru_message_dru WHERE amd_am_id = ?", (am_id,))
-        dru = cursor.fetchone()
-        if dru:
-            col_names = [desc[0] for desc in cursor.description]
-            for col, val in zip(col_names, dru):
-                if col not in ("amd_id", "amd_am_id"):
-                    enriched_data[col] = val
-                    all_new_columns.add(col)
+    # The values of the same messages are reused from the cache until the messages of the file change
+    local_ids = sorted({local_id for local_id in map(_csv_local_id, df["N°"]) if local_id is not None})
+    version = get_file_version(db_path, amf_id)
+    values = get_cached_result(db_path, amf_id, "enrich", version, columns, local_ids)
+    if values is None:
+        values = _fetch_enrich_values(db_path, amf_id, local_ids, columns)
+        store_cached_result(db_path, amf_id, "enrich", version, values, columns, local_ids)
+    else:
+        print(f"⚡ Using the cached database values of {len(values)} messages.")
 
+    enriched_rows = []
+    for enriched_data in df.to_dict("records"):
+        enriched_data.update(values.get(_csv_local_id(enriched_data["N°"]), {}))
         enriched_rows.append(enriched_data)
 
     # Create DataFrame
@@ -507,8 +893,1123 @@ def enrich_dataframe_with_db_values(df: pd.DataFrame, db_path: Path, adru_file_i
 
     # Ensure all new columns are placed at the end
     ordered_columns = list(df.columns) + sorted(c for c in all_new_columns if c not in df.columns)
-    enriched_df = enriched_df[ordered_columns]
+    enriched_df = enriched_df.reindex(columns=ordered_columns)
 
-    print("\n✅ All rows enriched.")
-    conn.close()
+    print("✅ All rows enriched.")
     return enriched_df
+
+
+# Free text attributes that are added to the FTS5 search index, per section table
+FTS_TEXT_ATTRIBUTES = {
+    "jru": ["L_CAPTION[0]", "L_CAPTION[1]", "L_CAPTION[2]", "L_CAPTION[3]", "L_CAPTION[4]", "L_CAPTION[5]",
+            "L_CAPTION[6]", "L_CAPTION[7]", "L_CAPTION[8]", "X_CAPTION(L_CAPTION)[0]", "X_CAPTION(L_CAPTION)[1]",
+            "X_CAPTION(L_CAPTION)[2]", "X_CAPTION(L_CAPTION)[3]", "X_CAPTION(L_CAPTION)[4]",
+            "X_CAPTION(L_CAPTION)[5]", "X_CAPTION(L_CAPTION)[6]", "X_CAPTION(L_CAPTION)[7]",
+            "X_CAPTION(L_CAPTION)[8]", "X_TEXT", "X_TEXT(L_TEXT)", "DRIVER_ID", "SYSTEM_STATUS_MESSAGE",
+            "STM_SYSTEM_STATUS_MESSAGE"],
+    "etcs": ["TRU_L_TEXT", "TRU_X_TEXT"],
+    "dru": ["TRU_L_TEXT", "TRU_X_TEXT", "Log message", "Log advice", "Log display", "Operator message",
+            "Operator display", "Status message", "Status level message", "Status advice", "Status display",
+            "Description_Code"],
+}
+
+# Section name -> (table, id column prefix)
+SECTION_TABLES = {
+    "jru": ("adru_message_jru", "amj"),
+    "etcs": ("adru_message_etcs", "ame"),
+    "dru": ("adru_message_dru", "amd"),
+}
+
+
+def get_table_columns(cursor: sqlite3.Cursor, table: str) -> list[str]:
+    """
+    Returns the column names of a table in the order they are defined.
+    """
+    cursor.execute(f'PRAGMA table_info("{table}")')
+    return [row[1] for row in cursor.fetchall()]
+
+
+def ensure_fts_index(db_path: Path) -> bool:
+    """
+    Creates the FTS5 search table and its bookkeeping table if they do not exist.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+
+    Returns:
+        bool: False if the SQLite build does not support FTS5
+    """
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS adru_message_fts USING fts5(
+                    fts_text,
+                    fts_am_id UNINDEXED,
+                    fts_amf_id UNINDEXED,
+                    fts_section UNINDEXED,
+                    fts_attribute UNINDEXED,
+                    tokenize = 'unicode61'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ FTS5 search index not available in this SQLite build: {e}")
+            return False
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_fts_indexed (
+                afi_amf_id INTEGER PRIMARY KEY,
+                afi_row_count INTEGER,
+                afi_created_at TIMESTAMP,
+                FOREIGN KEY (afi_amf_id) REFERENCES adru_message_file (amf_id)
+            )
+        """)
+    return True
+
+
+# Number of text rows of a file in delta mode added to the search index with one executemany
+_FTS_INSERT_BATCH = 10000
+_FTS_INSERT_SQL = ("INSERT INTO adru_message_fts (fts_text, fts_am_id, fts_amf_id, fts_section, fts_attribute) "
+                   "VALUES (?, ?, ?, ?, ?)")
+
+
+def build_fts_index(db_path: Path, amf_id: int | None = None, rebuild: bool = False) -> int:
+    """
+    Adds the free text attributes of the messages to the FTS5 search index. Files that already are
+    indexed are skipped, so this can run after each ingest or incrementally for all files later. Files
+    that do not have all their messages in the database yet are not indexed.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int | None): Only index this adru_message_file, or all files not indexed yet if None
+        rebuild (bool): Drop the existing index rows for the file(s) and index them again
+
+    Returns:
+        int: Number of text rows added to the index
+    """
+    if not ensure_fts_index(db_path):
+        return 0
+
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+
+        # Files that are still being inserted are left out, they are indexed when all messages are in
+        if amf_id is None:
+            cursor.execute(f"SELECT amf_id FROM adru_message_file mf WHERE {_complete_file_sql()} ORDER BY amf_id")
+        else:
+            cursor.execute(f"SELECT amf_id FROM adru_message_file mf WHERE amf_id = ? AND {_complete_file_sql()}",
+                           (amf_id,))
+        amf_ids = [row[0] for row in cursor.fetchall()]
+
+        if rebuild:
+            for file_id in amf_ids:
+                cursor.execute("DELETE FROM adru_message_fts WHERE fts_amf_id = ?", (file_id,))
+                cursor.execute("DELETE FROM adru_fts_indexed WHERE afi_amf_id = ?", (file_id,))
+
+        cursor.execute("SELECT afi_amf_id FROM adru_fts_indexed")
+        indexed = {row[0] for row in cursor.fetchall()}
+
+        # Only use the text attributes that exist as columns in this database
+        section_attributes = {}
+        for section, (table, _) in SECTION_TABLES.items():
+            columns = set(get_table_columns(cursor, table))
+            section_attributes[section] = [a for a in FTS_TEXT_ATTRIBUTES[section] if a in columns]
+
+        total_rows = 0
+        new_files = [file_id for file_id in amf_ids if file_id not in indexed]
+        for file_id in new_files:
+            print(f"\r🔎 Building search index for amf_id {file_id}...", end="")
+            file_rows = 0
+            if is_delta_file(cursor, file_id):
+                # The stored rows only have the changes, the text of each message is taken from the rebuilt
+                # messages, so a caption that is repeated is found in every message that has it
+                rows = []
+                for message in iter_cursor_messages(conn.cursor(), file_id, 2000, section_attributes):
+                    rows.extend((value, message["am_id"], file_id, section, attr) for section in SECTION_TABLES
+                                for attr, value in message.get(section, {}).items() if value != "")
+                    if len(rows) >= _FTS_INSERT_BATCH:
+                        cursor.executemany(_FTS_INSERT_SQL, rows)
+                        file_rows += len(rows)
+                        rows = []
+                cursor.executemany(_FTS_INSERT_SQL, rows)
+                file_rows += len(rows)
+            else:
+                for section, (table, prefix) in SECTION_TABLES.items():
+                    for attr in section_attributes[section]:
+                        cursor.execute(f"""
+                            INSERT INTO adru_message_fts (fts_text, fts_am_id, fts_amf_id, fts_section, fts_attribute)
+                            SELECT t."{attr}", m.am_id, m.am_amf_id, ?, ?
+                            FROM adru_messages m
+                            JOIN {table} t ON t.{prefix}_am_id = m.am_id
+                            WHERE m.am_amf_id = ? AND t."{attr}" IS NOT NULL AND t."{attr}" != ''
+                        """, (section, attr, file_id))
+                        file_rows += cursor.rowcount
+
+            cursor.execute("""
+                INSERT INTO adru_fts_indexed (afi_amf_id, afi_row_count, afi_created_at) VALUES (?, ?, ?)
+            """, (file_id, file_rows, datetime.now().isoformat()))
+            total_rows += file_rows
+
+    if new_files:
+        print()
+    print(f"✅ Search index updated with {total_rows} text rows.")
+    return total_rows
+
+
+def search_message_text(db_path: Path, text: str, amf_id: int | None = None, limit: int = 100,
+                        raw_query: bool = False) -> list[dict]:
+    """
+    Searches the free text attributes of all indexed messages using the FTS5 index.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        text (str): Text to search for. It is matched as a phrase unless raw_query is set
+        amf_id (int | None): Limit the search to one adru_message_file
+        limit (int): Max number of hits to return
+        raw_query (bool): Pass the text as an FTS5 query (AND/OR/NEAR, prefix*) instead of a phrase
+
+    Returns:
+        list[dict]: [{ am_id, am_local_id, amf_id, amf_name, af_name, section, attribute, value }]
+    """
+    query = text if raw_query else '"' + text.replace('"', '""') + '"'
+    sql = """
+        SELECT f.fts_am_id, m.am_local_id, f.fts_amf_id, mf.amf_name, af.af_name,
+               f.fts_section, f.fts_attribute, f.fts_text
+        FROM adru_message_fts f
+        JOIN adru_messages m ON m.am_id = f.fts_am_id
+        JOIN adru_message_file mf ON mf.amf_id = f.fts_amf_id
+        LEFT JOIN adru_file af ON af.af_id = mf.amf_af_id
+        WHERE adru_message_fts MATCH ?
+    """
+    params = [query]
+    if amf_id is not None:
+        sql += " AND f.fts_amf_id = ?"
+        params.append(amf_id)
+    sql += " ORDER BY f.fts_amf_id, m.am_local_id LIMIT ?"
+    params.append(limit)
+
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        if not table_exists(cursor, "adru_message_fts"):
+            return []
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    keys = ("am_id", "am_local_id", "amf_id", "amf_name", "af_name", "section", "attribute", "value")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def numeric_sql(column_sql: str) -> str:
+    """
+    SQL expression that converts a TEXT attribute value to a number, or NULL if it does not start with one.
+    """
+    return (f"CASE WHEN trim({column_sql}) GLOB '[0-9]*' OR trim({column_sql}) GLOB '-[0-9]*' "
+            f"THEN CAST(trim({column_sql}) AS REAL) END")
+
+
+# The number at the start of a value, as CAST AS REAL reads it: "12.5 km/h" -> 12.5
+_NUMERIC_PREFIX = re.compile(r"\s*(-?\d+(\.\d*)?([eE][-+]?\d+)?)")
+
+
+def numeric_value(value: str | None) -> float | None:
+    """
+    The same conversion as numeric_sql in Python: the number a TEXT attribute value starts with, or None.
+    """
+    match = _NUMERIC_PREFIX.match(value) if value is not None else None
+    return float(match.group(1)) if match else None
+
+
+# Attributes used for the per file summary
+SUMMARY_SPEED_ATTRIBUTES = [("etcs", "CURRENT_SPEED_1KPH"), ("jru", "V_TRAIN")]
+SUMMARY_ERROR_ATTRIBUTES = ["BALISE_RECEPTION_ERROR", "F1_ERROR_CHAR", "F2_ERROR_CHAR", "F3_ERROR_CHAR"]
+SUMMARY_TIME_ATTRIBUTES = ["DATE.YEAR", "DATE.MONTH", "DATE.DAY", "TIME.HOUR", "TIME.MINUTES", "TIME.SECONDS",
+                           "TIME.MILLISECONDS"]
+
+# Max number of attributes aggregated in one query, SQLite limits the number of result columns
+_ATTRIBUTES_PER_QUERY = 150
+
+
+def ensure_file_summary_tables(db_path: Path):
+    """
+    Creates the per file summary tables if they do not exist.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+    """
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_file_summary (
+                afs_amf_id INTEGER PRIMARY KEY,
+                afs_message_count INTEGER,
+                afs_first_local_id INTEGER,
+                afs_last_local_id INTEGER,
+                afs_start_time TEXT,
+                afs_end_time TEXT,
+                afs_max_speed REAL,
+                afs_mode_changes INTEGER,
+                afs_level_changes INTEGER,
+                afs_error_count INTEGER,
+                afs_updated_at TIMESTAMP,
+                FOREIGN KEY (afs_amf_id) REFERENCES adru_message_file (amf_id)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_attribute_summary (
+                aas_amf_id INTEGER,
+                aas_section TEXT,
+                aas_attribute TEXT,
+                aas_non_null_count INTEGER,
+                aas_min_value REAL,
+                aas_max_value REAL,
+                PRIMARY KEY (aas_amf_id, aas_section, aas_attribute),
+                FOREIGN KEY (aas_amf_id) REFERENCES adru_message_file (amf_id)
+            ) WITHOUT ROWID
+        """)
+
+
+def _attribute_aggregates_sql(column_sql: str) -> str:
+    return f"COUNT({column_sql}), MIN({numeric_sql(column_sql)}), MAX({numeric_sql(column_sql)})"
+
+
+def _count_value_changes(cursor: sqlite3.Cursor, amf_id: int, attr: str) -> int:
+    """
+    Counts how many times a JRU attribute changes value between consecutive messages that have it.
+    """
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT t."{attr}" AS value, LAG(t."{attr}") OVER (ORDER BY m.am_local_id, m.am_id) AS previous
+            FROM adru_messages m
+            JOIN adru_message_jru t ON t.amj_am_id = m.am_id
+            WHERE m.am_amf_id = ? AND t."{attr}" IS NOT NULL
+        )
+        WHERE previous IS NOT NULL AND value != previous
+    """, (amf_id,))
+    return cursor.fetchone()[0]
+
+
+def _summarize_delta_file(cursor: sqlite3.Cursor, amf_id: int, section_columns: dict[str, list[str]]) -> tuple:
+    """
+    The figures of _summarize_file for a file in delta mode, from its rebuilt messages in one pass.
+
+    Returns:
+        tuple: (attribute rows, mode changes, level changes, error count, start time, end time)
+    """
+    figures = {}
+    previous = {"M_MODE": None, "M_LEVEL": None}
+    changes = {"M_MODE": 0, "M_LEVEL": 0}
+    error_count = 0
+    start_time = end_time = None
+    has_time = all(a in section_columns["jru"] for a in SUMMARY_TIME_ATTRIBUTES)
+
+    for message in iter_cursor_messages(cursor.connection.cursor(), amf_id):
+        for section in SECTION_TABLES:
+            for attribute, value in message.get(section, {}).items():
+                count, minimum, maximum = figures.get((section, attribute), (0, None, None))
+                number = numeric_value(value)
+                if number is not None:
+                    minimum = number if minimum is None else min(minimum, number)
+                    maximum = number if maximum is None else max(maximum, number)
+                figures[(section, attribute)] = (count + 1, minimum, maximum)
+
+        jru = message.get("jru", {})
+        for attribute, last in previous.items():
+            value = jru.get(attribute)
+            if value is not None:
+                if last is not None and value != last:
+                    changes[attribute] += 1
+                previous[attribute] = value
+
+        if any(jru.get(a) is not None and jru[a].strip() not in ("", "0") for a in SUMMARY_ERROR_ATTRIBUTES):
+            error_count += 1
+
+        # Same as printf('%04d-...') in _summarize_file, a missing part is 0
+        if has_time and jru.get("DATE.YEAR") is not None and jru.get("TIME.HOUR") is not None:
+            timestamp = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}.{:03d}".format(
+                *(int(numeric_value(jru.get(a)) or 0) for a in SUMMARY_TIME_ATTRIBUTES))
+            start_time = timestamp if start_time is None else min(start_time, timestamp)
+            end_time = timestamp if end_time is None else max(end_time, timestamp)
+
+    attribute_rows = [(amf_id, section, attribute, *figures[(section, attribute)])
+                      for section in SECTION_TABLES for attribute in section_columns[section]
+                      if (section, attribute) in figures]
+    return attribute_rows, changes["M_MODE"], changes["M_LEVEL"], error_count, start_time, end_time
+
+
+def _summarize_file(cursor: sqlite3.Cursor, amf_id: int, section_columns: dict[str, list[str]]):
+    """
+    Computes the summary and the per attribute figures for one file and replaces the stored rows.
+    """
+    cursor.execute("""
+        SELECT COUNT(*), MIN(am_local_id), MAX(am_local_id) FROM adru_messages WHERE am_amf_id = ?
+    """, (amf_id,))
+    message_count, first_local_id, last_local_id = cursor.fetchone()
+
+    if is_delta_file(cursor, amf_id):
+        # The stored rows only have the changes, the figures are computed from the rebuilt messages
+        attribute_rows, mode_changes, level_changes, error_count, start_time, end_time = \
+            _summarize_delta_file(cursor, amf_id, section_columns)
+    else:
+        # Per attribute non null count and numeric min/max, one scan per section for each group of attributes
+        attribute_rows = []
+        for section, (table, prefix) in SECTION_TABLES.items():
+            attributes = section_columns[section]
+            for i in range(0, len(attributes), _ATTRIBUTES_PER_QUERY):
+                group = attributes[i:i + _ATTRIBUTES_PER_QUERY]
+                expressions = ", ".join(_attribute_aggregates_sql(f't."{a}"') for a in group)
+                cursor.execute(f"""
+                    SELECT {expressions}
+                    FROM adru_messages m
+                    JOIN {table} t ON t.{prefix}_am_id = m.am_id
+                    WHERE m.am_amf_id = ?
+                """, (amf_id,))
+                values = cursor.fetchone()
+                for j, attr in enumerate(group):
+                    non_null, min_value, max_value = values[j * 3:j * 3 + 3]
+                    if non_null:
+                        attribute_rows.append((amf_id, section, attr, non_null, min_value, max_value))
+
+        figures = {(row[1], row[2]): row for row in attribute_rows}
+
+        jru_columns = set(section_columns["jru"])
+        mode_changes = _count_value_changes(cursor, amf_id, "M_MODE") if ("jru", "M_MODE") in figures else 0
+        level_changes = _count_value_changes(cursor, amf_id, "M_LEVEL") if ("jru", "M_LEVEL") in figures else 0
+
+        error_count = 0
+        error_attrs = [a for a in SUMMARY_ERROR_ATTRIBUTES if ("jru", a) in figures]
+        if error_attrs:
+            condition = " OR ".join(f"""(t."{a}" IS NOT NULL AND trim(t."{a}") NOT IN ('', '0'))"""
+                                    for a in error_attrs)
+            cursor.execute(f"""
+                SELECT COUNT(*)
+                FROM adru_messages m
+                JOIN adru_message_jru t ON t.amj_am_id = m.am_id
+                WHERE m.am_amf_id = ? AND ({condition})
+            """, (amf_id,))
+            error_count = cursor.fetchone()[0]
+
+        start_time = end_time = None
+        if all(a in jru_columns for a in SUMMARY_TIME_ATTRIBUTES):
+            timestamp = ("printf('%04d-%02d-%02d %02d:%02d:%02d.%03d', t.\"DATE.YEAR\", t.\"DATE.MONTH\", "
+                         "t.\"DATE.DAY\", t.\"TIME.HOUR\", t.\"TIME.MINUTES\", t.\"TIME.SECONDS\", "
+                         "IFNULL(t.\"TIME.MILLISECONDS\", 0))")
+            cursor.execute(f"""
+                SELECT MIN({timestamp}), MAX({timestamp})
+                FROM adru_messages m
+                JOIN adru_message_jru t ON t.amj_am_id = m.am_id
+                WHERE m.am_amf_id = ? AND t."DATE.YEAR" IS NOT NULL AND t."TIME.HOUR" IS NOT NULL
+            """, (amf_id,))
+            start_time, end_time = cursor.fetchone()
+
+    figures = {(row[1], row[2]): row for row in attribute_rows}
+    speeds = [figures[key][5] for key in SUMMARY_SPEED_ATTRIBUTES if key in figures and figures[key][5] is not None]
+    max_speed = max(speeds) if speeds else None
+
+    cursor.execute("DELETE FROM adru_attribute_summary WHERE aas_amf_id = ?", (amf_id,))
+    cursor.executemany("""
+        INSERT INTO adru_attribute_summary
+            (aas_amf_id, aas_section, aas_attribute, aas_non_null_count, aas_min_value, aas_max_value)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, attribute_rows)
+    cursor.execute("""
+        INSERT OR REPLACE INTO adru_file_summary
+            (afs_amf_id, afs_message_count, afs_first_local_id, afs_last_local_id, afs_start_time, afs_end_time,
+             afs_max_speed, afs_mode_changes, afs_level_changes, afs_error_count, afs_updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (amf_id, message_count, first_local_id, last_local_id, start_time, end_time, max_speed, mode_changes,
+          level_changes, error_count, datetime.now().isoformat()))
+
+
+def refresh_file_summary(db_path: Path, amf_id: int | None = None, force: bool = False) -> int:
+    """
+    Fills the per file summary tables. Only files without a summary, or where the number of stored messages
+    changed since the summary was made, are computed again unless force is set.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int | None): Only refresh this adru_message_file, or all files if None
+        force (bool): Recompute the summary even if it is up to date
+
+    Returns:
+        int: Number of files summarized
+    """
+    ensure_file_summary_tables(db_path)
+
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+
+        sql = "SELECT am_amf_id, COUNT(*) FROM adru_messages"
+        params = ()
+        if amf_id is not None:
+            sql += " WHERE am_amf_id = ?"
+            params = (amf_id,)
+        cursor.execute(sql + " GROUP BY am_amf_id", params)
+        message_counts = dict(cursor.fetchall())
+
+        cursor.execute("SELECT afs_amf_id, afs_message_count FROM adru_file_summary")
+        summarized = dict(cursor.fetchall())
+
+        stale = [file_id for file_id, count in message_counts.items() if force or summarized.get(file_id) != count]
+        if not stale:
+            return 0
+
+        section_columns = {
+            section: [c for c in get_table_columns(cursor, table) if c not in (f"{prefix}_id", f"{prefix}_am_id")]
+            for section, (table, prefix) in SECTION_TABLES.items()
+        }
+
+        for i, file_id in enumerate(stale, start=1):
+            print(f"\r📊 Summarizing file {i} of {len(stale)} (amf_id {file_id})...", end="")
+            _summarize_file(cursor, file_id, section_columns)
+
+    print("\n✅ File summaries updated.")
+    return len(stale)
+
+
+def get_file_summaries(db_path: Path, amf_ids: list[int] | None = None) -> list[dict]:
+    """
+    Fetches the stored per file summaries.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_ids (list[int] | None): Only these adru_message_file IDs, or all summarized files if None
+
+    Returns:
+        list[dict]: [{ amf_id, amf_name, af_id, af_name, message_count, first_local_id, last_local_id,
+                       start_time, end_time, max_speed, mode_changes, level_changes, error_count, updated_at }]
+    """
+    sql = """
+        SELECT s.afs_amf_id, mf.amf_name, mf.amf_af_id, af.af_name, s.afs_message_count, s.afs_first_local_id,
+               s.afs_last_local_id, s.afs_start_time, s.afs_end_time, s.afs_max_speed, s.afs_mode_changes,
+               s.afs_level_changes, s.afs_error_count, s.afs_updated_at
+        FROM adru_file_summary s
+        JOIN adru_message_file mf ON mf.amf_id = s.afs_amf_id
+        LEFT JOIN adru_file af ON af.af_id = mf.amf_af_id
+    """
+    params = []
+    if amf_ids is not None:
+        sql += f" WHERE s.afs_amf_id IN ({', '.join('?' for _ in amf_ids)})"
+        params = list(amf_ids)
+    sql += " ORDER BY s.afs_amf_id"
+
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        if not table_exists(cursor, "adru_file_summary"):
+            return []
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    keys = ("amf_id", "amf_name", "af_id", "af_name", "message_count", "first_local_id", "last_local_id",
+            "start_time", "end_time", "max_speed", "mode_changes", "level_changes", "error_count", "updated_at")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def get_attribute_summary(db_path: Path, amf_id: int) -> list[dict]:
+    """
+    Fetches the non null count and numeric min/max of each attribute that is present in a file.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+
+    Returns:
+        list[dict]: [{ section, attribute, non_null_count, min_value, max_value }]
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        if not table_exists(cursor, "adru_attribute_summary"):
+            return []
+        cursor.execute("""
+            SELECT aas_section, aas_attribute, aas_non_null_count, aas_min_value, aas_max_value
+            FROM adru_attribute_summary
+            WHERE aas_amf_id = ?
+            ORDER BY aas_section, aas_attribute
+        """, (amf_id,))
+        rows = cursor.fetchall()
+
+    keys = ("section", "attribute", "non_null_count", "min_value", "max_value")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def ensure_file_manifest_table(db_path: Path):
+    """
+    Creates the manifest table with one row per ingested ADRU file, if it does not exist.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+    """
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_file_manifest (
+                afm_adru_path TEXT PRIMARY KEY,
+                afm_adru_size INTEGER,
+                afm_adru_mtime_ns INTEGER,
+                afm_adru_md5 TEXT,
+                afm_af_id INTEGER,
+                afm_amf_id INTEGER,
+                afm_txt_path TEXT,
+                afm_txt_md5 TEXT,
+                afm_jru_attributes TEXT,
+                afm_etcs_attributes TEXT,
+                afm_dru_attributes TEXT,
+                afm_status TEXT,
+                afm_updated_at TIMESTAMP,
+                FOREIGN KEY (afm_af_id) REFERENCES adru_file (af_id),
+                FOREIGN KEY (afm_amf_id) REFERENCES adru_message_file (amf_id)
+            )
+        """)
+
+
+def record_file_manifest(db_path: Path, adru_path: Path, txt_path: Path, amf_id: int) -> int | None:
+    """
+    Stores the manifest for an ADRU file whose messages are in the database: the stat of the .adru file, its
+    fingerprints, the decoded file and the attribute set per section. The attribute set is read from
+    adru_attribute_summary, so the file summary must be refreshed first.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        adru_path (Path): Path to the ADRU file
+        txt_path (Path): Path to the decoded .txt file (plain or compressed)
+        amf_id (int): ID from adru_message_file table for the decoded file
+
+    Returns:
+        int | None: af_id of the ADRU file, or None if the decoded file is not in the database
+    """
+    ensure_file_manifest_table(db_path)
+    ensure_file_summary_tables(db_path)
+    stat = adru_path.stat()
+
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+
+        # Only a file with all its messages is complete, an insert that was stopped leaves only some of them
+        cursor.execute(f"""
+            SELECT af.af_id, af.af_md5_hash, mf.amf_md5_hash, {_complete_file_sql()}
+            FROM adru_message_file mf
+            JOIN adru_file af ON af.af_id = mf.amf_af_id
+            WHERE mf.amf_id = ?
+        """, (amf_id,))
+        row = cursor.fetchone()
+        if not row:
+            print(f"⚠️ No adru_message_file found for amf_id {amf_id}, manifest not stored.")
+            return None
+        af_id, adru_md5, txt_md5, is_complete = row
+        status = "complete" if is_complete else "registered"
+
+        cursor.execute("""
+            SELECT aas_section, aas_attribute FROM adru_attribute_summary WHERE aas_amf_id = ? ORDER BY aas_attribute
+        """, (amf_id,))
+        attributes = {section: [] for section in SECTION_TABLES}
+        for section, attr in cursor.fetchall():
+            attributes[section].append(attr)
+
+        cursor.execute("""
+            INSERT OR REPLACE INTO adru_file_manifest
+                (afm_adru_path, afm_adru_size, afm_adru_mtime_ns, afm_adru_md5, afm_af_id, afm_amf_id, afm_txt_path,
+                 afm_txt_md5, afm_jru_attributes, afm_etcs_attributes, afm_dru_attributes, afm_status,
+                 afm_updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (str(adru_path.resolve()), stat.st_size, stat.st_mtime_ns, adru_md5, af_id, amf_id, str(txt_path),
+              txt_md5, json.dumps(attributes["jru"]), json.dumps(attributes["etcs"]), json.dumps(attributes["dru"]),
+              status, datetime.now().isoformat()))
+
+    return af_id
+
+
+def get_completed_manifest(db_path: Path, adru_path: Path) -> dict | None:
+    """
+    Fast check if an ADRU file already is fully in the database. Only a stat of the file and indexed lookups
+    are used, no hashing or scanning of .txt files. A file that was changed, moved or that does not have all its
+    messages in the database (removed, or the insert was stopped) is not seen as complete.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        adru_path (Path): Path to the ADRU file
+
+    Returns:
+        dict | None: { af_id, amf_id, txt_path, adru_md5, txt_md5, attributes } or None if the file must be processed
+    """
+    stat = adru_path.stat()
+
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        if not table_exists(cursor, "adru_file_manifest"):
+            return None
+        cursor.execute("""
+            SELECT afm_af_id, afm_amf_id, afm_txt_path, afm_adru_md5, afm_txt_md5, afm_jru_attributes,
+                   afm_etcs_attributes, afm_dru_attributes
+            FROM adru_file_manifest
+            WHERE afm_adru_path = ? AND afm_adru_size = ? AND afm_adru_mtime_ns = ? AND afm_status = 'complete'
+        """, (str(adru_path.resolve()), stat.st_size, stat.st_mtime_ns))
+        row = cursor.fetchone()
+        if not row:
+            return None
+
+        # The messages can have been removed after the manifest was written
+        cursor.execute(f"SELECT 1 FROM adru_message_file mf WHERE mf.amf_id = ? AND {_complete_file_sql()}",
+                       (row[1],))
+        if not cursor.fetchone():
+            return None
+
+    return {
+        "af_id": row[0],
+        "amf_id": row[1],
+        "txt_path": Path(row[2]),
+        "adru_md5": row[3],
+        "txt_md5": row[4],
+        "attributes": {"jru": json.loads(row[5]), "etcs": json.loads(row[6]), "dru": json.loads(row[7])},
+    }
+
+
+def get_newest_amf_id(db_path: Path, adru_file_id: int) -> int | None:
+    """
+    Returns the amf_id of the newest decoded file for an ADRU file, without looking at the .txt files.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        adru_file_id (int): The af_id from adru_file
+
+    Returns:
+        int | None: amf_id or None if the ADRU file has no decoded files
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT amf_id FROM adru_message_file WHERE amf_af_id = ? ORDER BY amf_created_at DESC, amf_id DESC LIMIT 1
+        """, (adru_file_id,))
+        row = cursor.fetchone()
+
+    return row[0] if row else None
+
+
+def _fetch_section_rows(cursor: sqlite3.Cursor, section: str, am_ids: list[int],
+                        columns: list[str] | None = None) -> dict[int, dict]:
+    """
+    Fetches the non null attributes of one section for a list of messages.
+
+    Returns:
+        dict[int, dict]: am_id -> { attribute: value }
+    """
+    table, prefix = SECTION_TABLES[section]
+    select = "*" if columns is None else ", ".join([f"{prefix}_am_id"] + [f'"{c}"' for c in columns])
+    cursor.execute(f"""
+        SELECT {select} FROM {table} WHERE {prefix}_am_id IN ({", ".join("?" for _ in am_ids)})
+    """, am_ids)
+    names = [desc[0] for desc in cursor.description]
+    id_index = names.index(f"{prefix}_am_id")
+    skip = {f"{prefix}_id", f"{prefix}_am_id"}
+
+    rows = {}
+    for row in cursor.fetchall():
+        rows[row[id_index]] = {name: value for name, value in zip(names, row)
+                               if value is not None and name not in skip}
+    return rows
+
+
+class _DeltaReader:
+    """
+    Rebuilds the full attributes of the messages of a file stored in delta mode, starting from the nearest
+    keyframe. The attributes after the last rebuilt message are kept, so reading a file in order applies
+    each delta only once.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, amf_id: int, columns: dict[str, list[str]] | None):
+        self.cursor = cursor
+        self.amf_id = amf_id
+        self.columns = columns
+        self.sections = list(SECTION_TABLES) if columns is None else [s for s in SECTION_TABLES if columns.get(s)]
+        cursor.execute("""
+            SELECT d.amdl_am_id FROM adru_message_delta d
+            JOIN adru_messages m ON m.am_id = d.amdl_am_id
+            WHERE m.am_amf_id = ? AND d.amdl_keyframe = 1
+            ORDER BY d.amdl_am_id
+        """, (amf_id,))
+        self.keyframes = [row[0] for row in cursor.fetchall()]
+        self.last_am_id = None
+        self.state = {}
+
+    def _walk(self, start: int, stop: int, wanted: set[int], messages: dict[int, dict]):
+        # Applies the stored rows of the messages from start to stop (am_id order) to the state
+        cursor = self.cursor
+        # The am_id ranges are looked up on the primary key and the section indexes, rows of other files in
+        # the range are skipped here
+        cursor.execute("SELECT am_id, am_amf_id FROM adru_messages WHERE am_id BETWEEN ? AND ? ORDER BY am_id",
+                       (start, stop))
+        am_ids = [am_id for am_id, amf_id in cursor.fetchall() if amf_id == self.amf_id]
+
+        section_rows = {}
+        for section in self.sections:
+            table, prefix = SECTION_TABLES[section]
+            columns = None if self.columns is None else self.columns[section]
+            select = "t.*" if columns is None else ", ".join([f"t.{prefix}_am_id"] + [f't."{c}"' for c in columns])
+            cursor.execute(f"SELECT {select} FROM {table} t WHERE t.{prefix}_am_id BETWEEN ? AND ?", (start, stop))
+            names = [desc[0] for desc in cursor.description]
+            id_index = names.index(f"{prefix}_am_id")
+            skip = {f"{prefix}_id", f"{prefix}_am_id"}
+            section_rows[section] = {
+                row[id_index]: {name: value for name, value in zip(names, row)
+                                if value is not None and name not in skip}
+                for row in cursor.fetchall()
+            }
+
+        cursor.execute("SELECT amdl_am_id, amdl_keyframe, amdl_removed FROM adru_message_delta "
+                       "WHERE amdl_am_id BETWEEN ? AND ?", (start, stop))
+        deltas = {am_id: (keyframe, json.loads(removed) if removed else {})
+                  for am_id, keyframe, removed in cursor.fetchall()}
+
+        for am_id in am_ids:
+            keyframe, removed = deltas.get(am_id, (0, {}))
+            if keyframe:
+                self.state = {section: {} for section in self.sections}
+            for section, attributes in removed.items():
+                if section in self.state:
+                    for attribute in attributes:
+                        self.state[section].pop(attribute, None)
+            for section in self.sections:
+                data = section_rows[section].get(am_id)
+                if data:
+                    self.state[section].update(data)
+            if am_id in wanted:
+                messages[am_id] = {section: dict(data) for section, data in self.state.items() if data}
+
+        self.last_am_id = stop
+
+    def messages(self, am_ids: list[int]) -> dict[int, dict]:
+        """
+        Returns am_id -> { jru: {...}, etcs: {...}, dru: {...} } like fetch_messages_by_id.
+        """
+        wanted = sorted(set(am_ids))
+        messages = {}
+        position = 0
+        while position < len(wanted):
+            target = wanted[position]
+            k = bisect_right(self.keyframes, target) - 1
+            keyframe = self.keyframes[k] if k >= 0 else target
+
+            # Every wanted message before the next keyframe is rebuilt in one walk
+            next_keyframe = self.keyframes[k + 1] if k + 1 < len(self.keyframes) else float("inf")
+            end = position
+            while end < len(wanted) and wanted[end] < next_keyframe:
+                end += 1
+
+            if self.last_am_id is not None and keyframe <= self.last_am_id < target:
+                start = self.last_am_id + 1
+            else:
+                start = keyframe
+                self.state = {section: {} for section in self.sections}
+            self._walk(start, wanted[end - 1], set(wanted[position:end]), messages)
+            position = end
+        return messages
+
+
+def _delta_files(cursor: sqlite3.Cursor, am_ids: list[int]) -> dict[int, list[int]]:
+    """
+    Returns amf_id -> am_ids for the messages of files that are stored in delta mode.
+    """
+    if not table_exists(cursor, "adru_delta_file"):
+        return {}
+    cursor.execute(f"""
+        SELECT m.am_amf_id, m.am_id FROM adru_messages m
+        JOIN adru_delta_file d ON d.adf_amf_id = m.am_amf_id
+        WHERE m.am_id IN ({", ".join("?" for _ in am_ids)})
+    """, am_ids)
+    files = {}
+    for amf_id, am_id in cursor.fetchall():
+        files.setdefault(amf_id, []).append(am_id)
+    return files
+
+
+def is_delta_file(cursor: sqlite3.Cursor, amf_id: int) -> bool:
+    """
+    Checks if the messages of a file are stored in delta mode, see MessageDeltaEncoder. The stored rows of
+    such a file only have the changed attributes, so readers rebuild the messages with iter_file_messages or
+    fetch_messages_by_id instead of reading the section tables directly.
+    """
+    if not table_exists(cursor, "adru_delta_file"):
+        return False
+    cursor.execute("SELECT 1 FROM adru_delta_file WHERE adf_amf_id = ?", (amf_id,))
+    return cursor.fetchone() is not None
+
+
+def iter_cursor_messages(cursor: sqlite3.Cursor, amf_id: int, chunk_size: int = 2000,
+                         columns: dict[str, list[str]] | None = None):
+    """
+    iter_file_messages on an open connection, see there for the arguments. The cursor is used for the
+    queries, so it can not be used for other queries while the messages are read.
+
+    Yields:
+        dict: { am_id, am_local_id, jru: {...}, etcs: {...}, dru: {...} }, empty sections are left out
+    """
+    sections = list(SECTION_TABLES) if columns is None else [s for s in SECTION_TABLES if columns.get(s)]
+    last_local_id, last_am_id = -1, -1
+
+    delta_reader = None
+    if is_delta_file(cursor, amf_id):
+        delta_reader = _DeltaReader(cursor.connection.cursor(), amf_id, columns)
+
+    while True:
+        cursor.execute("""
+            SELECT am_id, am_local_id
+            FROM adru_messages
+            WHERE am_amf_id = ? AND (am_local_id, am_id) > (?, ?)
+            ORDER BY am_local_id, am_id
+            LIMIT ?
+        """, (amf_id, last_local_id, last_am_id, chunk_size))
+        messages = cursor.fetchall()
+        if not messages:
+            break
+
+        am_ids = [am_id for am_id, _ in messages]
+        if delta_reader:
+            rebuilt = delta_reader.messages(am_ids)
+            section_rows = {section: {am_id: data[section] for am_id, data in rebuilt.items() if section in data}
+                            for section in sections}
+        else:
+            section_rows = {
+                section: _fetch_section_rows(cursor, section, am_ids, None if columns is None else columns[section])
+                for section in sections
+            }
+
+        for am_id, local_id in messages:
+            message = {"am_id": am_id, "am_local_id": local_id}
+            for section in sections:
+                data = section_rows[section].get(am_id)
+                if data:
+                    message[section] = data
+            yield message
+
+        last_am_id, last_local_id = messages[-1]
+
+
+def iter_file_messages(db_path: Path, amf_id: int, chunk_size: int = 2000,
+                       columns: dict[str, list[str]] | None = None):
+    """
+    Streams the messages of a decoded file in am_local_id order, with only the non null attributes of each
+    section. The messages are read in chunks with keyset pagination, so the memory use does not depend on
+    the size of the file. Files in delta mode are rebuilt to full messages.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        chunk_size (int): Number of messages fetched per query
+        columns (dict[str, list[str]] | None): Only read these attributes per section ("jru", "etcs", "dru"),
+            a section that is left out is not read. All attributes are read if None
+
+    Yields:
+        dict: { am_id, am_local_id, jru: {...}, etcs: {...}, dru: {...} }, empty sections are left out
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        yield from iter_cursor_messages(conn.cursor(), amf_id, chunk_size, columns)
+
+
+def fetch_messages_by_id(cursor: sqlite3.Cursor, am_ids: list[int],
+                         columns: dict[str, list[str]] | None = None) -> dict[int, dict]:
+    """
+    Fetches the non null attributes of the JRU, ETCS and DRU sections for a list of messages.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the database with the messages
+        am_ids (list[int]): IDs from adru_messages
+        columns (dict[str, list[str]] | None): Only read these attributes per section, a section that is left
+            out is not read. All attributes are read if None
+
+    Returns:
+        dict[int, dict]: am_id -> { jru: {...}, etcs: {...}, dru: {...} }, empty sections are left out
+    """
+    if not am_ids:
+        return {}
+
+    sections = list(SECTION_TABLES) if columns is None else [s for s in SECTION_TABLES if columns.get(s)]
+    messages = {am_id: {} for am_id in am_ids}
+
+    # Messages of files in delta mode are rebuilt from their keyframe
+    delta_files = _delta_files(cursor, am_ids)
+    for amf_id, file_am_ids in delta_files.items():
+        messages.update(_DeltaReader(cursor, amf_id, columns).messages(file_am_ids))
+    if delta_files:
+        rebuilt = {am_id for file_am_ids in delta_files.values() for am_id in file_am_ids}
+        am_ids = [am_id for am_id in am_ids if am_id not in rebuilt]
+        if not am_ids:
+            return messages
+
+    for section in sections:
+        section_columns = None if columns is None else columns[section]
+        for am_id, data in _fetch_section_rows(cursor, section, am_ids, section_columns).items():
+            if data:
+                messages[am_id][section] = data
+    return messages
+
+
+def get_message_files_for_adru(db_path: Path, adru_file_id: int) -> list[dict]:
+    """
+    Lists the decoded files (decodes) of an ADRU file, newest first.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        adru_file_id (int): The af_id from adru_file
+
+    Returns:
+        list[dict]: [{ amf_id, name, message_count, created_at }]
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT amf_id, amf_name, amf_message_count, amf_created_at FROM adru_message_file
+            WHERE amf_af_id = ? ORDER BY amf_created_at DESC, amf_id DESC
+        """, (adru_file_id,))
+        rows = cursor.fetchall()
+
+    return [{"amf_id": r[0], "name": r[1], "message_count": r[2], "created_at": r[3]} for r in rows]
+
+
+# Tables with rows per decoded file besides the messages, table -> amf_id column
+MESSAGE_FILE_TABLES = {
+    "adru_message_fts": "fts_amf_id",
+    "adru_fts_indexed": "afi_amf_id",
+    "adru_file_summary": "afs_amf_id",
+    "adru_attribute_summary": "aas_amf_id",
+    "adru_message_fingerprint": "amfp_amf_id",
+    "adru_file_manifest": "afm_amf_id",
+    "adru_message_file_sample": "amfs_amf_id",
+    "adru_event": "ae_amf_id",
+    "adru_event_extracted": "aee_amf_id",
+    "adru_file_columns": "afc_amf_id",
+    "adru_message_offset": "amo_amf_id",
+    "adru_delta_file": "adf_amf_id",
+}
+
+
+def delete_message_file(db_path: Path, amf_id: int, batch_size: int = 20000) -> int:
+    """
+    Removes a decoded file from the database: its messages in all message tables, the rows about it in the
+    search index, summary, fingerprint and manifest tables, and the adru_message_file row. The messages are
+    deleted in batches, see delete_file_messages. Its cached merge and export results are removed too.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        batch_size (int): Number of am_id values deleted per transaction
+
+    Returns:
+        int: Number of deleted messages
+    """
+    deleted = delete_file_messages(db_path, amf_id, batch_size)
+
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        for table, column in MESSAGE_FILE_TABLES.items():
+            if table_exists(cursor, table):
+                cursor.execute(f"DELETE FROM {table} WHERE {column} = ?", (amf_id,))
+        cursor.execute("DELETE FROM adru_message_file WHERE amf_id = ?", (amf_id,))
+    conn.close()
+
+    # SQLite can give the amf_id to a file added later, its results must not be found
+    forget_file_results(db_path, amf_id)
+    return deleted
+
+
+def delete_adru_file(db_path: Path, adru_file_id: int, batch_size: int = 20000) -> int:
+    """
+    Removes a recording from the database: all its decoded files and the adru_file row.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        adru_file_id (int): The af_id from adru_file
+        batch_size (int): Number of am_id values deleted per transaction
+
+    Returns:
+        int: Number of deleted messages
+    """
+    deleted = 0
+    for message_file in get_message_files_for_adru(db_path, adru_file_id):
+        deleted += delete_message_file(db_path, message_file["amf_id"], batch_size)
+
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        if table_exists(cursor, "adru_file_manifest"):
+            cursor.execute("DELETE FROM adru_file_manifest WHERE afm_af_id = ?", (adru_file_id,))
+        cursor.execute("DELETE FROM adru_file WHERE af_id = ?", (adru_file_id,))
+    conn.close()
+
+    return deleted
+
+
+def get_superseded_message_files(db_path: Path, keep: int = 1) -> list[dict]:
+    """
+    Lists the decoded files that are older than the newest `keep` decodes of their ADRU file. Only decodes
+    that have all their messages in the database are counted and listed. A decode that is registered but
+    still being inserted, or whose insert was stopped, never replaces an older complete decode, and the
+    newest complete decode of an ADRU file is always kept.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        keep (int): Number of complete decodes to keep per ADRU file, at least 1
+
+    Returns:
+        list[dict]: [{ amf_id, af_id, af_name, name, message_count, created_at }]
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT amf_id, af_id, af_name, amf_name, amf_message_count, amf_created_at
+            FROM (
+                SELECT mf.*, af.af_id, af.af_name,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY mf.amf_af_id ORDER BY mf.amf_created_at DESC, mf.amf_id DESC
+                       ) AS generation
+                FROM adru_message_file mf
+                JOIN adru_file af ON af.af_id = mf.amf_af_id
+                WHERE {_complete_file_sql()}
+            )
+            WHERE generation > ?
+            ORDER BY af_name, amf_created_at
+        """, (max(keep, 1),))
+        rows = cursor.fetchall()
+
+    keys = ("amf_id", "af_id", "af_name", "name", "message_count", "created_at")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def compact_database(db_path: Path, pages_per_step: int = 10000, convert: bool = False) -> int:
+    """
+    Returns the free pages left by deleted messages to the file system. Databases created with
+    auto_vacuum = INCREMENTAL are compacted in steps of pages_per_step pages with a commit after each step,
+    so readers are not blocked for long. Older databases need a full VACUUM once to switch to incremental
+    auto vacuum, which rewrites the whole file and is only done when convert is set.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        pages_per_step (int): Number of pages freed per transaction
+        convert (bool): Run a full VACUUM to switch a database to incremental auto vacuum
+
+    Returns:
+        int: Number of pages returned to the file system
+    """
+    conn = connect_db(db_path)
+    cursor = conn.cursor()
+    try:
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+        if auto_vacuum != 2:
+            if not convert:
+                free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+                print(f"⚠️ {db_path.name} has {free_pages} free pages but no incremental auto vacuum. "
+                      f"Compact it with convert=True once, this rewrites the whole database.")
+                return 0
+            print(f"🧹 Rewriting {db_path.name} with incremental auto vacuum...")
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        elif free_pages := cursor.execute("PRAGMA freelist_count").fetchone()[0]:
+            print(f"🧹 Compacting {db_path.name}, {free_pages} free pages...")
+            while cursor.execute("PRAGMA freelist_count").fetchone()[0]:
+                # execute only steps the pragma once (one page), executescript runs the whole step and commits it
+                conn.executescript(f"PRAGMA incremental_vacuum({pages_per_step});")
+
+        freed = page_count - cursor.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        conn.close()
+
+    checkpoint_wal(db_path, "TRUNCATE")
+    return freed
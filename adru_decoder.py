@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 from pathlib import Path
 
@@ -7,23 +8,23 @@ import yaml
 from adru_db_utils import initialize_adru_database, add_adru_file_to_db, add_message_file_to_db, \
     exist_txt_file_for_adru, fetch_newest_txt_file_for_adru, insert_messages_from_txt, \
     get_all_adru_files_that_has_txt_files_and_latest_txt, is_txt_content_in_db_with_entries, \
-    enrich_dataframe_with_db_values
-from adru_utils import find_adru_files, get_latest_txt_file, prompt_user_and_wait_for_txt, extract_unique_attributes
+    is_txt_content_complete_in_db, delete_file_messages, checkpoint_wal, \
+    enrich_dataframe_with_db_values, build_fts_index, search_message_text, refresh_file_summary, get_file_summaries, \
+    record_file_manifest, get_completed_manifest, get_newest_amf_id, get_message_files_for_adru, compact_database
+from adru_utils import find_adru_files, get_latest_txt_file, prompt_user_and_wait_for_txt, extract_unique_attributes, \
+    compress_txt_file, is_compressed_txt, configure_read_ahead, MessageOffsets
+from adru_cache import configure_result_cache
+from adru_columnar import configure_columnar_cache, build_columnar_cache
+from adru_diff import diff_message_files, summarize_diff, build_message_fingerprints
+from adru_events import extract_file_events, get_events, EVENT_RULES
+from adru_export import export_file_to_jsonl
+from adru_offsets import build_message_offsets, store_message_offsets
+from adru_retention import apply_retention
+from adru_pipeline import run_adru_pipeline, MissingAttributesError
+from adru_shards import initialize_shard_catalog, shard_key_for_file, get_shard_path, register_shard_file, \
+    list_shards, list_sharded_files
 from adru_statistic import run_statistic_generation
 
-# Load YAML config
-with open("config.yaml", "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
-
-# Extract config values
-exe_path = config["decode_tool"]["executable_path"]
-adru_input_dir = config["input"]["adru_input_dir"]
-input_type = config["input"]["input_type"]
-output_types = config["input"]["output_types"]
-txt_output_dir = config["output"]["txt_output_dir"]
-csv_output_dir = config["output"]["csv_output_dir"]
-csv_raw_dir = config["input"]["csv_input_dir"]
-
 # Add new row in the database with file name and fetch id for it
 # Example usage placeholder (adjust paths and attribute lists in real usage)
 db_file = Path("adru-export.db")
@@ -181,24 +182,199 @@ dru_attributes = ['(0)', '(1)', '(2)', '(3)', '(4)', '(5)', '(6)', '(7)', '(8)',
                   'SENSOR_ID (4)', 'SENSOR_ID (5)', 'Source name', 'Status advice', 'Status display',
                   'Status level message', 'Status message', 'Subsystem name']
 
-# Init db with attributes fetch from previous adru files
-initialize_adru_database(
-    db_file,
-    jru_attributes,
-    etcs_attributes,
-    dru_attributes
-)
+# Settings from config.yaml, filled by load_config when the decoder is started
+settings = {}
+
+
+def load_config(config_path: Path = Path("config.yaml")):
+    """
+    Reads config.yaml into settings and configures the read ahead and the caches. Only called when the
+    decoder is started, the parser processes import this module again (spawn on Windows) and do not need it.
+
+    Args:
+        config_path (Path): Path to the YAML config
+    """
+    # Load YAML config
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    # Extract config values
+    settings["exe_path"] = config["decode_tool"]["executable_path"]
+    settings["run_decode_tool"] = config["decode_tool"].get("run_automatically", False)
+    settings["adru_input_dir"] = config["input"]["adru_input_dir"]
+    settings["input_type"] = config["input"]["input_type"]
+    settings["output_types"] = config["input"]["output_types"]
+    settings["txt_output_dir"] = config["output"]["txt_output_dir"]
+    settings["csv_output_dir"] = config["output"]["csv_output_dir"]
+    settings["csv_raw_dir"] = config["input"]["csv_input_dir"]
+    settings["compress_txt_after_ingest"] = config["output"].get("compress_txt_after_ingest")
+    settings["json_output_dir"] = config["output"].get("json_output_dir", "json_out")
+    settings["json_compression"] = config["output"].get("json_compression")
+    db_config = config.get("database") or {}
+    settings["fts_index_enabled"] = db_config.get("fts_index", False)
+    settings["message_fingerprints_enabled"] = db_config.get("message_fingerprints", False)
+    settings["event_detection_enabled"] = db_config.get("event_detection", True)
+    settings["message_offsets_enabled"] = db_config.get("message_offsets", True)
+    settings["wal_mode"] = db_config.get("wal_mode", True)
+    settings["commit_every"] = db_config.get("commit_every", 5000)
+    settings["delta_keyframe_interval"] = (db_config.get("delta_keyframe_interval", 1000)
+                                           if db_config.get("delta_encoding") else None)
+    settings["sharding_mode"] = db_config.get("sharding")
+    settings["shard_dir"] = Path(db_config.get("shard_dir") or "shards")
+    settings["catalog_file"] = settings["shard_dir"] / "adru-catalog.db"
+    ingest_config = config.get("ingest") or {}
+    settings["ingest"] = ingest_config
+    settings["hash_workers"] = ingest_config.get("hash_workers", 4)
+    configure_read_ahead(int((ingest_config.get("read_ahead_mb", 8) or 0) * 1024 * 1024))
+    settings["retention"] = config.get("retention") or {}
+    cache_config = config.get("cache") or {}
+    configure_result_cache(cache_config.get("max_entries", 32), cache_config.get("cache_dir"),
+                           cache_config.get("max_disk_entries", 256))
+    settings["columnar_cache_enabled"] = bool(cache_config.get("columnar_dir"))
+    configure_columnar_cache(cache_config.get("columnar_dir"))
+
+
+def initialize_databases():
+    # Init db with attributes fetch from previous adru files, in sharded mode each shard is created when needed
+    if settings["sharding_mode"]:
+        initialize_shard_catalog(settings["catalog_file"])
+    else:
+        initialize_adru_database(
+            db_file,
+            jru_attributes,
+            etcs_attributes,
+            dru_attributes,
+            settings["wal_mode"]
+        )
+
+
+def get_db_for_adru_file(adru_file: Path) -> Path:
+    # One database for all files, or the shard the file belongs to
+    if not settings["sharding_mode"]:
+        return db_file
+    shard_key = shard_key_for_file(adru_file, settings["sharding_mode"])
+    return get_shard_path(settings["catalog_file"], settings["shard_dir"], shard_key, jru_attributes,
+                          etcs_attributes, dru_attributes, settings["wal_mode"])
+
+
+def get_all_databases() -> list[Path]:
+    if not settings["sharding_mode"]:
+        return [db_file]
+    return [shard["path"] for shard in list_shards(settings["catalog_file"])]
+
+
+def build_decode_command(input_path: Path, output_path_target: Path, ot: str) -> str:
+    exe_file = Path(settings["exe_path"])
+    return rf"""
+                Push-Location "{exe_file.parent}"
+                .\{exe_file.name} -i "{input_path.parent}" `
+                -o "{output_path_target}" `
+                -f "{input_path.name}" `
+                -it {settings['input_type']}  -ot {ot}
+                Pop-Location
+                """
+
+
+def finalize_ingested_file(adru_path: Path, txt_path: Path, amf_id: int):
+    file_db = get_db_for_adru_file(adru_path)
+
+    # Keep the per file summary up to date, it is only computed again if the messages changed
+    refresh_file_summary(file_db, amf_id)
+
+    # Add the free text attributes to the search index, files already indexed are skipped
+    if settings["fts_index_enabled"]:
+        build_fts_index(file_db, amf_id)
+
+    # Write the columnar copy of the file first, the events are then detected from it
+    if settings["columnar_cache_enabled"]:
+        build_columnar_cache(file_db, amf_id)
+
+    # Store the events of the file, so finding incidents does not need to read the messages
+    if settings["event_detection_enabled"]:
+        extract_file_events(file_db, amf_id)
+
+    # Store the message fingerprints now, so comparing this decode with another one does not have to read it all
+    if settings["message_fingerprints_enabled"]:
+        build_message_fingerprints(file_db, amf_id)
+
+    # Index where each Msg starts in the txt file, so single messages can be read back without a scan. The
+    # index is stored while the messages are inserted, only files inserted before that are read again here.
+    if settings["message_offsets_enabled"]:
+        build_message_offsets(file_db, amf_id, txt_path)
+
+    # Compress the decoded txt file when it is in the database, the md5 is kept on the logical content
+    if settings["compress_txt_after_ingest"] and not is_compressed_txt(txt_path):
+        txt_path = compress_txt_file(txt_path, settings["compress_txt_after_ingest"])
+
+    # Remember that the file is done, so the next run can skip it without hashing or scanning
+    af_id = record_file_manifest(file_db, adru_path, txt_path, amf_id)
+
+    # List the file in the shard catalog
+    if settings["sharding_mode"] and af_id is not None:
+        register_shard_file(settings["catalog_file"], file_db, af_id, adru_path.name, amf_id)
+
+    # Move the inserted pages from the WAL file to the database without waiting for readers
+    if settings["wal_mode"]:
+        checkpoint_wal(file_db, "PASSIVE")
+
+
+def checkpoint_all_databases():
+    # Empty the WAL files when a run is done, this waits for the readers that are still running
+    if settings["wal_mode"]:
+        for checkpoint_db in get_all_databases():
+            checkpoint_wal(checkpoint_db, "TRUNCATE")
+
+
+def run_adru_txt_pipeline(adru_files: list[Path]):
+    Path(settings["txt_output_dir"]).mkdir(parents=True, exist_ok=True)
+
+    try:
+        asyncio.run(run_adru_pipeline(
+            adru_files,
+            db_file,
+            Path(settings["txt_output_dir"]),
+            build_decode_command,
+            exe_path=Path(settings["exe_path"]) if settings["run_decode_tool"] else None,
+            input_type=settings["input_type"],
+            on_file_done=finalize_ingested_file,
+            queue_size=settings["ingest"].get("queue_size", 4),
+            parse_workers=settings["ingest"].get("parse_workers"),
+            hash_workers=settings["hash_workers"],
+            resolve_db_path=get_db_for_adru_file,
+            delta_keyframe_interval=settings["delta_keyframe_interval"],
+            message_offsets=settings["message_offsets_enabled"],
+        ))
+    except MissingAttributesError as e:
+        print(f"\n⚠️ {e}")
+        print(
+            "\n🛠 Please add these attributes to the database schema manually. Delete the old db file if any, "
+            "and run the program again to recreate the database schema.")
+        exit("🛑 Exiting due to missing attributes.")
 
 
 def run_adru_txt_conversion():
     # Scan adru input directory for files
-    adru_files = find_adru_files(adru_input_dir)
+    adru_files = find_adru_files(settings["adru_input_dir"])
+
+    # Overlap decoding, hashing, parsing and writing of the files
+    if settings["ingest"].get("pipeline", False) and settings["output_types"] == ["t"]:
+        run_adru_txt_pipeline(adru_files)
+        checkpoint_all_databases()
+        return
 
     for adru_file in adru_files:
+        file_db = get_db_for_adru_file(adru_file)
+
+        # Files that are already in the database are skipped with only a stat and an indexed lookup
+        manifest = get_completed_manifest(file_db, adru_file)
+        if manifest:
+            print(f"✅ {adru_file.name} is already in the database (amf_id={manifest['amf_id']}).")
+            continue
+
         # Input file setup
         input_path = adru_file
-        output_txt_path = Path(txt_output_dir)
-        output_csv_path = Path(csv_output_dir)
+        output_txt_path = Path(settings["txt_output_dir"])
+        output_csv_path = Path(settings["csv_output_dir"])
 
         # Ensure output directory exists
         Path(output_txt_path).mkdir(parents=True, exist_ok=True)
@@ -209,7 +385,7 @@ def run_adru_txt_conversion():
         print("📄 File exists?", input_path.exists())
 
         # Fetch data from DB if file
-        adru_file_id = add_adru_file_to_db(db_file, input_path)
+        adru_file_id = add_adru_file_to_db(file_db, input_path)
 
         # Storage for output files variable
         previous_txt_file = get_latest_txt_file(output_txt_path)
@@ -219,11 +395,11 @@ def run_adru_txt_conversion():
             print(f"✅ Found previous .txt file: {previous_txt_file.name} (Last modified: {previous_time})")
 
         # Check if adru_file has known txt file
-        if not exist_txt_file_for_adru(adru_file_id, db_file, output_txt_path):
+        if not exist_txt_file_for_adru(adru_file_id, file_db, output_txt_path, settings["hash_workers"]):
             print(f"❌ No known .txt file for ADRU file {adru_file.name}. Starting processing.")
 
             # Run for each output type (e.g., txt and csv)
-            for ot in output_types:
+            for ot in settings["output_types"]:
 
                 # Fetch output folder
                 if ot == "t":
@@ -234,20 +410,12 @@ def run_adru_txt_conversion():
                     print(f"⚠️ Unknown output type: {ot}")
                     continue
 
-                exe_file = Path(exe_path)
-                command = rf"""
-                Push-Location "{exe_file.parent}"
-                .\{exe_file.name} -i "{input_path.parent}" `
-                -o "{output_path_target}" `
-                -f "{input_path.name}" `
-                -it {input_type}  -ot {ot}
-                Pop-Location
-                """
+                command = build_decode_command(input_path, output_path_target, ot)
 
                 # Prompt user and fetch new path
                 try:
                     new_txt = prompt_user_and_wait_for_txt(command, output_txt_path)
-                    add_message_file_to_db(db_file, new_txt, adru_file_id)
+                    add_message_file_to_db(file_db, new_txt, adru_file_id)
                 except TimeoutError as e:
                     print(f"❌ {e}")
                     exit(1)
@@ -255,11 +423,12 @@ def run_adru_txt_conversion():
             print(f"✅ known .txt file for ADRU file {adru_file.name} found. No need to create one.")
 
         # Fetch txt file for adru file
-        amf_md5, newest_txt_file_path, total_messages, amf_id = fetch_newest_txt_file_for_adru(adru_file_id, db_file,
-                                                                                               output_txt_path)
+        amf_md5, newest_txt_file_path, total_messages, amf_id = fetch_newest_txt_file_for_adru(adru_file_id, file_db,
+                                                                                               output_txt_path,
+                                                                                               settings["hash_workers"])
 
         if not newest_txt_file_path:
-            print(f"❌ No .txt files found in {txt_output_dir}")
+            print(f"❌ No .txt files found in {settings['txt_output_dir']}")
             exit(1)
         else:
             # Find all the unique attribute lines and present them, this is only as a control
@@ -303,21 +472,75 @@ def run_adru_txt_conversion():
                 print("✅ All DRU attributes are already in the database schema.")
 
             # Verify that the txt file content has not all ready been added to the database
-            if is_txt_content_in_db_with_entries(db_file, amf_id):
+            if is_txt_content_complete_in_db(file_db, amf_id):
                 print(f"✅ All messages from {newest_txt_file_path.name} are already in the database.")
-                continue
+            else:
+                # Messages are committed in batches, remove the messages of an insert that was stopped
+                if is_txt_content_in_db_with_entries(file_db, amf_id):
+                    print(f"⚠️ Only some messages from {newest_txt_file_path.name} are in the database, "
+                          f"inserting them again.")
+                    delete_file_messages(file_db, amf_id)
+
+                # Read the file and for each MSG add a row to it in the database, the offset index is made in
+                # the same read
+                offsets = MessageOffsets() if settings["message_offsets_enabled"] else None
+                insert_messages_from_txt(newest_txt_file_path, file_db, amf_id, total_messages,
+                                         settings["commit_every"], settings["delta_keyframe_interval"], offsets)
+                if offsets is not None:
+                    store_message_offsets(file_db, amf_id, offsets)
+
+            finalize_ingested_file(adru_file, newest_txt_file_path, amf_id)
+
+    checkpoint_all_databases()
+
+
+def select_adru_file(action: str, cancel_name: str) -> dict | None:
+    # Fetch ADRU files with known txt files, from the shard catalog in sharded mode
+    if settings["sharding_mode"]:
+        adru_files_list = list_sharded_files(settings["catalog_file"])
+    else:
+        adru_files_list = get_all_adru_files_that_has_txt_files_and_latest_txt(db_file)
+
+    if not adru_files_list:
+        print("\n❌ No ADRU .txt files found.")
+        print("🛠 Please run the ADRU decoder first using option 1 in the main menu.")
+        print("🔙 Returning to main menu.\n")
+        return None
+
+    # Show available ADRU options, with an overview from the newest summarized decode of each file
+    summaries = {} if settings["sharding_mode"] else {summary["af_id"]: summary
+                                                      for summary in get_file_summaries(db_file)}
+    print("\n📂 Available ADRU files with known .txt files:")
+    for i, adru_file in enumerate(adru_files_list, start=1):
+        if settings["sharding_mode"]:
+            summary = next(iter(get_file_summaries(adru_file['db_path'], [adru_file['amf_id']])), None)
+        else:
+            summary = summaries.get(adru_file['file_id'])
+        if summary:
+            print(f"{i}. {adru_file['file_name']} ({summary['message_count']} messages, {summary['start_time']} -> "
+                  f"{summary['end_time']}, max speed {summary['max_speed']}, {summary['mode_changes']} mode changes, "
+                  f"{summary['error_count']} errors)")
+        else:
+            print(f"{i}. {adru_file['file_name']}")
+
+    adru_choice = None
+    while adru_choice not in [str(i) for i in range(1, len(adru_files_list) + 1)] and adru_choice != 'q':
+        adru_choice = input(f"\nEnter the number of the ADRU file to {action} (or 'q' to quit): ").strip()
 
-            # Read the file and for each MSG add a row to it in the database
-            insert_messages_from_txt(newest_txt_file_path, db_file, amf_id, total_messages)
+    if adru_choice == 'q':
+        print(f"🔙 {cancel_name} cancelled. Returning to main menu.")
+        return None
+
+    return adru_files_list[int(adru_choice) - 1]
 
 
 def run_csv_txt_merge_conversion():
     # Scan csv raw for csv files
-    all_csv_files = list(Path(csv_raw_dir).glob("*.csv"))
+    all_csv_files = list(Path(settings["csv_raw_dir"]).glob("*.csv"))
 
     if not all_csv_files:
         print("\n❌ No CSV files found in the input directory.")
-        print(f"📁 Please add CSV files to this folder: {csv_raw_dir}")
+        print(f"📁 Please add CSV files to this folder: {settings['csv_raw_dir']}")
         print("🔙 Returning to main menu.\n")
         return
 
@@ -337,30 +560,10 @@ def run_csv_txt_merge_conversion():
     # Get selected CSV file
     selected_csv = all_csv_files[int(csv_choice) - 1]
 
-    # Fetch ADRU files with known txt files
-    adru_files_list = get_all_adru_files_that_has_txt_files_and_latest_txt(db_file)
-
-    if not adru_files_list:
-        print("\n❌ No ADRU .txt files found.")
-        print("🛠 Please run the ADRU decoder first using option 1 in the main menu.")
-        print("🔙 Returning to main menu.\n")
-        return
-
-    # Show available ADRU options
-    print("\n📂 Available ADRU files with known .txt files:")
-    for i, adru_file in enumerate(adru_files_list, start=1):
-        print(f"{i}. {adru_file['file_name']}")
-
-    adru_choice = None
-    while adru_choice not in [str(i) for i in range(1, len(adru_files_list) + 1)] and adru_choice != 'q':
-        adru_choice = input("\nEnter the number of the ADRU file to merge with the CSV (or 'q' to quit): ").strip()
-
-    if adru_choice == 'q':
-        print("🔙 Merge cancelled. Returning to main menu.")
-        return
-
     # Fetch selected ADRU file
-    selected_adru = adru_files_list[int(adru_choice) - 1]
+    selected_adru = select_adru_file("merge with the CSV", "Merge")
+    if not selected_adru:
+        return
 
     # Read selected CSV file
     df = pd.read_csv(selected_csv, delimiter=";", index_col=False)
@@ -370,7 +573,8 @@ def run_csv_txt_merge_conversion():
         df.drop(columns=df.columns[0], inplace=True)
 
     # Fetch data from db for the selected ADRU file based on the entries in the csv
-    updated_df = enrich_dataframe_with_db_values(df, db_file, selected_adru['file_id'])
+    selected_db = selected_adru.get('db_path', db_file)
+    updated_df = enrich_dataframe_with_db_values(df, selected_db, selected_adru['file_id'])
 
     # Drop the columns that are completely empty
     print("🛠 Removing empty cells.")
@@ -380,10 +584,10 @@ def run_csv_txt_merge_conversion():
     print(updated_df.columns.tolist())
 
     # Ensure output directory exists
-    Path(csv_output_dir).mkdir(parents=True, exist_ok=True)
+    Path(settings["csv_output_dir"]).mkdir(parents=True, exist_ok=True)
 
     # Save new merged file in the csv_out dir
-    print(f"\n📂 Saving merged CSV to: {csv_output_dir}")
+    print(f"\n📂 Saving merged CSV to: {settings['csv_output_dir']}")
 
     # Create timestamp string
     timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S (U)")
@@ -392,20 +596,171 @@ def run_csv_txt_merge_conversion():
     output_filename = f"{timestamp_str} Merged, {selected_csv.name}"
 
     # Save to output path
-    output_path = Path(csv_output_dir) / output_filename
+    output_path = Path(settings["csv_output_dir"]) / output_filename
     updated_df.to_csv(output_path, index=False, sep=";")
 
     print(f"✅ Merged CSV saved successfully: {output_path.name}")
 
 
+def run_jsonl_export():
+    selected_adru = select_adru_file("export to JSON Lines", "Export")
+    if not selected_adru:
+        return
+
+    selected_db = selected_adru.get('db_path', db_file)
+    amf_id = get_newest_amf_id(selected_db, selected_adru['file_id'])
+    if amf_id is None:
+        print(f"❌ No decoded file found for {selected_adru['file_name']}")
+        return
+
+    # Stream the messages of the newest decode to the output folder
+    output_dir = Path(settings["json_output_dir"])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f"{Path(selected_adru['file_name']).stem}_{amf_id}.jsonl"
+    print(f"\n📤 Exporting {selected_adru['file_name']} to {output_path.name}...")
+    message_count = export_file_to_jsonl(selected_db, amf_id, output_path, settings["json_compression"])
+    print(f"✅ Exported {message_count} messages to {output_dir}")
+
+
+def run_message_text_search():
+    text = input("\nEnter the text to search for (or 'q' to quit): ").strip()
+    if not text or text == 'q':
+        print("🔙 Search cancelled. Returning to main menu.")
+        return
+
+    # Index files that were added before the search index was enabled, and search each database (shard)
+    hits = []
+    for search_db in get_all_databases():
+        build_fts_index(search_db)
+        hits.extend(search_message_text(search_db, text, limit=500 - len(hits)))
+        if len(hits) >= 500:
+            break
+
+    if not hits:
+        print(f"\n❌ No messages found containing: {text}")
+        return
+
+    print(f"\n🔎 Found {len(hits)} matching attributes:")
+    for hit in hits:
+        print(f"{hit['af_name']} | Msg {hit['am_local_id']} | {hit['section'].upper()} {hit['attribute']}: "
+              f"{hit['value']}")
+
+
+def select_decode(selected_adru: dict, label: str) -> int | None:
+    # Let the user pick one of the decodes of an ADRU file, the newest is the default
+    selected_db = selected_adru.get('db_path', db_file)
+    decodes = get_message_files_for_adru(selected_db, selected_adru['file_id'])
+    if not decodes:
+        print(f"❌ No decoded file found for {selected_adru['file_name']}")
+        return None
+    if len(decodes) == 1:
+        return decodes[0]['amf_id']
+
+    print(f"\n📄 Decodes of {selected_adru['file_name']}:")
+    for i, decode in enumerate(decodes, start=1):
+        print(f"{i}. {decode['name']} ({decode['message_count']} messages, {decode['created_at']})")
+
+    decode_choice = input(f"\nEnter the number of the {label} decode (default 1): ").strip() or "1"
+    while decode_choice not in [str(i) for i in range(1, len(decodes) + 1)]:
+        decode_choice = input(f"Enter a number between 1 and {len(decodes)}: ").strip()
+    return decodes[int(decode_choice) - 1]['amf_id']
+
+
+def run_decode_comparison():
+    # Pick the old and the new decode, from the same ADRU file (e.g. a newer subset) or from two recordings
+    old_adru = select_adru_file("use as the old file", "Comparison")
+    if not old_adru:
+        return
+    old_amf_id = select_decode(old_adru, "old")
+    new_adru = select_adru_file("use as the new file", "Comparison")
+    if not new_adru or old_amf_id is None:
+        return
+    new_amf_id = select_decode(new_adru, "new")
+    if new_amf_id is None:
+        return
+
+    print(f"\n🔀 Comparing {old_adru['file_name']} ({old_amf_id}) with {new_adru['file_name']} ({new_amf_id})...")
+    diffs = diff_message_files(old_adru.get('db_path', db_file), old_amf_id, new_adru.get('db_path', db_file),
+                               new_amf_id)
+    summary = summarize_diff(diffs)
+
+    if not summary['added'] and not summary['removed'] and not summary['changed']:
+        print("✅ The messages are identical.")
+        return
+
+    print(f"\n📊 {summary['changed']} changed, {summary['added']} added and {summary['removed']} removed messages")
+    print("Most changed attributes:")
+    for attribute, count in list(summary['attributes'].items())[:20]:
+        print(f"  {attribute}: {count} messages")
+
+
+def run_database_cleanup():
+    keep_decodes = settings["retention"].get("keep_decodes", 1)
+    archive_dir = settings["retention"].get("archive_dir")
+    action = f"archived to {archive_dir}" if archive_dir else "deleted"
+
+    confirm = input(f"\nOnly the newest {keep_decodes} decode(s) of each ADRU file are kept, older decodes are "
+                    f"{action}. Continue? (y/n): ").strip().lower()
+    if confirm != "y":
+        print("🔙 Cleanup cancelled. Returning to main menu.")
+        return
+
+    for cleanup_db in get_all_databases():
+        apply_retention(cleanup_db, keep_decodes, Path(archive_dir) if archive_dir else None,
+                        settings["json_compression"], compact=False)
+        compact_database(cleanup_db, convert=settings["retention"].get("convert_to_incremental_vacuum", False))
+
+    print("✅ Cleanup done.")
+
+
+def run_event_listing():
+    selected_adru = select_adru_file("show the events of", "Event listing")
+    if not selected_adru:
+        return
+
+    selected_db = selected_adru.get('db_path', db_file)
+    amf_id = get_newest_amf_id(selected_db, selected_adru['file_id'])
+    if amf_id is None:
+        print(f"❌ No decoded file found for {selected_adru['file_name']}")
+        return
+
+    # Files added before event detection was enabled get their events now
+    extract_file_events(selected_db, amf_id)
+
+    event_types = list(EVENT_RULES)
+    print("\n🚨 Event types:")
+    for i, event_type in enumerate(event_types, start=1):
+        print(f"{i}. {event_type}")
+    type_choice = input("\nEnter the number of the event type (or press enter for all): ").strip()
+    event_type = event_types[int(type_choice) - 1] if type_choice in [str(i) for i in range(1, len(event_types) + 1)] \
+        else None
+
+    events = get_events(selected_db, event_type, amf_id)
+    if not events:
+        print("\n✅ No events found.")
+        return
+
+    print(f"\n🚨 {len(events)} events in {selected_adru['file_name']}:")
+    for event in events:
+        change = f"{event['previous_value']} -> {event['value']}" if event['previous_value'] is not None \
+            else event['value']
+        print(f"{event['type']} | Msg {event['start_local_id']}-{event['end_local_id']} | "
+              f"{event['start_time'] or '-'} | {change}")
+
+
 def show_main_menu():
     print("\n====== ADRU Decoder Menu ======\n")
     print("1. 🧾 Generate .txt from .adru and insert into DB")
     print("2. 📎 Merge CSV with .txt")
     print("3. 📈 Generate statistic based on database values (Coming soon)")
-    print("4. ❌ Exit")
+    print("4. 🔎 Search message text")
+    print("5. 📤 Export ADRU messages to JSON Lines")
+    print("6. 🔀 Compare two decodes")
+    print("7. 🧹 Remove old decodes and compact the database")
+    print("8. 🚨 Show events of an ADRU file")
+    print("9. ❌ Exit")
 
-    choice = input("\nEnter your choice (1-4): ").strip()
+    choice = input("\nEnter your choice (1-9): ").strip()
 
     if choice == "1":
         run_adru_txt_conversion()
@@ -414,10 +769,23 @@ def show_main_menu():
     elif choice == "3":
         run_statistic_generation()
     elif choice == "4":
+        run_message_text_search()
+    elif choice == "5":
+        run_jsonl_export()
+    elif choice == "6":
+        run_decode_comparison()
+    elif choice == "7":
+        run_database_cleanup()
+    elif choice == "8":
+        run_event_listing()
+    elif choice == "9":
         print("\n👋 Exiting program. Goodbye!")
     else:
-        print("❌ Invalid choice. Please enter 1, 2, 3 or 4.")
+        print("❌ Invalid choice. Please enter a number between 1 and 9.")
 
 
 if __name__ == "__main__":
+    # Setup is only done here, so the parser processes do not run it again when they import this module
+    load_config()
+    initialize_databases()
     show_main_menu()
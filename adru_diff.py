@@ -0,0 +1,218 @@
+import hashlib
+import json
+from pathlib import Path
+
+from adru_db_utils import connect_db, fetch_messages_by_id, iter_file_messages, table_exists, get_populated_columns
+
+
+def ensure_message_fingerprint_table(db_path: Path):
+    """
+    Creates the table with the fingerprint of each message, if it does not exist.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+    """
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_message_fingerprint (
+                amfp_amf_id INTEGER,
+                amfp_local_id INTEGER,
+                amfp_am_id INTEGER,
+                amfp_hash INTEGER,
+                PRIMARY KEY (amfp_amf_id, amfp_local_id, amfp_am_id)
+            ) WITHOUT ROWID
+        """)
+
+
+def message_fingerprint(message: dict) -> int:
+    """
+    Returns a 64 bit hash of the JRU, ETCS and DRU attributes of a message from iter_file_messages. Two
+    messages with the same non null attribute values get the same fingerprint.
+
+    Args:
+        message (dict): Message with the "jru", "etcs" and "dru" sections
+
+    Returns:
+        int: Signed 64 bit fingerprint, so it fits in an SQLite INTEGER
+    """
+    content = json.dumps([message.get("jru"), message.get("etcs"), message.get("dru")],
+                         sort_keys=True, ensure_ascii=False)
+    digest = hashlib.blake2b(content.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def build_message_fingerprints(db_path: Path, amf_id: int, chunk_size: int = 5000) -> int:
+    """
+    Stores the fingerprint of each message of a decoded file. The fingerprints are only computed again if
+    the number of messages of the file changed since they were stored.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        chunk_size (int): Number of fingerprints inserted per transaction
+
+    Returns:
+        int: Number of fingerprints computed, 0 if they were up to date
+    """
+    ensure_message_fingerprint_table(db_path)
+    # Reading only the populated columns instead of the hundreds of columns of the section tables is what
+    # makes the fingerprints fast
+    columns = get_populated_columns(db_path, amf_id)
+
+    conn = connect_db(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM adru_messages WHERE am_amf_id = ?", (amf_id,))
+    message_count = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM adru_message_fingerprint WHERE amfp_amf_id = ?", (amf_id,))
+    if cursor.fetchone()[0] == message_count:
+        conn.close()
+        return 0
+
+    cursor.execute("DELETE FROM adru_message_fingerprint WHERE amfp_amf_id = ?", (amf_id,))
+    rows = []
+    computed = 0
+    for message in iter_file_messages(db_path, amf_id, chunk_size, columns):
+        rows.append((amf_id, message["am_local_id"], message["am_id"], message_fingerprint(message)))
+        if len(rows) >= chunk_size:
+            cursor.executemany("INSERT INTO adru_message_fingerprint VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+            computed += len(rows)
+            rows = []
+    if rows:
+        cursor.executemany("INSERT INTO adru_message_fingerprint VALUES (?, ?, ?, ?)", rows)
+        computed += len(rows)
+    conn.commit()
+    conn.close()
+
+    return computed
+
+
+def delete_message_fingerprints(db_path: Path, amf_id: int):
+    """
+    Deletes the stored fingerprints of a decoded file.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+    """
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        if table_exists(cursor, "adru_message_fingerprint"):
+            cursor.execute("DELETE FROM adru_message_fingerprint WHERE amfp_amf_id = ?", (amf_id,))
+    conn.close()
+
+
+def _iter_fingerprints(cursor, amf_id: int, chunk_size: int):
+    # (local_id, am_id, fingerprint) in am_local_id order
+    cursor.execute("""
+        SELECT amfp_local_id, amfp_am_id, amfp_hash FROM adru_message_fingerprint
+        WHERE amfp_amf_id = ?
+        ORDER BY amfp_local_id, amfp_am_id
+    """, (amf_id,))
+    while rows := cursor.fetchmany(chunk_size):
+        yield from rows
+
+
+def _diff_sections(old_message: dict, new_message: dict) -> dict:
+    changes = {}
+    for section in ("jru", "etcs", "dru"):
+        old_data = old_message.get(section, {})
+        new_data = new_message.get(section, {})
+        section_changes = {
+            attribute: [old_data.get(attribute), new_data.get(attribute)]
+            for attribute in old_data.keys() | new_data.keys()
+            if old_data.get(attribute) != new_data.get(attribute)
+        }
+        if section_changes:
+            changes[section] = dict(sorted(section_changes.items()))
+    return changes
+
+
+def diff_message_files(old_db_path: Path, old_amf_id: int, new_db_path: Path, new_amf_id: int,
+                       chunk_size: int = 2000):
+    """
+    Compares two decoded files message by message, matched on am_local_id. The stored fingerprints of both
+    files are compared first, and only the messages with a different fingerprint are read from the
+    database and compared attribute by attribute. The files can be in different databases (shards).
+
+    Args:
+        old_db_path (Path): Database with the old file
+        old_amf_id (int): amf_id of the old file
+        new_db_path (Path): Database with the new file
+        new_amf_id (int): amf_id of the new file
+        chunk_size (int): Number of changed messages read from the databases at a time
+
+    Yields:
+        dict: { am_local_id, status: "added" | "removed" | "changed", changes: { section: { attribute: [old, new] } } }
+            in am_local_id order, identical messages are left out
+    """
+    build_message_fingerprints(old_db_path, old_amf_id)
+    build_message_fingerprints(new_db_path, new_amf_id)
+
+    # Only the attributes that have a value in a file are read from it
+    old_columns = get_populated_columns(old_db_path, old_amf_id)
+    new_columns = get_populated_columns(new_db_path, new_amf_id)
+
+    old_conn = connect_db(old_db_path, read_only=True)
+    new_conn = connect_db(new_db_path, read_only=True)
+    try:
+        old_rows = _iter_fingerprints(old_conn.cursor(), old_amf_id, chunk_size)
+        new_rows = _iter_fingerprints(new_conn.cursor(), new_amf_id, chunk_size)
+        fetch_old, fetch_new = old_conn.cursor(), new_conn.cursor()
+
+        # Merge join on am_local_id, collecting the messages that differ
+        pending = []
+
+        def flush():
+            old_messages = fetch_messages_by_id(fetch_old, [o[1] for _, o, _ in pending if o], old_columns)
+            new_messages = fetch_messages_by_id(fetch_new, [n[1] for _, _, n in pending if n], new_columns)
+            for local_id, old, new in pending:
+                old_message = old_messages.get(old[1], {}) if old else {}
+                new_message = new_messages.get(new[1], {}) if new else {}
+                status = "changed" if old and new else "added" if new else "removed"
+                yield {"am_local_id": local_id, "status": status,
+                       "changes": _diff_sections(old_message, new_message)}
+            pending.clear()
+
+        old, new = next(old_rows, None), next(new_rows, None)
+        while old or new:
+            if new is None or (old and old[0] < new[0]):
+                pending.append((old[0], old, None))
+                old = next(old_rows, None)
+            elif old is None or new[0] < old[0]:
+                pending.append((new[0], None, new))
+                new = next(new_rows, None)
+            else:
+                if old[2] != new[2]:
+                    pending.append((old[0], old, new))
+                old, new = next(old_rows, None), next(new_rows, None)
+
+            if len(pending) >= chunk_size:
+                yield from flush()
+        yield from flush()
+    finally:
+        old_conn.close()
+        new_conn.close()
+
+
+def summarize_diff(diffs) -> dict:
+    """
+    Counts the changes from diff_message_files.
+
+    Args:
+        diffs: Iterable of diffs from diff_message_files
+
+    Returns:
+        dict: { added, removed, changed, attributes: { "section.attribute": number of messages where it changed } }
+    """
+    summary = {"added": 0, "removed": 0, "changed": 0, "attributes": {}}
+    for diff in diffs:
+        summary[diff["status"]] += 1
+        for section, changes in diff["changes"].items():
+            for attribute in changes:
+                key = f"{section}.{attribute}"
+                summary["attributes"][key] = summary["attributes"].get(key, 0) + 1
+
+    summary["attributes"] = dict(sorted(summary["attributes"].items(), key=lambda item: -item[1]))
+    return summary
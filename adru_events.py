@@ -0,0 +1,346 @@
+import fnmatch
+import re
+from datetime import datetime
+from pathlib import Path
+
+from adru_columnar import open_columnar_file
+from adru_db_utils import connect_db, table_exists, get_table_columns, iter_file_messages, SECTION_TABLES, \
+    SUMMARY_SPEED_ATTRIBUTES, SUMMARY_TIME_ATTRIBUTES
+
+# Event rules, name -> rule. Two kinds of rules are supported:
+# - "interval": an event from the first to the last message where the condition holds.
+#   The condition is {"active": (section, attribute)}, true when the value is set and not 0,
+#   or {"above": [(section, attribute), ...], "limit": (section, pattern), "limit_active": (section, pattern)},
+#   true when the first speed attribute with a value is above the lowest limit. The "*" in the limit pattern
+#   matches several attributes, and a limit only counts when its limit_active attribute (the same "*") is active.
+# - "change": an event each time the value of an attribute changes.
+# Attribute values are carried over from the last message that had them, as the recorder only logs states when
+# they are reported. Rules with "hold": False only look at the values in the message itself, for attributes that
+# are only logged when something happens (like reception errors).
+EVENT_RULES = {
+    "emergency_brake": {"kind": "interval", "condition": {"active": ("jru", "M_BIEB_CMD")}},
+    "service_brake": {"kind": "interval", "condition": {"active": ("jru", "M_BISB_CMD")}},
+    "balise_error": {"kind": "interval", "hold": False, "condition": {"active": ("jru", "BALISE_RECEPTION_ERROR")}},
+    "mode_change": {"kind": "change", "attribute": ("jru", "M_MODE")},
+    "level_change": {"kind": "change", "attribute": ("jru", "M_LEVEL")},
+    "overspeed": {
+        "kind": "interval",
+        "condition": {"above": SUMMARY_SPEED_ATTRIBUTES, "limit": ("jru", "V_*_MAX_SPEED"),
+                      "limit_active": ("jru", "V_*_ACTIVE")},
+    },
+}
+
+_NUMBER = re.compile(r"\s*-?\d+(\.\d+)?")
+
+
+def _number(value: str | None) -> float | None:
+    # Same as numeric_sql: the number the value starts with, or None
+    if value is None:
+        return None
+    match = _NUMBER.match(value)
+    return float(match.group()) if match else None
+
+
+def _is_active(value: str | None) -> bool:
+    return value is not None and value.strip() not in ("", "0")
+
+
+class _RuleState:
+    """
+    State machine of one rule over the messages of one file.
+    """
+
+    def __init__(self, name: str, rule: dict, columns: dict[str, list[str]]):
+        self.name = name
+        self.kind = rule["kind"]
+        self.hold = rule.get("hold", True)
+        self.start = None
+        self.end = None
+        self.count = 0
+        self.previous = None
+
+        if self.kind == "change":
+            self.attribute = rule["attribute"]
+            return
+
+        condition = rule["condition"]
+        self.active_attribute = condition.get("active")
+        self.speed_attributes = condition.get("above", [])
+        self.limits = []
+        if "limit" in condition:
+            section, pattern = condition["limit"]
+            active_section, active_pattern = condition.get("limit_active", (None, None))
+            for attr in fnmatch.filter(columns.get(section, []), pattern):
+                active = None
+                if active_pattern:
+                    # The part that matched "*" in the limit, used to find its active flag
+                    wildcard = re.fullmatch(re.escape(pattern).replace(r"\*", "(.*)"), attr).group(1)
+                    active = (active_section, active_pattern.replace("*", wildcard))
+                    if active[1] not in columns.get(active_section, []):
+                        active = None
+                self.limits.append(((section, attr), active))
+
+    def attributes(self) -> set:
+        # The (section, attribute) values this rule reads
+        if self.kind == "change":
+            return {self.attribute}
+        needed = set(self.speed_attributes)
+        if self.active_attribute:
+            needed.add(self.active_attribute)
+        for limit, active in self.limits:
+            needed.add(limit)
+            if active:
+                needed.add(active)
+        return needed
+
+    def _value(self, values: dict):
+        # The value of the condition, or None when it does not hold
+        if self.active_attribute:
+            value = values.get(self.active_attribute)
+            return value if _is_active(value) else None
+
+        speed = next((_number(values.get(a)) for a in self.speed_attributes if _number(values.get(a)) is not None),
+                     None)
+        # A limit counts when its active flag is set, or when the flag is not logged
+        limits = [_number(values.get(limit)) for limit, active in self.limits
+                  if active is None or values.get(active) is None or _is_active(values.get(active))]
+        limits = [limit for limit in limits if limit is not None]
+        if speed is None or not limits or speed <= min(limits):
+            return None
+        return f"{speed:g} > {min(limits):g}"
+
+    def feed(self, message: tuple, values: dict, current: dict) -> dict | None:
+        """
+        Moves the state machine with the next message. message is (am_id, local_id, time), values has the
+        carried over attribute values and current the values in this message.
+
+        Returns:
+            dict | None: The event that ended or happened at this message
+        """
+        if not self.hold:
+            values = current
+
+        if self.kind == "change":
+            value = values.get(self.attribute)
+            if value is None or value == self.previous:
+                return None
+            previous, self.previous = self.previous, value
+            if previous is None:
+                return None
+            return {"type": self.name, "start": message, "end": message, "value": value, "previous": previous,
+                    "message_count": 1}
+
+        value = self._value(values)
+        if value is not None:
+            if self.start is None:
+                self.start, self.previous, self.count = message, value, 0
+            self.end = message
+            self.count += 1
+            return None
+
+        return self.close()
+
+    def close(self) -> dict | None:
+        """
+        Ends the interval that is still open at the end of the file.
+        """
+        if self.kind == "change" or self.start is None:
+            return None
+        event = {"type": self.name, "start": self.start, "end": self.end, "value": self.previous, "previous": None,
+                 "message_count": self.count}
+        self.start = None
+        return event
+
+
+def iter_message_events(db_path: Path, amf_id: int, rules: dict | None = None, chunk_size: int = 5000):
+    """
+    Runs the event rules over the messages of a decoded file in am_local_id order. Only the attributes
+    used by the rules are read, in chunks, from the columnar copy of the file when it is up to date.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        rules (dict | None): Event rules, EVENT_RULES if None
+        chunk_size (int): Number of messages read per query
+
+    Yields:
+        dict: { type, start: (am_id, local_id, time), end: (am_id, local_id, time), value, previous,
+            message_count }
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        columns = {
+            section: [c for c in get_table_columns(cursor, table) if c not in (f"{prefix}_id", f"{prefix}_am_id")]
+            for section, (table, prefix) in SECTION_TABLES.items()
+        }
+    conn.close()
+
+    states = [_RuleState(name, rule, columns) for name, rule in (rules or EVENT_RULES).items()]
+    needed = set().union(*(state.attributes() for state in states)) | {("jru", a) for a in SUMMARY_TIME_ATTRIBUTES}
+    read_columns = {section: sorted(a for s, a in needed if s == section and a in columns[section])
+                    for section in SECTION_TABLES}
+    time_attributes = [("jru", a) for a in SUMMARY_TIME_ATTRIBUTES]
+
+    # The columnar copy of the file has the same values without reading the rows of the database
+    columnar = open_columnar_file(db_path, amf_id)
+    messages = columnar.iter_messages(read_columns, chunk_size) if columnar is not None \
+        else iter_file_messages(db_path, amf_id, chunk_size, read_columns)
+
+    values = {}
+    for message in messages:
+        current = {(section, attr): value
+                   for section in SECTION_TABLES for attr, value in message.get(section, {}).items()}
+        values.update(current)
+
+        time = None
+        if all(values.get(a) is not None for a in time_attributes[:6]):
+            time = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}.{:03d}".format(
+                *(int(_number(values.get(a)) or 0) for a in time_attributes))
+
+        position = (message["am_id"], message["am_local_id"], time)
+        for state in states:
+            event = state.feed(position, values, current)
+            if event:
+                yield event
+
+    for state in states:
+        event = state.close()
+        if event:
+            yield event
+
+
+def ensure_event_tables(db_path: Path):
+    """
+    Creates the events table and the table with the files the events were extracted for, if they do not
+    exist.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+    """
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_event (
+                ae_id INTEGER PRIMARY KEY,
+                ae_amf_id INTEGER,
+                ae_type TEXT,
+                ae_start_am_id INTEGER,
+                ae_start_local_id INTEGER,
+                ae_start_time TEXT,
+                ae_end_am_id INTEGER,
+                ae_end_local_id INTEGER,
+                ae_end_time TEXT,
+                ae_message_count INTEGER,
+                ae_value TEXT,
+                ae_previous_value TEXT,
+                FOREIGN KEY (ae_amf_id) REFERENCES adru_message_file (amf_id)
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_adru_event_type ON adru_event (ae_type, ae_amf_id, ae_start_local_id)
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_adru_event_file ON adru_event (ae_amf_id, ae_start_local_id)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_event_extracted (
+                aee_amf_id INTEGER PRIMARY KEY,
+                aee_message_count INTEGER,
+                aee_event_count INTEGER,
+                aee_created_at TIMESTAMP,
+                FOREIGN KEY (aee_amf_id) REFERENCES adru_message_file (amf_id)
+            )
+        """)
+
+
+def extract_file_events(db_path: Path, amf_id: int, force: bool = False) -> int:
+    """
+    Detects the events of a decoded file and stores them in adru_event. Files are only processed again if
+    their number of messages changed, unless force is set.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        force (bool): Extract the events even if they are up to date
+
+    Returns:
+        int: Number of stored events, 0 if they were up to date
+    """
+    ensure_event_tables(db_path)
+
+    conn = connect_db(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM adru_messages WHERE am_amf_id = ?", (amf_id,))
+    message_count = cursor.fetchone()[0]
+    cursor.execute("SELECT aee_message_count FROM adru_event_extracted WHERE aee_amf_id = ?", (amf_id,))
+    row = cursor.fetchone()
+    if row and row[0] == message_count and not force:
+        conn.close()
+        return 0
+
+    print(f"🚨 Detecting events for amf_id {amf_id}...")
+    rows = [
+        (amf_id, event["type"], *event["start"], *event["end"], event["message_count"], event["value"],
+         event["previous"])
+        for event in iter_message_events(db_path, amf_id)
+    ]
+
+    cursor.execute("DELETE FROM adru_event WHERE ae_amf_id = ?", (amf_id,))
+    cursor.executemany("""
+        INSERT INTO adru_event (ae_amf_id, ae_type, ae_start_am_id, ae_start_local_id, ae_start_time, ae_end_am_id,
+                                ae_end_local_id, ae_end_time, ae_message_count, ae_value, ae_previous_value)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    cursor.execute("""
+        INSERT OR REPLACE INTO adru_event_extracted (aee_amf_id, aee_message_count, aee_event_count, aee_created_at)
+        VALUES (?, ?, ?, ?)
+    """, (amf_id, message_count, len(rows), datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
+
+    print(f"✅ Stored {len(rows)} events.")
+    return len(rows)
+
+
+def get_events(db_path: Path, event_type: str | None = None, amf_id: int | None = None,
+               limit: int = 1000) -> list[dict]:
+    """
+    Fetches stored events, by type and/or file, in message order. Uses the indexes on adru_event.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        event_type (str | None): Only events of this type (a name in EVENT_RULES)
+        amf_id (int | None): Only events of this decoded file
+        limit (int): Max number of events
+
+    Returns:
+        list[dict]: [{ amf_id, af_name, type, start_local_id, start_time, end_local_id, end_time, message_count,
+            value, previous_value }]
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        if not table_exists(cursor, "adru_event"):
+            return []
+
+        conditions, params = [], []
+        if event_type is not None:
+            conditions.append("e.ae_type = ?")
+            params.append(event_type)
+        if amf_id is not None:
+            conditions.append("e.ae_amf_id = ?")
+            params.append(amf_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        cursor.execute(f"""
+            SELECT e.ae_amf_id, af.af_name, e.ae_type, e.ae_start_local_id, e.ae_start_time, e.ae_end_local_id,
+                   e.ae_end_time, e.ae_message_count, e.ae_value, e.ae_previous_value
+            FROM adru_event e
+            JOIN adru_message_file mf ON mf.amf_id = e.ae_amf_id
+            JOIN adru_file af ON af.af_id = mf.amf_af_id
+            {where}
+            ORDER BY e.ae_amf_id, e.ae_start_local_id
+            LIMIT ?
+        """, (*params, limit))
+        rows = cursor.fetchall()
+
+    keys = ("amf_id", "af_name", "type", "start_local_id", "start_time", "end_local_id", "end_time",
+            "message_count", "value", "previous_value")
+    return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from adru_cache import get_cached_result, store_cached_result
+from adru_db_utils import iter_file_messages, get_populated_columns, get_file_version
+from adru_utils import open_compressed_writer, COMPRESSION_SUFFIXES
+
+
+def iter_jsonl_lines(db_path: Path, amf_id: int, chunk_size: int = 2000):
+    """
+    Streams the messages of a decoded file as JSON Lines, one JSON object per message in am_local_id order.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        chunk_size (int): Number of messages fetched from the database per query
+
+    Yields:
+        str: One JSON object per message, ending with a newline
+    """
+    # Only the attributes that have a value in the file are read
+    columns = get_populated_columns(db_path, amf_id)
+    for message in iter_file_messages(db_path, amf_id, chunk_size, columns):
+        yield json.dumps(message, ensure_ascii=False) + "\n"
+
+
+def _is_unchanged_export(previous: dict) -> bool:
+    # The earlier export file still exists and was not modified since it was written
+    try:
+        stat = os.stat(previous["path"])
+    except OSError:
+        return False
+    return stat.st_size == previous["size"] and stat.st_mtime_ns == previous["mtime_ns"]
+
+
+def export_file_to_jsonl(db_path: Path, amf_id: int, output_path: Path, compression: str | None = None) -> int:
+    """
+    Exports all messages of a decoded file to a JSON Lines file. The file is written to a temporary name
+    first, so a partly written export is never mistaken for a complete one. When the same version of the file
+    was exported before and that export is unchanged, it is copied instead of read from the database again.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        output_path (Path): Path to the .jsonl file, the compression suffix is added if compression is set
+        compression (str | None): "gz", "zst", "xz" or None
+
+    Returns:
+        int: Number of exported messages
+    """
+    if compression:
+        output_path = output_path.with_name(output_path.name + COMPRESSION_SUFFIXES[compression])
+    tmp_path = output_path.with_name(output_path.name + ".part")
+
+    version = get_file_version(db_path, amf_id)
+    kind = f"jsonl:{compression or ''}"
+    previous = get_cached_result(db_path, amf_id, kind, version)
+    if previous and _is_unchanged_export(previous):
+        if Path(previous["path"]) != output_path.resolve():
+            shutil.copyfile(previous["path"], tmp_path)
+            os.replace(tmp_path, output_path)
+        return previous["message_count"]
+
+    message_count = 0
+    with open_compressed_writer(tmp_path, compression) as out:
+        for line in iter_jsonl_lines(db_path, amf_id):
+            out.write(line.encode("utf-8"))
+            message_count += 1
+
+    os.replace(tmp_path, output_path)
+
+    stat = output_path.stat()
+    store_cached_result(db_path, amf_id, kind, version, {"path": str(output_path.resolve()), "size": stat.st_size,
+                                                         "mtime_ns": stat.st_mtime_ns, "message_count": message_count})
+    return message_count
+
+
+def export_files_to_jsonl(db_path: Path, files: list[tuple[int, str]], output_dir: Path,
+                          compression: str | None = None, workers: int | None = None) -> list[Path]:
+    """
+    Exports several decoded files to JSON Lines at the same time, one process per file.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        files (list[tuple[int, str]]): (amf_id, output file name without suffix) for each file
+        output_dir (Path): Folder for the .jsonl files
+        compression (str | None): "gz", "zst", "xz" or None
+        workers (int | None): Number of processes (default: CPU count)
+
+    Returns:
+        list[Path]: Paths to the written files
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    suffix = ".jsonl" + (COMPRESSION_SUFFIXES[compression] if compression else "")
+    written = []
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = {
+            pool.submit(export_file_to_jsonl, db_path, amf_id, output_dir / f"{name}.jsonl", compression):
+                output_dir / f"{name}{suffix}"
+            for amf_id, name in files
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            print(f"✅ Exported {future.result()} messages to {path.name}")
+            written.append(path)
+
+    return written
@@ -0,0 +1,258 @@
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from adru_db_utils import connect_db, table_exists
+from adru_utils import index_txt_messages, read_txt_range, parse_message_block, MessageOffsets
+
+# (db path, amf_id) -> loaded index, so repeated lookups in the same file do not read the index again
+_offset_cache = {}
+
+
+def ensure_message_offset_table(db_path: Path):
+    """
+    Creates the table with the byte offset index of each decoded txt file, if it does not exist.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+    """
+    with connect_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_message_offset (
+                amo_amf_id INTEGER PRIMARY KEY,
+                amo_message_count INTEGER,
+                amo_text_size INTEGER,
+                amo_local_ids BLOB,
+                amo_offsets BLOB,
+                FOREIGN KEY (amo_amf_id) REFERENCES adru_message_file (amf_id)
+            )
+        """)
+    conn.close()
+
+
+def _pack(values) -> bytes:
+    # Differences between consecutive values are small and repeat, so they compress to a few bits each
+    return zlib.compress(np.diff(np.asarray(values, dtype=np.int64), prepend=0).astype("<i8").tobytes(), 1)
+
+
+def _unpack(blob: bytes) -> np.ndarray:
+    return np.cumsum(np.frombuffer(zlib.decompress(blob), dtype="<i8"))
+
+
+def build_message_offsets(db_path: Path, amf_id: int, txt_path: Path, force: bool = False) -> int:
+    """
+    Stores the byte offset of every Msg block of a decoded txt file, so a message can be read from the file
+    with a seek instead of a scan. Files that already have an index are skipped unless force is set.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table for the txt file
+        txt_path (Path): Path to the decoded .txt file (plain or compressed)
+        force (bool): Index the file again even if it has an index
+
+    Returns:
+        int: Number of indexed messages, 0 if the file already had an index
+    """
+    ensure_message_offset_table(db_path)
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM adru_message_offset WHERE amo_amf_id = ?", (amf_id,))
+        indexed = cursor.fetchone() is not None
+    conn.close()
+    if indexed and not force:
+        return 0
+
+    offsets = MessageOffsets()
+    offsets.local_ids, offsets.offsets, offsets.text_size = index_txt_messages(txt_path)
+    return store_message_offsets(db_path, amf_id, offsets)
+
+
+def store_message_offsets(db_path: Path, amf_id: int, offsets: MessageOffsets) -> int:
+    """
+    Stores the offset index that was collected while the file was read for the insert (see
+    insert_messages_from_txt and iter_message_blocks), so the file does not have to be read again.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table for the txt file
+        offsets (MessageOffsets): Byte offsets of the Msg blocks of the file
+
+    Returns:
+        int: Number of indexed messages
+    """
+    ensure_message_offset_table(db_path)
+    with connect_db(db_path) as conn:
+        conn.execute("INSERT OR REPLACE INTO adru_message_offset VALUES (?, ?, ?, ?, ?)",
+                     (amf_id, len(offsets.offsets), offsets.text_size, _pack(offsets.local_ids),
+                      _pack(offsets.offsets)))
+    conn.close()
+
+    forget_message_offsets(db_path, amf_id)
+    return len(offsets.offsets)
+
+
+def forget_message_offsets(db_path: Path, amf_id: int):
+    """
+    Drops the loaded index of a decoded file from memory. Called when the file is removed, SQLite can give
+    its amf_id to a file added later.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+    """
+    _offset_cache.pop((str(db_path), amf_id), None)
+
+
+def load_message_offsets(db_path: Path, amf_id: int) -> dict | None:
+    """
+    Loads the offset index of a decoded file.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+
+    Returns:
+        dict | None: { local_ids, offsets, text_size } with the arrays in file order, None if the file has
+            no index
+    """
+    key = (str(db_path), amf_id)
+    if key in _offset_cache:
+        return _offset_cache[key]
+
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        row = None
+        if table_exists(cursor, "adru_message_offset"):
+            cursor.execute("SELECT amo_local_ids, amo_offsets, amo_text_size FROM adru_message_offset "
+                           "WHERE amo_amf_id = ?", (amf_id,))
+            row = cursor.fetchone()
+    conn.close()
+    if row is None:
+        return None
+
+    local_ids = _unpack(row[0])
+    index = {"local_ids": local_ids, "offsets": _unpack(row[1]), "text_size": row[2]}
+    # Decoded files number their messages 1, 2, 3, ..., then the position of a message is its id minus the
+    # first id. Otherwise the ids are looked up in a sorted copy.
+    index["consecutive"] = len(local_ids) == 0 or bool((np.diff(local_ids) == 1).all())
+    if not index["consecutive"]:
+        index["order"] = np.argsort(local_ids, kind="stable")
+        index["sorted_ids"] = local_ids[index["order"]]
+
+    _offset_cache[key] = index
+    return index
+
+
+def _find_position(index: dict, local_id: int) -> int | None:
+    # Position of the first message with this local_id in file order
+    local_ids = index["local_ids"]
+    if index["consecutive"]:
+        position = local_id - local_ids[0] if len(local_ids) else -1
+        return int(position) if 0 <= position < len(local_ids) else None
+
+    i = np.searchsorted(index["sorted_ids"], local_id)
+    if i < len(local_ids) and index["sorted_ids"][i] == local_id:
+        return int(index["order"][i])
+    return None
+
+
+def _message_span(index: dict, first: int, last: int) -> tuple[int, int]:
+    # Byte range from the start of message number first up to the end of message number last, in file order
+    offsets = index["offsets"]
+    end = last + 1
+    return int(offsets[first]), int(offsets[end]) if end < len(offsets) else index["text_size"]
+
+
+def _read_checked(txt_path: Path, start: int, end: int, local_id: int) -> str:
+    text = read_txt_range(txt_path, start, end)
+    words = text.lstrip().split(None, 2)
+    if len(words) < 2 or words[0] != "Msg" or words[1].rstrip(":") != str(local_id):
+        raise ValueError(f"❌ The offset index does not match {txt_path.name}, build it again with force=True.")
+    return text
+
+
+def read_raw_message(db_path: Path, amf_id: int, txt_path: Path, local_id: int) -> str | None:
+    """
+    Reads the raw text of one Msg block from the decoded txt file with a seek, using the offset index.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table for the txt file
+        txt_path (Path): Path to the decoded .txt file (plain or compressed)
+        local_id (int): The id from the Msg annotation
+
+    Returns:
+        str | None: The text of the message, None if it is not in the file
+    """
+    index = load_message_offsets(db_path, amf_id)
+    if index is None:
+        raise ValueError(f"❌ No offset index for amf_id {amf_id}, run build_message_offsets first.")
+
+    position = _find_position(index, local_id)
+    if position is None:
+        return None
+    return _read_checked(txt_path, *_message_span(index, position, position), local_id)
+
+
+def read_raw_message_range(db_path: Path, amf_id: int, txt_path: Path, first_local_id: int,
+                           last_local_id: int) -> str:
+    """
+    Reads the raw text of the Msg blocks from first_local_id up to and including last_local_id (in file
+    order) with one seek and one read.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table for the txt file
+        txt_path (Path): Path to the decoded .txt file (plain or compressed)
+        first_local_id (int): First message of the range
+        last_local_id (int): Last message of the range
+
+    Returns:
+        str: The text of the messages, empty if one of them is not in the file or last comes before first
+    """
+    index = load_message_offsets(db_path, amf_id)
+    if index is None:
+        raise ValueError(f"❌ No offset index for amf_id {amf_id}, run build_message_offsets first.")
+
+    first = _find_position(index, first_local_id)
+    last = _find_position(index, last_local_id)
+    if first is None or last is None or last < first:
+        return ""
+    return _read_checked(txt_path, *_message_span(index, first, last), first_local_id)
+
+
+def reparse_message_range(db_path: Path, amf_id: int, txt_path: Path, first_local_id: int,
+                          last_local_id: int) -> list[tuple[int, dict, dict, dict]]:
+    """
+    Parses only the messages from first_local_id up to and including last_local_id of a decoded txt file,
+    without reading the rest of the file.
+
+    Returns:
+        list[tuple]: [(local message id, JRU attributes, ETCS attributes, DRU attributes)]
+    """
+    return parse_message_block(read_raw_message_range(db_path, amf_id, txt_path, first_local_id, last_local_id))
+
+
+def sample_raw_messages(db_path: Path, amf_id: int, txt_path: Path, count: int = 10) -> list[tuple[int, str]]:
+    """
+    Reads a preview of a decoded txt file: count messages spread evenly over the file, each with one seek.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table for the txt file
+        txt_path (Path): Path to the decoded .txt file (plain or compressed)
+        count (int): Number of messages in the preview
+
+    Returns:
+        list[tuple[int, str]]: [(local message id, raw text)] in file order
+    """
+    index = load_message_offsets(db_path, amf_id)
+    if index is None:
+        raise ValueError(f"❌ No offset index for amf_id {amf_id}, run build_message_offsets first.")
+
+    local_ids = index["local_ids"]
+    positions = np.unique(np.linspace(0, len(local_ids) - 1, min(count, len(local_ids))).astype(np.int64))
+    return [(int(local_ids[p]), _read_checked(txt_path, *_message_span(index, p, p), int(local_ids[p])))
+            for p in positions]
@@ -0,0 +1,314 @@
+import asyncio
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from adru_db_utils import add_adru_file_to_db, add_message_file_to_db, exist_txt_file_for_adru, \
+    fetch_newest_txt_file_for_adru, is_txt_content_in_db_with_entries, is_txt_content_complete_in_db, \
+    insert_message, get_table_columns, get_completed_manifest, connect_db, delete_file_messages, record_file_columns, \
+    set_delta_storage, MessageDeltaEncoder, SECTION_TABLES
+from adru_offsets import store_message_offsets
+from adru_utils import compute_md5_cached, find_txt_files, get_latest_txt_file, iter_message_blocks, \
+    parse_message_block, prompt_user_and_wait_for_txt, MessageOffsets
+
+# Marks the end of the stream in a queue
+_END = None
+
+
+class MissingAttributesError(Exception):
+    """
+    Raised when a decoded file has attributes that are not columns in the database schema.
+    """
+
+
+def _next_block(blocks):
+    return next(blocks, _END)
+
+
+async def _decode_adru_file(adru_file: Path, output_txt_dir: Path, exe_path: Path | None, input_type: int,
+                            build_command: Callable[[Path, Path, str], str], io_pool: ThreadPoolExecutor) -> Path:
+    """
+    Decodes an ADRU file to a .txt file. Runs the decode tool as a subprocess if exe_path is set, else the
+    user is asked to run the command, like in the sequential conversion.
+    """
+    loop = asyncio.get_running_loop()
+
+    if exe_path is None:
+        command = build_command(adru_file, output_txt_dir, "t")
+        return await loop.run_in_executor(io_pool, prompt_user_and_wait_for_txt, command, output_txt_dir)
+
+    before = set(find_txt_files(output_txt_dir))
+    print(f"🚀 Decoding {adru_file.name}...")
+    process = await asyncio.create_subprocess_exec(
+        str(exe_path), "-i", str(adru_file.parent), "-o", str(output_txt_dir), "-f", adru_file.name,
+        "-it", str(input_type), "-ot", "t",
+        cwd=str(exe_path.parent),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"❌ Decoding {adru_file.name} failed ({process.returncode}): "
+                           f"{stderr.decode(errors='ignore').strip()}")
+
+    new_files = set(find_txt_files(output_txt_dir)) - before
+    new_txt = max(new_files, key=lambda f: f.stat().st_ctime) if new_files else get_latest_txt_file(output_txt_dir)
+    if not new_txt:
+        raise ValueError(f"❌ No .txt file found after decoding {adru_file.name}.")
+    return new_txt
+
+
+async def _prepare_stage(adru_files: list[Path], resolve_db_path: Callable[[Path], Path], output_txt_dir: Path,
+                         exe_path: Path | None, input_type: int, build_command: Callable[[Path, Path, str], str],
+                         io_pool: ThreadPoolExecutor, file_queue: asyncio.Queue):
+    """
+    Registers each ADRU file, decodes it if no known .txt file exists and hands the newest .txt file on
+    to the parse stage. The MD5 hashing runs in the thread pool while the other stages keep working.
+    """
+    loop = asyncio.get_running_loop()
+
+    for adru_file in adru_files:
+        db_path = await loop.run_in_executor(io_pool, resolve_db_path, adru_file)
+
+        # Files that are already in the database are skipped with only a stat and an indexed lookup
+        manifest = await loop.run_in_executor(io_pool, get_completed_manifest, db_path, adru_file)
+        if manifest:
+            print(f"✅ {adru_file.name} is already in the database (amf_id={manifest['amf_id']}).")
+            continue
+
+        # Hash outside of the database calls so the hashing of the next file overlaps with the writer
+        await loop.run_in_executor(io_pool, compute_md5_cached, adru_file)
+        adru_file_id = await loop.run_in_executor(io_pool, add_adru_file_to_db, db_path, adru_file)
+
+        has_txt = await loop.run_in_executor(io_pool, exist_txt_file_for_adru, adru_file_id, db_path,
+                                             output_txt_dir)
+        if not has_txt:
+            print(f"❌ No known .txt file for ADRU file {adru_file.name}. Starting processing.")
+            new_txt = await _decode_adru_file(adru_file, output_txt_dir, exe_path, input_type, build_command,
+                                              io_pool)
+            await loop.run_in_executor(io_pool, compute_md5_cached, new_txt)
+            await loop.run_in_executor(io_pool, add_message_file_to_db, db_path, new_txt, adru_file_id)
+
+        _, txt_path, total_messages, amf_id = await loop.run_in_executor(
+            io_pool, fetch_newest_txt_file_for_adru, adru_file_id, db_path, output_txt_dir)
+        in_db = await loop.run_in_executor(io_pool, is_txt_content_complete_in_db, db_path, amf_id)
+        partial = not in_db and await loop.run_in_executor(io_pool, is_txt_content_in_db_with_entries, db_path,
+                                                           amf_id)
+
+        await file_queue.put({
+            "db_path": db_path,
+            "adru_path": adru_file,
+            "txt_path": txt_path,
+            "amf_id": amf_id,
+            "total_messages": total_messages,
+            "in_db": in_db,
+            "partial": partial,
+        })
+
+    await file_queue.put(_END)
+
+
+async def _parse_stage(file_queue: asyncio.Queue, write_queue: asyncio.Queue, io_pool: ThreadPoolExecutor,
+                       parse_pool: ProcessPoolExecutor, max_blocks_in_flight: int, messages_per_block: int,
+                       message_offsets: bool = False):
+    """
+    Reads each .txt file in blocks of whole messages and parses the blocks in the process pool. The number
+    of blocks in flight is bounded, and the write queue gives backpressure from the writer. The byte offsets
+    of the messages are collected in item["offsets"] during the same read when message_offsets is set.
+    """
+    loop = asyncio.get_running_loop()
+
+    while (item := await file_queue.get()) is not _END:
+        item["offsets"] = MessageOffsets() if message_offsets and not item["in_db"] else None
+        await write_queue.put(("file", item))
+        if item["in_db"]:
+            continue
+
+        blocks = iter_message_blocks(item["txt_path"], messages_per_block, item["offsets"])
+        in_flight = deque()
+        while True:
+            while len(in_flight) < max_blocks_in_flight:
+                block = await loop.run_in_executor(io_pool, _next_block, blocks)
+                if block is _END:
+                    break
+                in_flight.append(loop.run_in_executor(parse_pool, parse_message_block, block))
+
+            if not in_flight:
+                break
+
+            # Keep the message order by always waiting for the oldest block
+            await write_queue.put(("messages", await in_flight.popleft()))
+
+        await write_queue.put(("end", item))
+
+    await write_queue.put(_END)
+
+
+def _open_writer_connection(db_path: Path) -> tuple[sqlite3.Connection, dict[str, set]]:
+    conn = connect_db(db_path)
+    cursor = conn.cursor()
+    columns = {section: set(get_table_columns(cursor, table)) for section, (table, _) in SECTION_TABLES.items()}
+    return conn, columns
+
+
+def _write_messages(conn: sqlite3.Connection, columns: dict[str, set], item: dict, messages: list,
+                    inserted_count: int) -> int:
+    """
+    Inserts a parsed block in its own transaction and returns the new number of inserted messages.
+    """
+    cursor = conn.cursor()
+    present = {section: set() for section in SECTION_TABLES}
+
+    for local_id, jru_data, etcs_data, dru_data in messages:
+        for section, data in (("jru", jru_data), ("etcs", etcs_data), ("dru", dru_data)):
+            missing = sorted(set(data) - columns[section])
+            if missing:
+                raise MissingAttributesError(f"Missing {section.upper()} attributes in "
+                                             f"{item['txt_path'].name}: {missing}")
+            present[section].update(data)
+
+        item["insert"](cursor, item["amf_id"], local_id, jru_data, etcs_data, dru_data)
+
+    record_file_columns(cursor, item["amf_id"], present)
+    conn.commit()
+    inserted_count += len(messages)
+    print(f"\r📝 Inserted {inserted_count} of {item['total_messages']} messages from {item['txt_path'].name}",
+          end="")
+    return inserted_count
+
+
+def _start_file_messages(conn: sqlite3.Connection, item: dict, delta_keyframe_interval: int | None):
+    """
+    Sets the storage mode of a file before its messages are inserted.
+    """
+    set_delta_storage(conn.cursor(), item["amf_id"], delta_keyframe_interval)
+    conn.commit()
+    item["insert"] = MessageDeltaEncoder(delta_keyframe_interval).insert if delta_keyframe_interval \
+        else insert_message
+
+
+def _remove_file_messages(conn: sqlite3.Connection, db_path: Path, amf_id: int):
+    """
+    Removes the messages of a file that could not be inserted completely.
+    """
+    conn.rollback()
+    delete_file_messages(db_path, amf_id)
+
+
+async def _write_stage(write_queue: asyncio.Queue, db_pool: ThreadPoolExecutor,
+                       on_file_done: Callable[[Path, Path, int], None] | None,
+                       delta_keyframe_interval: int | None = None):
+    """
+    The only stage that writes messages. All database work runs on one thread with one connection,
+    a new connection is only opened when a file goes to another database (shard).
+    """
+    loop = asyncio.get_running_loop()
+    conn = columns = conn_db_path = None
+    inserted_count = 0
+    current = None
+
+    try:
+        while (entry := await write_queue.get()) is not _END:
+            kind, payload = entry
+
+            if kind == "file":
+                current = payload
+                inserted_count = 0
+                if payload["db_path"] != conn_db_path:
+                    if conn is not None:
+                        await loop.run_in_executor(db_pool, conn.close)
+                    conn, columns = await loop.run_in_executor(db_pool, _open_writer_connection, payload["db_path"])
+                    conn_db_path = payload["db_path"]
+                if payload["partial"]:
+                    print(f"⚠️ Only some messages from {payload['txt_path'].name} are in the database, "
+                          f"inserting them again.")
+                    await loop.run_in_executor(db_pool, _remove_file_messages, conn, conn_db_path, payload["amf_id"])
+                if payload["in_db"]:
+                    print(f"✅ All messages from {payload['txt_path'].name} are already in the database.")
+                    if on_file_done:
+                        await loop.run_in_executor(db_pool, on_file_done, payload["adru_path"], payload["txt_path"],
+                                                   payload["amf_id"])
+                else:
+                    await loop.run_in_executor(db_pool, _start_file_messages, conn, payload, delta_keyframe_interval)
+            elif kind == "messages":
+                inserted_count = await loop.run_in_executor(db_pool, _write_messages, conn, columns, current,
+                                                            payload, inserted_count)
+            elif kind == "end":
+                print(f"\n✅ All messages from {payload['txt_path'].name} inserted successfully.")
+                if payload["offsets"] is not None:
+                    await loop.run_in_executor(db_pool, store_message_offsets, payload["db_path"], payload["amf_id"],
+                                               payload["offsets"])
+                if on_file_done:
+                    await loop.run_in_executor(db_pool, on_file_done, payload["adru_path"], payload["txt_path"],
+                                               payload["amf_id"])
+                current = None
+    except BaseException:
+        # Do not leave a half inserted file behind, it would be seen as complete on the next run
+        if current is not None and not current["in_db"]:
+            await loop.run_in_executor(db_pool, _remove_file_messages, conn, conn_db_path, current["amf_id"])
+        raise
+    finally:
+        if conn is not None:
+            await loop.run_in_executor(db_pool, conn.close)
+
+
+async def run_adru_pipeline(adru_files: list[Path], db_path: Path, output_txt_dir: Path,
+                            build_command: Callable[[Path, Path, str], str], exe_path: Path | None = None,
+                            input_type: int = 2, on_file_done: Callable[[Path, Path, int], None] | None = None,
+                            queue_size: int = 4, parse_workers: int | None = None, hash_workers: int = 4,
+                            messages_per_block: int = 5000, resolve_db_path: Callable[[Path], Path] | None = None,
+                            delta_keyframe_interval: int | None = None, message_offsets: bool = False):
+    """
+    Runs the ADRU to database conversion as a pipeline, so file N+1 is decoded and hashed while file N is
+    parsed and written. The stages are connected by bounded queues to keep the memory use bounded.
+
+    Stages:
+        prepare: register/hash the ADRU file, run the decode tool, hash the .txt files (thread pool)
+        parse: read blocks of messages and parse them (process pool)
+        write: insert the parsed messages with a single database connection
+
+    Args:
+        adru_files (list[Path]): ADRU files to convert
+        db_path (Path): Path to the SQLite database
+        output_txt_dir (Path): Folder with the decoded .txt files
+        build_command (Callable): Builds the decode command shown to the user when exe_path is None
+        exe_path (Path | None): Decode tool to run as a subprocess, or None to ask the user to run it
+        input_type (int): Input type argument for the decode tool
+        on_file_done (Callable | None): Called with (adru_path, txt_path, amf_id) when a file is in the database
+        queue_size (int): Max number of parsed blocks waiting for the writer
+        parse_workers (int | None): Number of parser processes (default: CPU count)
+        hash_workers (int): Number of threads used for hashing and file I/O
+        messages_per_block (int): Number of messages parsed per block
+        resolve_db_path (Callable | None): Returns the database (shard) for an ADRU file, db_path is used if None
+        delta_keyframe_interval (int | None): Store the messages in delta mode with a keyframe every this many
+            messages, or None for full rows
+        message_offsets (bool): Store the byte offset of every Msg block (adru_message_offset) while the file
+            is read for the insert
+    """
+    parse_workers = parse_workers or os.cpu_count() or 1
+    file_queue = asyncio.Queue(maxsize=1)
+    write_queue = asyncio.Queue(maxsize=queue_size)
+
+    with ThreadPoolExecutor(max_workers=hash_workers) as io_pool, \
+            ThreadPoolExecutor(max_workers=1) as db_pool, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+        tasks = [
+            asyncio.create_task(_prepare_stage(adru_files, resolve_db_path or (lambda _: db_path), output_txt_dir,
+                                               exe_path, input_type, build_command, io_pool, file_queue)),
+            asyncio.create_task(_parse_stage(file_queue, write_queue, io_pool, parse_pool, parse_workers * 2,
+                                             messages_per_block, message_offsets)),
+            asyncio.create_task(_write_stage(write_queue, db_pool, on_file_done, delta_keyframe_interval)),
+        ]
+
+        try:
+            # Stop all stages if one of them fails
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
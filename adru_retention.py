@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from adru_columnar import remove_columnar_cache
+from adru_db_utils import delete_message_file, get_superseded_message_files, compact_database
+from adru_export import export_file_to_jsonl
+from adru_offsets import forget_message_offsets
+
+
+def archive_message_file(db_path: Path, amf_id: int, output_path: Path, compression: str | None = "gz") -> int:
+    """
+    Exports a decoded file to JSON Lines and then removes it from the database. The file is only removed
+    when the export is written completely.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        amf_id (int): ID from adru_message_file table
+        output_path (Path): Path to the .jsonl file, the compression suffix is added if compression is set
+        compression (str | None): "gz", "zst", "xz" or None
+
+    Returns:
+        int: Number of archived messages
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    message_count = export_file_to_jsonl(db_path, amf_id, output_path, compression)
+    delete_message_file(db_path, amf_id)
+    remove_columnar_cache(db_path, amf_id)
+    forget_message_offsets(db_path, amf_id)
+    return message_count
+
+
+def apply_retention(db_path: Path, keep_decodes: int = 1, archive_dir: Path | None = None,
+                    compression: str | None = "gz", compact: bool = True) -> int:
+    """
+    Keeps only the newest decodes of each ADRU file. The older decodes are archived to JSON Lines files in
+    archive_dir first if it is set, and the free space is returned to the file system afterwards.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        keep_decodes (int): Number of decodes to keep per ADRU file
+        archive_dir (Path | None): Folder for the archived decodes, or None to only delete them
+        compression (str | None): Compression of the archive files, "gz", "zst", "xz" or None
+        compact (bool): Run compact_database when decodes were removed
+
+    Returns:
+        int: Number of removed decodes
+    """
+    superseded = get_superseded_message_files(db_path, keep_decodes)
+    if not superseded:
+        print(f"✅ No old decodes in {db_path.name}.")
+        return 0
+
+    for message_file in superseded:
+        if archive_dir:
+            output_path = archive_dir / f"{Path(message_file['af_name']).stem}_{message_file['amf_id']}.jsonl"
+            message_count = archive_message_file(db_path, message_file["amf_id"], output_path, compression)
+            print(f"📦 Archived {message_file['name']} ({message_count} messages) to {archive_dir}")
+        else:
+            delete_message_file(db_path, message_file["amf_id"])
+            remove_columnar_cache(db_path, message_file["amf_id"])
+            forget_message_offsets(db_path, message_file["amf_id"])
+            print(f"🗑️ Removed {message_file['name']} ({message_file['message_count']} messages)")
+
+    if compact:
+        compact_database(db_path)
+
+    return len(superseded)
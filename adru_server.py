@@ -0,0 +1,448 @@
+import json
+import queue
+import re
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+import yaml
+
+from adru_columnar import configure_columnar_cache
+from adru_db_utils import connect_db, table_exists, get_table_columns, fetch_messages_by_id, is_delta_file, \
+    SECTION_TABLES
+from adru_timeseries import build_time_series, DOWNSAMPLE_METHODS
+
+# Max number of messages or rows in one response, use the "next" value of the response for the next page
+MAX_PAGE_SIZE = 10000
+DEFAULT_PAGE_SIZE = 1000
+
+# Number of messages read from the database at a time while a response is streamed
+_STREAM_CHUNK = 500
+
+
+class QueryError(Exception):
+    """
+    A request that can not be answered, sent to the client as a JSON error with the status code.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ReadConnectionPool:
+    """
+    A fixed number of read only connections shared by the request threads. A request waits for a free
+    connection, so the number of open connections never grows with the number of clients.
+    """
+
+    def __init__(self, db_path: Path, size: int = 4):
+        self._connections = queue.Queue()
+        for _ in range(size):
+            self._connections.put(connect_db(db_path, read_only=True, check_same_thread=False))
+
+    @contextmanager
+    def connection(self):
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            self._connections.put(conn)
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get().close()
+
+
+def _page_params(params: dict) -> tuple[tuple[int, int], int | None, int]:
+    # Keyset position (am_local_id, am_id) to continue after, last am_local_id and page size. "after" is the
+    # "next" value of the previous page, or an am_local_id to start after that message.
+    try:
+        position = (-1, -1)
+        if "after" in params:
+            after = params["after"][0].split(":")
+            position = (int(after[0]), int(after[1]) if len(after) > 1 else 2 ** 63 - 1)
+        to = int(params["to"][0]) if "to" in params else None
+        limit = min(int(params.get("limit", [DEFAULT_PAGE_SIZE])[0]), MAX_PAGE_SIZE)
+    except ValueError:
+        raise QueryError(400, "after, to and limit must be numbers")
+    return position, to, max(limit, 1)
+
+
+def _parse_attributes(value: str, table_columns: dict[str, set]) -> dict[str, list[str]]:
+    # "jru.V_TRAIN,etcs.CURRENT_SPEED_1KPH" -> { section: [attribute] }, only existing columns are accepted
+    columns = {section: [] for section in SECTION_TABLES}
+    for name in filter(None, (n.strip() for n in value.split(","))):
+        section, _, attribute = name.partition(".")
+        if section not in table_columns or attribute not in table_columns[section]:
+            raise QueryError(400, f"Unknown attribute: {name}, use section.attribute like jru.V_TRAIN")
+        columns[section].append(attribute)
+    return columns
+
+
+def _message_page_sql(to: int | None) -> str:
+    return f"""
+        SELECT am_id, am_local_id FROM adru_messages
+        WHERE am_amf_id = ? AND (am_local_id, am_id) > (?, ?) {"AND am_local_id <= ?" if to is not None else ""}
+        ORDER BY am_local_id, am_id
+        LIMIT ?
+    """
+
+
+def _check_file(cursor, amf_id: int):
+    cursor.execute("SELECT 1 FROM adru_message_file WHERE amf_id = ?", (amf_id,))
+    if not cursor.fetchone():
+        raise QueryError(404, f"No decoded file with amf_id {amf_id}")
+
+
+def list_files(pool: ReadConnectionPool, params: dict):
+    """
+    GET /files: all decoded files with their summary, newest decode of each ADRU file first.
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        summary = table_exists(cursor, "adru_file_summary")
+        cursor.execute(f"""
+            SELECT mf.amf_id AS amf_id, mf.amf_name AS name, mf.amf_message_count AS message_count,
+                   mf.amf_created_at AS created_at, af.af_id AS af_id, af.af_name AS af_name
+                   {", s.afs_start_time AS start_time, s.afs_end_time AS end_time, s.afs_max_speed AS max_speed"
+                    if summary else ""}
+            FROM adru_message_file mf
+            JOIN adru_file af ON af.af_id = mf.amf_af_id
+            {"LEFT JOIN adru_file_summary s ON s.afs_amf_id = mf.amf_id" if summary else ""}
+            ORDER BY af.af_name, mf.amf_created_at DESC, mf.amf_id DESC
+        """)
+        keys = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+
+    yield json.dumps({"files": [dict(zip(keys, row)) for row in rows]}, ensure_ascii=False)
+
+
+def stream_messages(pool: ReadConnectionPool, params: dict, amf_id: int, table_columns: dict[str, set]):
+    """
+    GET /files/<amf_id>/messages?after=&to=&limit=&attributes=: the messages of a file in am_local_id order,
+    with the non null attributes of each section (or only the given attributes).
+    """
+    position, to, limit = _page_params(params)
+    columns = _parse_attributes(params["attributes"][0], table_columns) if "attributes" in params else None
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        _check_file(cursor, amf_id)
+        yield f'{{"amf_id": {amf_id}, "messages": ['
+
+        sent, last = 0, None
+        while sent < limit:
+            cursor.execute(_message_page_sql(to),
+                           (amf_id, *position, *([to] if to is not None else []), min(_STREAM_CHUNK, limit - sent)))
+            messages = cursor.fetchall()
+            if not messages:
+                break
+
+            section_rows = fetch_messages_by_id(cursor, [am_id for am_id, _ in messages], columns)
+            for am_id, local_id in messages:
+                message = {"am_id": am_id, "am_local_id": local_id, **section_rows.get(am_id, {})}
+                yield ("," if sent else "") + json.dumps(message, ensure_ascii=False)
+                sent += 1
+
+            last = position = messages[-1][1], messages[-1][0]
+            if len(messages) < _STREAM_CHUNK:
+                break
+
+    next_page = f"{last[0]}:{last[1]}" if last and sent == limit else None
+    yield f'], "next": {json.dumps(next_page)}}}'
+
+
+def _delta_attribute_rows(cursor, amf_id: int, columns: dict[str, list[str]], position: tuple[int, int],
+                          to: int | None, limit: int):
+    # The rows of /attributes for a file in delta mode: its stored rows only have the changes, so the messages
+    # are rebuilt page by page and the ones without a value for any of the attributes are skipped
+    sent = 0
+    while sent < limit:
+        cursor.execute(_message_page_sql(to), (amf_id, *position, *([to] if to is not None else []), _STREAM_CHUNK))
+        messages = cursor.fetchall()
+        if not messages:
+            break
+
+        section_rows = fetch_messages_by_id(cursor, [am_id for am_id, _ in messages], columns)
+        rows = []
+        for am_id, local_id in messages:
+            data = section_rows.get(am_id, {})
+            values = [data.get(section, {}).get(a) for section, attributes in columns.items() for a in attributes]
+            if any(value is not None for value in values) and sent + len(rows) < limit:
+                rows.append((am_id, local_id, *values))
+        if rows:
+            yield rows
+            sent += len(rows)
+
+        position = messages[-1][1], messages[-1][0]
+        if len(messages) < _STREAM_CHUNK:
+            break
+
+
+def stream_attribute_rows(pool: ReadConnectionPool, params: dict, amf_id: int, table_columns: dict[str, set]):
+    """
+    GET /files/<amf_id>/attributes?names=&after=&to=&limit=: a projection of some attributes as rows of
+    [am_local_id, value, ...], only the messages where one of the attributes has a value.
+    """
+    if "names" not in params:
+        raise QueryError(400, "names is required, e.g. names=jru.V_TRAIN,etcs.CURRENT_SPEED_1KPH")
+    position, to, limit = _page_params(params)
+    columns = _parse_attributes(params["names"][0], table_columns)
+
+    selected, joins = [], []
+    for section, attributes in columns.items():
+        if attributes:
+            table, prefix = SECTION_TABLES[section]
+            joins.append(f"LEFT JOIN {table} {prefix} ON {prefix}.{prefix}_am_id = m.am_id")
+            selected.extend(f'{prefix}."{a}"' for a in attributes)
+    names = [f"{section}.{a}" for section, attributes in columns.items() for a in attributes]
+    if not selected:
+        raise QueryError(400, "names is empty")
+
+    sql = f"""
+        SELECT m.am_id, m.am_local_id, {", ".join(selected)}
+        FROM adru_messages m
+        {" ".join(joins)}
+        WHERE m.am_amf_id = ? AND (m.am_local_id, m.am_id) > (?, ?) {"AND m.am_local_id <= ?" if to is not None else ""}
+              AND ({" OR ".join(f"{c} IS NOT NULL" for c in selected)})
+        ORDER BY m.am_local_id, m.am_id
+        LIMIT ?
+    """
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        _check_file(cursor, amf_id)
+        yield json.dumps({"amf_id": amf_id, "columns": ["am_local_id", *names]})[:-1] + ', "rows": ['
+
+        if is_delta_file(cursor, amf_id):
+            chunks = _delta_attribute_rows(cursor, amf_id, columns, position, to, limit)
+        else:
+            cursor.execute(sql, (amf_id, *position, *([to] if to is not None else []), limit))
+            chunks = iter(lambda: cursor.fetchmany(_STREAM_CHUNK), [])
+
+        sent, last = 0, None
+        for rows in chunks:
+            for row in rows:
+                yield ("," if sent else "") + json.dumps(row[1:], ensure_ascii=False)
+                sent += 1
+            last = rows[-1]
+
+    next_page = f"{last[1]}:{last[0]}" if last and sent == limit else None
+    yield f'], "next": {json.dumps(next_page)}}}'
+
+
+def file_stats(pool: ReadConnectionPool, params: dict, amf_id: int):
+    """
+    GET /files/<amf_id>/stats: the file summary, the per attribute figures and the number of events per type.
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        _check_file(cursor, amf_id)
+        stats = {"amf_id": amf_id, "summary": None, "attributes": [], "events": {}}
+
+        if table_exists(cursor, "adru_file_summary"):
+            cursor.execute("SELECT * FROM adru_file_summary WHERE afs_amf_id = ?", (amf_id,))
+            row = cursor.fetchone()
+            if row:
+                stats["summary"] = {d[0].split("_", 1)[1]: v for d, v in zip(cursor.description, row)}
+            cursor.execute("""
+                SELECT aas_section, aas_attribute, aas_non_null_count, aas_min_value, aas_max_value
+                FROM adru_attribute_summary WHERE aas_amf_id = ? ORDER BY aas_section, aas_attribute
+            """, (amf_id,))
+            keys = ("section", "attribute", "non_null_count", "min_value", "max_value")
+            stats["attributes"] = [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+        if table_exists(cursor, "adru_event"):
+            cursor.execute("SELECT ae_type, COUNT(*) FROM adru_event WHERE ae_amf_id = ? GROUP BY ae_type",
+                           (amf_id,))
+            stats["events"] = dict(cursor.fetchall())
+
+    yield json.dumps(stats, ensure_ascii=False)
+
+
+def file_events(pool: ReadConnectionPool, params: dict, amf_id: int):
+    """
+    GET /files/<amf_id>/events?type=: the stored events of a file in message order.
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        _check_file(cursor, amf_id)
+        events = []
+        if table_exists(cursor, "adru_event"):
+            sql = "SELECT * FROM adru_event WHERE ae_amf_id = ?"
+            sql_params = [amf_id]
+            if "type" in params:
+                sql += " AND ae_type = ?"
+                sql_params.append(params["type"][0])
+            cursor.execute(sql + " ORDER BY ae_start_local_id", sql_params)
+            keys = [d[0].split("_", 1)[1] for d in cursor.description]
+            events = [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+    yield json.dumps({"amf_id": amf_id, "events": events}, ensure_ascii=False)
+
+
+def file_time_series(pool: ReadConnectionPool, params: dict, amf_id: int):
+    """
+    GET /files/<amf_id>/timeseries?attribute=&start=&end=&points=&method=: one attribute of a file as a
+    downsampled time series for plotting, e.g. attribute=etcs.CURRENT_SPEED_1KPH&points=1000.
+    """
+    if "attribute" not in params:
+        raise QueryError(400, "attribute is required, e.g. attribute=etcs.CURRENT_SPEED_1KPH")
+    try:
+        points = min(int(params.get("points", [2000])[0]), MAX_PAGE_SIZE)
+    except ValueError:
+        raise QueryError(400, "points must be a number")
+    method = params.get("method", ["lttb"])[0]
+    if method not in DOWNSAMPLE_METHODS:
+        raise QueryError(400, f"method must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        _check_file(cursor, amf_id)
+        try:
+            series = build_time_series(cursor, amf_id, params["attribute"][0], params.get("start", [None])[0],
+                                       params.get("end", [None])[0], points, method)
+        except ValueError as e:
+            raise QueryError(400, str(e))
+
+    yield json.dumps({"amf_id": amf_id, **series}, ensure_ascii=False)
+
+
+def database_stats(pool: ReadConnectionPool, params: dict):
+    """
+    GET /stats: number of ADRU files, decodes, messages and events in the database.
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        stats = {}
+        for key, table in (("adru_files", "adru_file"), ("decodes", "adru_message_file"),
+                           ("messages", "adru_messages")):
+            stats[key] = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        stats["events"] = {}
+        if table_exists(cursor, "adru_event"):
+            stats["events"] = dict(cursor.execute("SELECT ae_type, COUNT(*) FROM adru_event GROUP BY ae_type"))
+
+    yield json.dumps(stats)
+
+
+# Path pattern -> handler, the groups of the pattern are passed as amf_id
+ROUTES = [
+    (re.compile(r"/files"), list_files),
+    (re.compile(r"/files/(\d+)/messages"), stream_messages),
+    (re.compile(r"/files/(\d+)/attributes"), stream_attribute_rows),
+    (re.compile(r"/files/(\d+)/stats"), file_stats),
+    (re.compile(r"/files/(\d+)/events"), file_events),
+    (re.compile(r"/files/(\d+)/timeseries"), file_time_series),
+    (re.compile(r"/stats"), database_stats),
+]
+
+
+class AdruRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET requests with JSON. The responses are streamed without a Content-Length (HTTP/1.0), so a
+    large page of messages is never built in memory.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+
+        for pattern, handler in ROUTES:
+            match = pattern.fullmatch(url.path.rstrip("/"))
+            if match:
+                break
+        else:
+            return self._send_error(404, f"Unknown path: {url.path}")
+
+        args = [int(match.group(1))] if match.groups() else []
+        if handler in (stream_messages, stream_attribute_rows):
+            args.append(self.server.table_columns)
+        body = handler(self.server.pool, params, *args)
+
+        # The first chunk runs the checks, so an error can still be sent with its status code
+        try:
+            first = next(body)
+        except QueryError as e:
+            return self._send_error(e.status, str(e))
+        except Exception as e:
+            # E.g. a locked or damaged database, the client still gets a status and a JSON error
+            self.log_error("%s failed: %r", url.path, e)
+            return self._send_error(500, f"Internal error: {e}")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.end_headers()
+        try:
+            self.wfile.write(first.encode("utf-8"))
+            for chunk in body:
+                self.wfile.write(chunk.encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, release the connection of the pool
+            body.close()
+
+    def _send_error(self, status: int, message: str):
+        payload = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(db_path: Path, host: str = "127.0.0.1", port: int = 8765, pool_size: int = 4,
+                  verbose: bool = True) -> ThreadingHTTPServer:
+    """
+    Creates the HTTP query service for a database. Each request runs in its own thread with a connection
+    from the read only pool, so many clients can query while files are ingested (in WAL mode).
+
+    Args:
+        db_path (Path): Path to the SQLite database
+        host (str): Address to listen on, 127.0.0.1 only accepts local clients
+        port (int): Port to listen on, 0 picks a free port
+        pool_size (int): Number of read only connections
+        verbose (bool): Log each request
+
+    Returns:
+        ThreadingHTTPServer: The server, call serve_forever() to start it
+    """
+    if not Path(db_path).exists():
+        raise FileNotFoundError(f"❌ Database {db_path} does not exist, add ADRU files first.")
+
+    server = ThreadingHTTPServer((host, port), AdruRequestHandler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.pool = ReadConnectionPool(db_path, pool_size)
+
+    # The attribute columns are checked against this before they are used in a query
+    with server.pool.connection() as conn:
+        cursor = conn.cursor()
+        server.table_columns = {section: set(get_table_columns(cursor, table))
+                                for section, (table, _) in SECTION_TABLES.items()}
+    return server
+
+
+if __name__ == "__main__":
+    with open("config.yaml", "r") as f:
+        full_config = yaml.safe_load(f) or {}
+    server_config = full_config.get("server") or {}
+    configure_columnar_cache((full_config.get("cache") or {}).get("columnar_dir"))
+
+    adru_server = create_server(Path(server_config.get("db_path") or "adru-export.db"),
+                                server_config.get("host", "127.0.0.1"), server_config.get("port", 8765),
+                                server_config.get("pool_size", 4))
+    host, port = adru_server.server_address[:2]
+    print(f"🌐 ADRU query service running on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        adru_server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopping the query service.")
+    finally:
+        adru_server.server_close()
+        adru_server.pool.close()
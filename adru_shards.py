@@ -0,0 +1,270 @@
+import re
+import shutil
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from adru_db_utils import initialize_adru_database, connect_db
+
+# SQLite allows 10 attached databases by default
+MAX_ATTACHED_SHARDS = 10
+
+
+def initialize_shard_catalog(catalog_path: Path):
+    """
+    Creates the catalog database that keeps track of the shard databases and the files in them,
+    if it does not exist.
+
+    Args:
+        catalog_path (Path): Path to the SQLite catalog database
+    """
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with sqlite3.connect(catalog_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_shard (
+                as_id INTEGER PRIMARY KEY,
+                as_key TEXT UNIQUE,
+                as_path TEXT,
+                as_archived INTEGER DEFAULT 0,
+                as_created_at TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS adru_shard_file (
+                asf_shard_id INTEGER,
+                asf_af_id INTEGER,
+                asf_af_name TEXT,
+                asf_amf_id INTEGER,
+                asf_updated_at TIMESTAMP,
+                PRIMARY KEY (asf_shard_id, asf_af_id),
+                FOREIGN KEY (asf_shard_id) REFERENCES adru_shard (as_id)
+            )
+        """)
+
+
+def shard_key_for_file(adru_path: Path, mode: str) -> str:
+    """
+    Returns the key of the shard an ADRU file is stored in. Only the file name and stat are used, so the
+    key is known without hashing the file.
+
+    Args:
+        adru_path (Path): Path to the ADRU file
+        mode (str): "file" for one shard per ADRU file, or "month" for one shard per month (file modification time)
+
+    Returns:
+        str: Shard key, safe to use in a file name
+    """
+    if mode == "file":
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", adru_path.stem)
+    if mode == "month":
+        return datetime.fromtimestamp(adru_path.stat().st_mtime).strftime("%Y-%m")
+    raise ValueError(f"Unknown sharding mode: {mode}")
+
+
+def get_shard_path(catalog_path: Path, shard_dir: Path, shard_key: str, jru_attributes: list,
+                   etcs_attributes: list, dru_attributes: list, wal_mode: bool = True) -> Path:
+    """
+    Returns the database file for a shard, and creates and registers it if it is new.
+
+    Args:
+        catalog_path (Path): Path to the SQLite catalog database
+        shard_dir (Path): Folder with the shard databases
+        shard_key (str): Key from shard_key_for_file
+        jru_attributes (list): List of unique JRU attribute names, used for the schema of a new shard
+        etcs_attributes (list): List of unique ETCS attribute names
+        dru_attributes (list): List of unique DRU attribute names
+        wal_mode (bool): Use WAL journal mode for a new shard
+
+    Returns:
+        Path: Path to the shard database
+    """
+    with sqlite3.connect(catalog_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT as_path, as_archived FROM adru_shard WHERE as_key = ?", (shard_key,))
+        row = cursor.fetchone()
+
+    if row:
+        if row[1]:
+            raise ValueError(f"❌ Shard {shard_key} is archived, restore it before adding files to it.")
+        return Path(row[0])
+
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    shard_path = shard_dir / f"adru-{shard_key}.db"
+    print(f"🧩 Creating shard {shard_key}: {shard_path.name}")
+    initialize_adru_database(shard_path, jru_attributes, etcs_attributes, dru_attributes, wal_mode)
+
+    with sqlite3.connect(catalog_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO adru_shard (as_key, as_path, as_created_at) VALUES (?, ?, ?)
+        """, (shard_key, str(shard_path), datetime.now().isoformat()))
+
+    return shard_path
+
+
+def register_shard_file(catalog_path: Path, shard_path: Path, af_id: int, af_name: str, amf_id: int):
+    """
+    Records in the catalog that a decoded ADRU file is stored in a shard.
+
+    Args:
+        catalog_path (Path): Path to the SQLite catalog database
+        shard_path (Path): Path to the shard database
+        af_id (int): af_id of the ADRU file in the shard
+        af_name (str): Name of the ADRU file
+        amf_id (int): amf_id of the newest decoded file in the shard
+    """
+    with sqlite3.connect(catalog_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT as_id FROM adru_shard WHERE as_path = ?", (str(shard_path),))
+        row = cursor.fetchone()
+        if not row:
+            raise ValueError(f"❌ {shard_path} is not a registered shard.")
+
+        cursor.execute("""
+            INSERT OR REPLACE INTO adru_shard_file (asf_shard_id, asf_af_id, asf_af_name, asf_amf_id, asf_updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (row[0], af_id, af_name, amf_id, datetime.now().isoformat()))
+
+
+def list_shards(catalog_path: Path, include_archived: bool = False) -> list[dict]:
+    """
+    Lists the shard databases in the catalog.
+
+    Returns:
+        list[dict]: [{ shard_id, key, path, archived }]
+    """
+    with sqlite3.connect(catalog_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT as_id, as_key, as_path, as_archived FROM adru_shard
+            WHERE ? OR as_archived = 0
+            ORDER BY as_key
+        """, (include_archived,))
+        rows = cursor.fetchall()
+
+    return [{"shard_id": r[0], "key": r[1], "path": Path(r[2]), "archived": bool(r[3])} for r in rows]
+
+
+def list_sharded_files(catalog_path: Path) -> list[dict]:
+    """
+    Lists the ADRU files stored in the shards that are not archived.
+
+    Returns:
+        list[dict]: [{ file_id, file_name, amf_id, db_path, shard_key }]
+    """
+    with sqlite3.connect(catalog_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT f.asf_af_id, f.asf_af_name, f.asf_amf_id, s.as_path, s.as_key
+            FROM adru_shard_file f
+            JOIN adru_shard s ON s.as_id = f.asf_shard_id
+            WHERE s.as_archived = 0
+            ORDER BY s.as_key, f.asf_af_name
+        """)
+        rows = cursor.fetchall()
+
+    return [{"file_id": r[0], "file_name": r[1], "amf_id": r[2], "db_path": Path(r[3]), "shard_key": r[4]}
+            for r in rows]
+
+
+def federated_query(catalog_path: Path, sql: str, params: tuple = (), shard_keys: list[str] | None = None):
+    """
+    Runs a query against all shards by attaching them to one connection. The query must use the
+    {shard} placeholder in front of the table names, e.g. "SELECT COUNT(*) FROM {shard}.adru_messages".
+    The shards are attached in batches and the query for each shard is combined with UNION ALL.
+
+    Args:
+        catalog_path (Path): Path to the SQLite catalog database
+        sql (str): Query with the {shard} placeholder
+        params (tuple): Parameters for one run of the query, they are repeated for each shard
+        shard_keys (list[str] | None): Only query these shards, or all shards that are not archived if None
+
+    Yields:
+        tuple: (shard_key, *row) for each row of each shard
+    """
+    shards = [s for s in list_shards(catalog_path) if shard_keys is None or s["key"] in shard_keys]
+
+    # Read only, so the queries never block an ingest that is writing to a shard
+    conn = connect_db(catalog_path, read_only=True)
+    try:
+        cursor = conn.cursor()
+        for i in range(0, len(shards), MAX_ATTACHED_SHARDS):
+            batch = shards[i:i + MAX_ATTACHED_SHARDS]
+            aliases = [f"shard_{j}" for j in range(len(batch))]
+
+            for alias, shard in zip(aliases, batch):
+                cursor.execute(f"ATTACH DATABASE ? AS {alias}", (f"{shard['path'].resolve().as_uri()}?mode=ro",))
+            try:
+                union = " UNION ALL ".join(
+                    f"SELECT ? AS shard_key, * FROM ({sql.format(shard=alias)})" for alias in aliases)
+                batch_params = []
+                for shard in batch:
+                    batch_params.extend((shard["key"], *params))
+                cursor.execute(union, batch_params)
+                while rows := cursor.fetchmany(1000):
+                    yield from rows
+            finally:
+                for alias in aliases:
+                    cursor.execute(f"DETACH DATABASE {alias}")
+    finally:
+        conn.close()
+
+
+def archive_shard(catalog_path: Path, shard_key: str, archive_dir: Path) -> Path:
+    """
+    Moves a shard database to an archive folder and marks it as archived, so it is left out of the
+    federated queries.
+
+    Args:
+        catalog_path (Path): Path to the SQLite catalog database
+        shard_key (str): Key of the shard to archive
+        archive_dir (Path): Folder to move the shard database to
+
+    Returns:
+        Path: New path of the shard database
+    """
+    with sqlite3.connect(catalog_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT as_path FROM adru_shard WHERE as_key = ? AND as_archived = 0", (shard_key,))
+        row = cursor.fetchone()
+        if not row:
+            raise ValueError(f"❌ No active shard with key {shard_key}")
+
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        target = archive_dir / Path(row[0]).name
+        shutil.move(row[0], target)
+        cursor.execute("UPDATE adru_shard SET as_path = ?, as_archived = 1 WHERE as_key = ?",
+                       (str(target), shard_key))
+
+    print(f"📦 Archived shard {shard_key} to {target}")
+    return target
+
+
+def restore_shard(catalog_path: Path, shard_key: str, shard_dir: Path) -> Path:
+    """
+    Moves an archived shard database back to the shard folder and includes it in the queries again.
+
+    Args:
+        catalog_path (Path): Path to the SQLite catalog database
+        shard_key (str): Key of the shard to restore
+        shard_dir (Path): Folder with the shard databases
+
+    Returns:
+        Path: New path of the shard database
+    """
+    with sqlite3.connect(catalog_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT as_path FROM adru_shard WHERE as_key = ? AND as_archived = 1", (shard_key,))
+        row = cursor.fetchone()
+        if not row:
+            raise ValueError(f"❌ No archived shard with key {shard_key}")
+
+        target = shard_dir / Path(row[0]).name
+        shutil.move(row[0], target)
+        cursor.execute("UPDATE adru_shard SET as_path = ?, as_archived = 0 WHERE as_key = ?",
+                       (str(target), shard_key))
+
+    print(f"📦 Restored shard {shard_key} to {target}")
+    return target
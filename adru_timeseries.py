@@ -0,0 +1,254 @@
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from adru_columnar import open_columnar_file, message_times
+from adru_db_utils import connect_db, get_table_columns, numeric_sql, numeric_value, is_delta_file, \
+    iter_cursor_messages, SECTION_TABLES, SUMMARY_TIME_ATTRIBUTES
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+# Format of the timestamps, the same as the start and end time in the file summary
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _time_sql(alias: str) -> str:
+    # Seconds since 1970 from the DATE.* and TIME.* attributes of a JRU row, NULL if they are not set
+    year, month, day, hour, minute, second, millisecond = (f'{alias}."{a}"' for a in SUMMARY_TIME_ATTRIBUTES)
+    return (f"(julianday(printf('%04d-%02d-%02d %02d:%02d:%02d', {year}, {month}, {day}, {hour}, {minute}, "
+            f"{second})) - 2440587.5) * 86400.0 + IFNULL({millisecond}, 0) / 1000.0")
+
+
+def _parse_time(value: str | datetime | None) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _format_time(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(TIME_FORMAT)[:-3]
+
+
+def fetch_attribute_series(cursor: sqlite3.Cursor, amf_id: int, section: str,
+                           attribute: str) -> tuple[np.ndarray, ...]:
+    """
+    Reads the numeric values of one attribute of a decoded file in one query, or from the columnar copy of
+    the file when it is up to date. The time of a message comes from the JRU date and time attributes,
+    carried over from the last message that had them.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the database
+        amf_id (int): ID from adru_message_file table
+        section (str): "jru", "etcs" or "dru"
+        attribute (str): Attribute name, e.g. CURRENT_SPEED_1KPH
+
+    Returns:
+        tuple[np.ndarray, ...]: (am_local_id, time in seconds since 1970 or NaN, value) of the messages where
+            the attribute has a numeric value
+    """
+    # The columnar copy of the file has the times and values without reading the rows of the database
+    cursor.execute("PRAGMA database_list")
+    db_path = next((row[2] for row in cursor.fetchall() if row[1] == "main"), None)
+    columnar = open_columnar_file(Path(db_path), amf_id) if db_path else None
+    if columnar is not None and f"{section}.{attribute}" in columnar.attributes:
+        values = np.asarray(columnar.values(f"{section}.{attribute}"))
+        has_value = ~np.isnan(values)
+        return columnar.local_ids[has_value], columnar.times[has_value], values[has_value]
+
+    table, prefix = SECTION_TABLES[section]
+    if attribute not in get_table_columns(cursor, table):
+        raise ValueError(f"Unknown {section.upper()} attribute: {attribute}")
+
+    # Without the JRU date and time columns all times are NaN
+    jru_table, jru_prefix = SECTION_TABLES["jru"]
+    jru_columns = set(get_table_columns(cursor, jru_table))
+    has_time = all(a in jru_columns for a in SUMMARY_TIME_ATTRIBUTES)
+    time_sql = _time_sql("j") if has_time else "NULL"
+    time_condition = ' OR j."TIME.SECONDS" IS NOT NULL' if has_time else ""
+
+    if is_delta_file(cursor, amf_id):
+        return _fetch_delta_series(cursor, amf_id, section, attribute, has_time)
+
+    value_alias = "j" if section == "jru" else "s"
+    value_join = "" if section == "jru" else f"LEFT JOIN {table} s ON s.{prefix}_am_id = m.am_id"
+    cursor.execute(f"""
+        SELECT m.am_local_id, {time_sql}, {numeric_sql(f'{value_alias}."{attribute}"')}
+        FROM adru_messages m
+        LEFT JOIN {jru_table} j ON j.{jru_prefix}_am_id = m.am_id
+        {value_join}
+        WHERE m.am_amf_id = ? AND ({value_alias}."{attribute}" IS NOT NULL{time_condition})
+        ORDER BY m.am_local_id, m.am_id
+    """, (amf_id,))
+    rows = np.array(cursor.fetchall(), dtype=float).reshape(-1, 3)
+
+    # julianday is not exact to the millisecond
+    local_ids, times, values = rows[:, 0], np.round(rows[:, 1], 3), rows[:, 2]
+
+    # Carry the time over to the messages without a JRU time
+    known = ~np.isnan(times)
+    if known.any():
+        times = times[np.maximum.accumulate(np.where(known, np.arange(len(times)), 0))]
+        times[:np.argmax(known)] = np.nan
+
+    has_value = ~np.isnan(values)
+    return local_ids[has_value].astype(np.int64), times[has_value], values[has_value]
+
+
+def _fetch_delta_series(cursor: sqlite3.Cursor, amf_id: int, section: str, attribute: str,
+                        has_time: bool) -> tuple[np.ndarray, ...]:
+    """
+    fetch_attribute_series for a file in delta mode. Its stored rows only have the changes, so the values and
+    times are taken from the rebuilt messages.
+    """
+    columns = {s: [] for s in SECTION_TABLES}
+    columns[section].append(attribute)
+    time_attributes = SUMMARY_TIME_ATTRIBUTES if has_time else []
+    columns["jru"] = sorted(set(columns["jru"]) | set(time_attributes))
+
+    local_ids, values = [], []
+    time_values = {a: [] for a in time_attributes}
+    for message in iter_cursor_messages(cursor, amf_id, 5000, columns):
+        local_ids.append(message["am_local_id"])
+        values.append(numeric_value(message.get(section, {}).get(attribute)))
+        jru = message.get("jru", {})
+        for a, parts in time_values.items():
+            parts.append(numeric_value(jru.get(a)))
+
+    times = message_times({("jru", a): np.array(parts, dtype=float) for a, parts in time_values.items()},
+                          len(local_ids))
+    values = np.array(values, dtype=float)
+    has_value = ~np.isnan(values)
+    return np.array(local_ids, dtype=np.int64)[has_value], times[has_value], values[has_value]
+
+
+def downsample_minmax(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Splits the points in max_points / 2 buckets and keeps the lowest and the highest point of each bucket,
+    so peaks (like a brake pressure spike) are never lost.
+
+    Returns:
+        np.ndarray: Indices of the kept points, in order
+    """
+    buckets = max(max_points // 2, 1)
+    if len(y) <= max_points:
+        return np.arange(len(y))
+    if max_points < 2:
+        # Only room for one point, the highest one
+        return np.array([np.nanargmax(y)])
+
+    size = -(-len(y) // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(buckets, size)
+    used = ~np.isnan(padded).all(axis=1)
+    offsets = np.arange(buckets)[used] * size
+
+    minimum = offsets + np.nanargmin(padded[used], axis=1)
+    maximum = offsets + np.nanargmax(padded[used], axis=1)
+    return np.unique(np.concatenate([minimum, maximum]))
+
+
+def downsample_lttb(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last point, and from each bucket in between the point
+    that makes the largest triangle with the point kept before it and the average of the next bucket. The
+    shape of the curve is kept with far fewer points.
+
+    Returns:
+        np.ndarray: Indices of the kept points, in order
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    if max_points < 3:
+        # No buckets in between, only the first and the last point
+        return np.array([0, n - 1][-max_points:] if max_points > 0 else [], dtype=np.int64)
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        prev_x, prev_y = x[kept[i]], y[kept[i]]
+
+        areas = np.abs((prev_x - next_x) * (y[start:end] - prev_y) - (prev_x - x[start:end]) * (next_y - prev_y))
+        kept[i + 1] = start + np.argmax(areas)
+
+    return kept
+
+
+def build_time_series(cursor: sqlite3.Cursor, amf_id: int, attribute: str, start_time: str | datetime | None = None,
+                      end_time: str | datetime | None = None, max_points: int = 2000, method: str = "lttb") -> dict:
+    """
+    Returns an attribute of a decoded file as a time series for plotting, for example the speed
+    (etcs.CURRENT_SPEED_1KPH) or the brake pressure (jru.EXTERNAL_BRAKE_PRESSURE). The values are read in
+    one query and downsampled with NumPy to at most max_points points.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor of the database
+        amf_id (int): ID from adru_message_file table
+        attribute (str): "section.attribute", e.g. "etcs.CURRENT_SPEED_1KPH"
+        start_time (str | datetime | None): Only points from this time, e.g. "2024-05-01 10:00:00"
+        end_time (str | datetime | None): Only points until this time
+        max_points (int): Max number of points returned
+        method (str): "lttb" to keep the shape of the curve, or "minmax" to keep the lowest and highest value
+            of each bucket
+
+    Returns:
+        dict: { attribute, method, total_points, local_id: [...], time: [...], value: [...] }, time is None for
+            the points before the first JRU time
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsample method: {method}, use one of {', '.join(DOWNSAMPLE_METHODS)}")
+    section, _, name = attribute.partition(".")
+    if section not in SECTION_TABLES or not name:
+        raise ValueError(f"Attribute must be section.attribute, e.g. etcs.CURRENT_SPEED_1KPH, got: {attribute}")
+
+    local_ids, times, values = fetch_attribute_series(cursor, amf_id, section, name)
+
+    start, end = _parse_time(start_time), _parse_time(end_time)
+    if start is not None or end is not None:
+        in_window = ~np.isnan(times)
+        if start is not None:
+            in_window &= times >= start
+        if end is not None:
+            in_window &= times <= end
+        local_ids, times, values = local_ids[in_window], times[in_window], values[in_window]
+
+    # Downsample on time when it is known for all points, else on the message number
+    x = times if not np.isnan(times).any() else local_ids.astype(float)
+    downsample = downsample_lttb if method == "lttb" else downsample_minmax
+    kept = downsample(x, values, max(max_points, 1))
+
+    return {
+        "attribute": attribute,
+        "method": method,
+        "total_points": len(values),
+        "local_id": local_ids[kept].tolist(),
+        "time": [None if np.isnan(t) else _format_time(t) for t in times[kept]],
+        "value": values[kept].tolist(),
+    }
+
+
+def get_time_series(db_path: Path, amf_id: int, attribute: str, start_time: str | datetime | None = None,
+                    end_time: str | datetime | None = None, max_points: int = 2000, method: str = "lttb") -> dict:
+    """
+    build_time_series on a read only connection to the database, see there for the arguments.
+
+    Args:
+        db_path (Path): Path to the SQLite database
+
+    Returns:
+        dict: { attribute, method, total_points, local_id: [...], time: [...], value: [...] }
+    """
+    with connect_db(db_path, read_only=True) as conn:
+        series = build_time_series(conn.cursor(), amf_id, attribute, start_time, end_time, max_points, method)
+    conn.close()
+    return series
@@ -1,15 +1,269 @@
+import gzip
 import hashlib
+import io
+import lzma
+import os
+import queue
+import re
+import sys
 import threading
 import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, TextIO
 
+try:
+    import zstandard
+except ImportError:  # Optional, only needed for .zst compressed txt files
+    zstandard = None
+
+# path -> (size, mtime_ns, md5), so a file that changed is hashed again
 _md5_cache = {}
 
+# One read buffer per hashing thread, reused for every file the thread hashes
+_hash_buffers = threading.local()
+
+# Bytes read from the start and the end of a file for the sample used by find_files_with_md5
+SAMPLE_SIZE = 64 * 1024
+
+# Suffixes a decoded txt file can have, plain or compressed after ingest
+TXT_SUFFIXES = (".txt", ".txt.gz", ".txt.zst", ".txt.xz")
+COMPRESSION_SUFFIXES = {"gz": ".gz", "zst": ".zst", "xz": ".xz"}
+
+# Size of the blocks read ahead on a background thread by open_decoded_txt, 0 to read the files directly
+_read_ahead_settings = {"block_size": 0, "blocks_ahead": 2}
+
+# Start of a Msg block in the raw bytes of a decoded txt file, the group is the local message id
+_MSG_LINE = re.compile(rb"^[ \t]*Msg (\d+)", re.MULTILINE)
+
+# Line that opens a section of a Msg block -> position of the section in the entries of iter_txt_messages
+_SECTION_OPENERS = {"JRU (": 0, "ETCS ON-BOARD PROPRIETARY JURIDICAL DATA (": 1, "DRU ETCS (": 2}
+
+# Text before the delimiter of an attribute line (with the indentation) -> interned attribute name
+_attribute_names = {}
+_MAX_ATTRIBUTE_NAMES = 100000
+
+
+def is_compressed_txt(txt_path: Path) -> bool:
+    """
+    Checks if a decoded txt file is stored compressed (.txt.gz, .txt.zst or .txt.xz).
+
+    Args:
+        txt_path (Path): Path to the decoded txt file
+
+    Returns:
+        bool: True if the file is compressed
+    """
+    return txt_path.name.endswith(TXT_SUFFIXES[1:])
+
+
+def _open_decoded_binary(txt_path: Path):
+    """
+    Opens a decoded txt file for binary reading and transparently decompresses it based on the suffix.
+    """
+    name = txt_path.name
+    if name.endswith(".gz"):
+        return gzip.open(txt_path, "rb")
+    if name.endswith(".xz"):
+        return lzma.open(txt_path, "rb")
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"❌ {txt_path.name} is zstd compressed, install 'zstandard' to read it.")
+        # A .zst file can hold several frames (e.g. written in parts or concatenated), read all of them
+        return zstandard.ZstdDecompressor().stream_reader(txt_path.open("rb"), closefd=True,
+                                                          read_across_frames=True)
+    return txt_path.open("rb")
+
+
+class ReadAheadReader(io.RawIOBase):
+    """
+    Reads a binary stream in large blocks on a background thread, while the caller works on the blocks that
+    were already read. With two blocks ahead (double buffering) the wait for each read, e.g. on a network
+    share, overlaps with the parsing instead of adding to it.
+    """
+
+    def __init__(self, raw, block_size: int = 8 * 1024 * 1024, blocks_ahead: int = 2):
+        super().__init__()
+        self._raw = raw
+        self._blocks = queue.Queue(maxsize=blocks_ahead)
+        self._stop = threading.Event()
+        self._current = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, args=(block_size,), name="adru-read-ahead", daemon=True)
+        self._thread.start()
+
+    def _fill(self, block_size: int):
+        # Runs on the background thread, an empty block marks the end and an exception is passed on
+        try:
+            while not self._stop.is_set():
+                block = self._raw.read(block_size)
+                self._put(block)
+                if not block:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._current:
+            if self._eof:
+                return 0
+            block = self._blocks.get()
+            if isinstance(block, Exception):
+                self._eof = True
+                raise block
+            if not block:
+                self._eof = True
+                return 0
+            self._current = memoryview(block)
+
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._raw.close()
+        super().close()
+
+
+def configure_read_ahead(block_size: int = 8 * 1024 * 1024, blocks_ahead: int = 2):
+    """
+    Makes open_decoded_txt read the files ahead in large blocks on a background thread, which keeps the
+    parser busy when the files are on slow or high latency storage (network shares).
+
+    Args:
+        block_size (int): Bytes per read, 0 to read the files directly
+        blocks_ahead (int): Number of blocks read before the parser needs them
+    """
+    _read_ahead_settings.update(block_size=block_size, blocks_ahead=max(blocks_ahead, 1))
+
+
+def _open_reader(txt_path: Path):
+    """
+    Opens a decoded txt file for binary reading, read ahead on a background thread when configured.
+    """
+    raw = _open_decoded_binary(txt_path)
+    if not _read_ahead_settings["block_size"]:
+        return raw
+    reader = ReadAheadReader(raw, _read_ahead_settings["block_size"], _read_ahead_settings["blocks_ahead"])
+    return io.BufferedReader(reader, buffer_size=1024 * 1024)
+
+
+def open_decoded_txt(txt_path: Path) -> TextIO:
+    """
+    Opens a decoded txt file for reading, no matter if it is plain text or gzip/zstd/xz compressed.
+
+    Args:
+        txt_path (Path): Path to the decoded .txt, .txt.gz, .txt.zst or .txt.xz file
+
+    Returns:
+        TextIO: Text stream with the logical (decompressed) content of the file
+    """
+    if not is_compressed_txt(txt_path) and not _read_ahead_settings["block_size"]:
+        return txt_path.open("r", encoding="utf-8", errors="ignore")
+
+    return io.TextIOWrapper(_open_reader(txt_path), encoding="utf-8", errors="ignore")
+
+
+def find_txt_files(directory: Path) -> List[Path]:
+    """
+    Finds all decoded txt files in a directory, including the compressed ones.
+
+    Args:
+        directory (Path): Directory to scan
+
+    Returns:
+        List[Path]: List of decoded txt file paths
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return [p for p in directory.iterdir() if p.is_file() and p.name.endswith(TXT_SUFFIXES)]
+
+
+def open_compressed_writer(file_path: Path, method: str | None):
+    """
+    Opens a file for binary writing, compressed with the given method.
+
+    Args:
+        file_path (Path): Path to the file to write
+        method (str | None): Compression method, one of "gz", "zst" or "xz", or None for no compression
+
+    Returns:
+        A binary file object
+    """
+    if method is None:
+        return file_path.open("wb")
+    if method == "gz":
+        return gzip.open(file_path, "wb", compresslevel=6)
+    if method == "xz":
+        return lzma.open(file_path, "wb", preset=6)
+    if method == "zst":
+        if zstandard is None:
+            raise RuntimeError("❌ Install 'zstandard' to compress files with zstd.")
+        return zstandard.ZstdCompressor(level=10).stream_writer(file_path.open("wb"), closefd=True)
+    raise ValueError(f"Unknown compression method: {method}")
+
+
+def compress_txt_file(txt_path: Path, method: str = "gz", remove_original: bool = True) -> Path:
+    """
+    Compresses a decoded txt file next to the original (e.g. file.txt -> file.txt.gz). The MD5 of the
+    logical content is computed while compressing, so the new file keeps the same fingerprint in the database.
+
+    Args:
+        txt_path (Path): Path to the plain decoded .txt file
+        method (str): Compression method, one of "gz", "zst" or "xz"
+        remove_original (bool): Delete the plain .txt file when the compressed file is written
+
+    Returns:
+        Path: Path to the compressed file
+    """
+    if method not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression method: {method}")
+    if is_compressed_txt(txt_path):
+        return txt_path
+
+    target = txt_path.with_name(txt_path.name + COMPRESSION_SUFFIXES[method])
+    tmp_target = target.with_name(target.name + ".part")
+
+    out = open_compressed_writer(tmp_target, method)
+
+    print(f"🗜️ Compressing {txt_path.name} -> {target.name}")
+    hash_md5 = hashlib.md5()
+    with txt_path.open("rb") as src, out:
+        for chunk in iter(lambda: src.read(4 * 1024 * 1024), b""):
+            hash_md5.update(chunk)
+            out.write(chunk)
+
+    os.replace(tmp_target, target)
+    target_stat = target.stat()
+    _md5_cache[target] = (target_stat.st_size, target_stat.st_mtime_ns, hash_md5.hexdigest())
+    if remove_original:
+        _md5_cache.pop(txt_path, None)
+        txt_path.unlink()
+
+    return target
+
 
 def compute_md5_cached(file_path: Path, chunk_size: int = 4 * 1024 * 1024) -> str:
     """
-    Compute MD5 hash of a file in chunks.
+    Compute MD5 hash of a file in chunks. Compressed decoded txt files are hashed on their logical
+    (decompressed) content, so a .txt and its .txt.gz have the same fingerprint.
 
     Args:
         file_path (Path): File path
@@ -18,19 +272,105 @@ def compute_md5_cached(file_path: Path, chunk_size: int = 4 * 1024 * 1024) -> st
     Returns:
         str: MD5 hex digest
     """
-    if file_path in _md5_cache:
-        return _md5_cache[file_path]
+    stat = file_path.stat()
+    cached = _md5_cache.get(file_path)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    # Read into the buffer of this thread instead of creating a new bytes object for each chunk
+    buffer = getattr(_hash_buffers, "buffer", None)
+    if buffer is None or len(buffer) != chunk_size:
+        buffer = _hash_buffers.buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
 
     hash_md5 = hashlib.md5()
-    with file_path.open("rb") as f:
-        for chunk in iter(lambda: f.read(chunk_size), b""):
-            hash_md5.update(chunk)
+    with _open_decoded_binary(file_path) as f:
+        while read := f.readinto(view):
+            hash_md5.update(view[:read])
 
     digest = hash_md5.hexdigest()
-    _md5_cache[file_path] = digest
+    _md5_cache[file_path] = (stat.st_size, stat.st_mtime_ns, digest)
     return digest
 
 
+def compute_md5_many(file_paths: Iterable[Path], workers: int = 4) -> dict[Path, str]:
+    """
+    Computes the MD5 of several files at the same time. hashlib and the file reads release the GIL, so
+    the threads hash in parallel and the speed is limited by the disk instead of one CPU core.
+
+    Args:
+        file_paths (Iterable[Path]): Files to hash
+        workers (int): Number of hashing threads
+
+    Returns:
+        dict[Path, str]: path -> MD5 hex digest
+    """
+    file_paths = list(file_paths)
+    if len(file_paths) <= 1 or workers <= 1:
+        return {path: compute_md5_cached(path) for path in file_paths}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(file_paths, pool.map(compute_md5_cached, file_paths)))
+
+
+def compute_file_sample(file_path: Path, sample_size: int = SAMPLE_SIZE) -> tuple[int | None, str, str | None]:
+    """
+    Cheap fingerprint of a file: its size and the MD5 of its first and last sample_size bytes. Files with a
+    different sample can not have the same MD5, so only the files with a matching sample need a full hash.
+    For a compressed txt file only the start of the logical content is read, the size and the end are
+    unknown without decompressing all of it.
+
+    Args:
+        file_path (Path): File to sample
+        sample_size (int): Number of bytes read from the start and from the end
+
+    Returns:
+        tuple[int | None, str, str | None]: (size, MD5 of the start, MD5 of the end), size and end are None
+            for compressed files
+    """
+    if is_compressed_txt(file_path):
+        with _open_decoded_binary(file_path) as f:
+            return None, hashlib.md5(f.read(sample_size)).hexdigest(), None
+
+    size = file_path.stat().st_size
+    with file_path.open("rb") as f:
+        head = f.read(sample_size)
+        f.seek(max(size - sample_size, 0))
+        tail = f.read(sample_size)
+    return size, hashlib.md5(head).hexdigest(), hashlib.md5(tail).hexdigest()
+
+
+def find_files_with_md5(file_paths: Iterable[Path], known_hashes: set[str],
+                        known_samples: list[tuple] | None = None, workers: int = 4) -> dict[Path, str]:
+    """
+    Finds the files whose MD5 is one of the known hashes. When the samples (see compute_file_sample) of
+    the known files are given, the files with a sample that matches none of them are skipped without a
+    full hash. The remaining files are hashed in parallel.
+
+    Args:
+        file_paths (Iterable[Path]): Candidate files
+        known_hashes (set[str]): MD5 hex digests to look for
+        known_samples (list[tuple] | None): (size, head MD5, tail MD5) of each known file, or None to hash
+            all candidates
+        workers (int): Number of hashing threads
+
+    Returns:
+        dict[Path, str]: path -> MD5 of the matching files, in the order of file_paths
+    """
+    candidates = list(file_paths)
+    if known_samples is not None and candidates:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            samples = list(pool.map(compute_file_sample, candidates))
+        candidates = [
+            path for path, (size, head, tail) in zip(candidates, samples)
+            if any(head == known[1] and (size is None or (size, tail) == (known[0], known[2]))
+                   for known in known_samples)
+        ]
+
+    hashes = compute_md5_many(candidates, workers)
+    return {path: hashes[path] for path in candidates if hashes[path] in known_hashes}
+
+
 def count_msg_in_txt(txt_path: Path) -> int:
     """
     Counts the number of 'Msg #' blocks in a .txt file and prints a live counter.
@@ -43,7 +383,7 @@ def count_msg_in_txt(txt_path: Path) -> int:
     """
     msg_count = 0
 
-    with txt_path.open("r", encoding="utf-8", errors="ignore") as file:
+    with open_decoded_txt(txt_path) as file:
         for line in file:
             if line.strip().startswith("Msg "):
                 msg_count += 1
@@ -53,6 +393,59 @@ def count_msg_in_txt(txt_path: Path) -> int:
     return msg_count
 
 
+def index_txt_messages(txt_path: Path, chunk_size: int = 4 * 1024 * 1024) -> tuple[array, array, int]:
+    """
+    Finds the byte offset of every Msg block in a decoded .txt file (plain or compressed). The file is read
+    in large chunks and searched with a regular expression, without decoding the lines.
+
+    Args:
+        txt_path (Path): Path to the decoded .txt file
+        chunk_size (int): Number of bytes read at a time
+
+    Returns:
+        tuple[array, array, int]: (local message ids, byte offsets of the Msg lines in the decompressed
+            content, in file order, total size of the decompressed content)
+    """
+    local_ids, offsets = array("q"), array("q")
+    position = 0
+    rest = b""
+
+    with _open_reader(txt_path) as file:
+        while chunk := file.read(chunk_size):
+            buffer = rest + chunk
+            # Only search up to the last whole line, the rest is searched with the next chunk
+            cut = buffer.rfind(b"\n") + 1
+            for match in _MSG_LINE.finditer(buffer, 0, cut):
+                local_ids.append(int(match.group(1)))
+                offsets.append(position + match.start())
+            position += cut
+            rest = buffer[cut:]
+
+    for match in _MSG_LINE.finditer(rest):
+        local_ids.append(int(match.group(1)))
+        offsets.append(position + match.start())
+
+    return local_ids, offsets, position + len(rest)
+
+
+def read_txt_range(txt_path: Path, start: int, end: int) -> str:
+    """
+    Reads the text between two byte offsets of a decoded .txt file. A plain file is read with a single seek,
+    a compressed file has to be decompressed up to the start.
+
+    Args:
+        txt_path (Path): Path to the decoded .txt, .txt.gz, .txt.zst or .txt.xz file
+        start (int): Offset of the first byte in the decompressed content
+        end (int): Offset after the last byte
+
+    Returns:
+        str: The text between the offsets
+    """
+    with _open_decoded_binary(txt_path) as file:
+        file.seek(start)
+        return file.read(end - start).decode("utf-8", errors="ignore")
+
+
 def extract_unique_attributes(txt_path: Path, total_messages: int) -> tuple[list[str], list[str], list[str]]:
     """
     Extracts all unique attribute names from JRU, ETCS, and DRU blocks in a decoded ADRU text file.
@@ -71,7 +464,7 @@ def extract_unique_attributes(txt_path: Path, total_messages: int) -> tuple[list
     inside_jru = inside_etcs = inside_dru = False
     current_msg = 0
 
-    with txt_path.open("r", encoding="utf-8", errors="ignore") as file:
+    with open_decoded_txt(txt_path) as file:
         for line in file:
             line = line.strip()
 
@@ -125,6 +518,154 @@ def extract_unique_attributes(txt_path: Path, total_messages: int) -> tuple[list
     return sorted(unique_jru_attrs), sorted(unique_etcs_attrs), sorted(unique_dru_attrs)
 
 
+def _attribute_name(raw: str) -> str | None:
+    """
+    Returns the attribute name for the text before the delimiter of a line, interned and cached so every
+    message uses the same string object (with its hash computed once) instead of a new one per line.
+    None if the line is a Msg line.
+    """
+    name = raw.strip()
+    if name.startswith("Msg "):
+        return None
+    name = sys.intern(name)
+    if len(_attribute_names) < _MAX_ATTRIBUTE_NAMES:
+        _attribute_names[raw] = name
+    return name
+
+
+def iter_txt_messages(lines: Iterable[str]) -> Iterator[tuple[int, dict, dict, dict]]:
+    """
+    Parses the lines of a decoded ADRU text file and yields one entry per Msg block.
+
+    Args:
+        lines (Iterable[str]): Lines from a decoded .txt file (e.g. an open file)
+
+    Yields:
+        tuple: (local message id, JRU attributes, ETCS attributes, DRU attributes)
+    """
+    names = _attribute_names
+    current_msg_local_id = None
+    current_data = ({}, {}, {})
+    # Attributes of the section the line is in, None outside a section
+    section_data = None
+
+    for line in lines:
+        # Most lines are attributes inside a section, they are handled without stripping the whole line
+        if section_data is not None:
+            delimiter = line.find("=")
+            colon = line.find(":")
+            if colon != -1 and (delimiter == -1 or colon < delimiter):
+                delimiter = colon
+            if delimiter != -1:
+                raw = line[:delimiter]
+                attr = names.get(raw) or _attribute_name(raw)
+                if attr is not None:
+                    section_data[attr] = line[delimiter + 1:].strip()
+                    continue
+
+        line = line.strip()
+
+        if line.startswith("Msg "):
+            if current_msg_local_id is not None:
+                yield current_msg_local_id, *current_data
+            current_msg_local_id = int(line.split(" ")[1].rstrip(":"))
+            current_data = ({}, {}, {})
+            section_data = None
+            continue
+
+        # Section openers
+        section = _SECTION_OPENERS.get(line)
+        if section is not None:
+            section_data = current_data[section]
+            continue
+
+        # Section closers
+        if line == ")":
+            section_data = None
+
+    # Final message
+    if current_msg_local_id is not None:
+        yield current_msg_local_id, *current_data
+
+
+class MessageOffsets:
+    """
+    Byte offset of every Msg block of a decoded .txt file, filled by iter_message_blocks while the file is read
+    for the insert. Gives the same result as index_txt_messages without reading the file again.
+    """
+
+    def __init__(self):
+        self.local_ids = array("q")
+        self.offsets = array("q")
+        self.text_size = 0
+
+
+def iter_message_blocks(txt_path: Path, messages_per_block: int = 5000, offsets: MessageOffsets | None = None,
+                        chunk_size: int = 4 * 1024 * 1024) -> Iterator[str]:
+    """
+    Reads a decoded .txt file (plain or compressed) and yields the raw text in blocks of whole Msg entries,
+    so the blocks can be parsed independently (e.g. in a process pool) with bounded memory.
+
+    Args:
+        txt_path (Path): Path to the decoded .txt file
+        messages_per_block (int): Number of Msg entries per block
+        offsets (MessageOffsets | None): Filled with the byte offset of every Msg block in the decompressed
+            content when given
+        chunk_size (int): Number of bytes read at a time
+
+    Yields:
+        str: Raw text of up to messages_per_block messages
+    """
+    msg_count = 0
+    # Text from the start of the current block that was not yielded yet, and how much of it was searched
+    pending = b""
+    searched = 0
+    # Position of pending in the decompressed content
+    position = 0
+
+    # Read as bytes in large chunks and find the Msg lines with a regular expression, like index_txt_messages
+    with _open_reader(txt_path) as file:
+        while True:
+            chunk = file.read(chunk_size)
+            buffer = pending + chunk
+            # Only search up to the last whole line, the rest is searched with the next chunk
+            cut = len(buffer) if not chunk else buffer.rfind(b"\n") + 1
+            start = 0
+            for match in _MSG_LINE.finditer(buffer, searched, max(cut, searched)):
+                if msg_count == messages_per_block:
+                    yield buffer[start:match.start()].decode("utf-8", errors="ignore")
+                    start = match.start()
+                    msg_count = 0
+                msg_count += 1
+                if offsets is not None:
+                    offsets.local_ids.append(int(match.group(1)))
+                    offsets.offsets.append(position + match.start())
+
+            pending = buffer[start:]
+            searched = max(cut, searched) - start
+            position += start
+            if not chunk:
+                break
+
+    if offsets is not None:
+        offsets.text_size = position + len(pending)
+    if pending:
+        yield pending.decode("utf-8", errors="ignore")
+
+
+def parse_message_block(block: str) -> list[tuple[int, dict, dict, dict]]:
+    """
+    Parses a block of raw text from iter_message_blocks. Top level function so it can run in a process pool.
+
+    Args:
+        block (str): Raw text with whole Msg entries
+
+    Returns:
+        list[tuple]: [(local message id, JRU attributes, ETCS attributes, DRU attributes)]
+    """
+    return list(iter_txt_messages(block.splitlines()))
+
+
 def find_adru_files(input_dir: str) -> List[Path]:
     """
     Scans the given directory for .adru files and returns a list of their Paths.
@@ -146,7 +687,7 @@ def find_adru_files(input_dir: str) -> List[Path]:
 
 
 def get_latest_txt_file(directory: Path) -> Path | None:
-    txt_files = list(directory.glob("*.txt"))
+    txt_files = find_txt_files(directory)
     if not txt_files:
         return None
     return max(txt_files, key=lambda f: f.stat().st_ctime)
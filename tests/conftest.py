@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The adru_* modules are in the project folder, not in a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+from adru_db_utils import initialize_adru_database, add_adru_file_to_db, add_message_file_to_db, \
+    insert_messages_from_txt, iter_file_messages, fetch_messages_by_id, connect_db, is_delta_file
+
+JRU = ["M_MODE", "V_TRAIN", "L_CAPTION[0]", "BALISE_RECEPTION_ERROR"]
+ETCS = ["CURRENT_SPEED_1KPH", "TRU_L_TEXT"]
+DRU = ["Log message"]
+
+# Local ids that are not in file order, so the am_local_id order differs from the insert (am_id) order
+LOCAL_IDS = [1, 2, 3, 7, 4, 5, 6, 8, 9, 10, 12, 11, 13, 14, 15, 16, 17, 18, 19, 20]
+
+
+def _write_txt(path):
+    lines = []
+    for i, local_id in enumerate(LOCAL_IDS):
+        lines += [f"Msg {local_id}:", "JRU ("]
+        lines.append(f"  M_MODE = {'FS' if i < 10 else 'SR'}")
+        # A value that repeats, changes and is missing in some messages
+        if i % 4 != 3:
+            lines.append(f"  V_TRAIN = {i // 3}")
+        # Attributes that appear and disappear again
+        if i % 5 == 0:
+            lines += ["  BALISE_RECEPTION_ERROR = 1", "  L_CAPTION[0] = Brake test failed"]
+        lines.append(")")
+        # A whole section that is only in some messages
+        if i % 3 == 0:
+            lines += ["ETCS ON-BOARD PROPRIETARY JURIDICAL DATA (", "  CURRENT_SPEED_1KPH = 40",
+                      f"  TRU_L_TEXT = Text {i % 2}", ")"]
+        if i in (4, 5, 6, 15):
+            lines += ["DRU ETCS (", "  Log message = Antenna failure", ")"]
+    path.write_text("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def files(tmp_path):
+    """
+    The same messages stored twice: with full rows and in delta mode with a keyframe every 3 messages.
+    """
+    db_path = tmp_path / "adru-test.db"
+    initialize_adru_database(db_path, JRU, ETCS, DRU)
+
+    amf_ids = []
+    for name, keyframe_interval in (("full", None), ("delta", 3)):
+        adru_path = tmp_path / f"{name}.adru"
+        adru_path.write_bytes(name.encode())
+        txt_path = tmp_path / f"{name}.txt"
+        _write_txt(txt_path)
+        if keyframe_interval:
+            # Another md5, so the file is not taken for the same decode
+            txt_path.write_text(txt_path.read_text() + "\n")
+        af_id = add_adru_file_to_db(db_path, adru_path)
+        amf_id, total_messages = add_message_file_to_db(db_path, txt_path, af_id)
+        insert_messages_from_txt(txt_path, db_path, amf_id, total_messages,
+                                 delta_keyframe_interval=keyframe_interval)
+        amf_ids.append(amf_id)
+    return db_path, *amf_ids
+
+
+def _without_am_id(messages):
+    return [{key: value for key, value in message.items() if key != "am_id"} for message in messages]
+
+
+def _am_ids(cursor, amf_id):
+    cursor.execute("SELECT am_id FROM adru_messages WHERE am_amf_id = ? ORDER BY am_id", (amf_id,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def test_delta_mode_stores_fewer_values(files):
+    db_path, full_id, delta_id = files
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        assert not is_delta_file(cursor, full_id)
+        assert is_delta_file(cursor, delta_id)
+        counts = []
+        for amf_id in (full_id, delta_id):
+            cursor.execute("""
+                SELECT COUNT(j."M_MODE") FROM adru_messages m JOIN adru_message_jru j ON j.amj_am_id = m.am_id
+                WHERE m.am_amf_id = ?
+            """, (amf_id,))
+            counts.append(cursor.fetchone()[0])
+    conn.close()
+    assert counts[0] == len(LOCAL_IDS)
+    assert counts[1] < counts[0]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 2000])
+def test_iter_file_messages_rebuilds_full_messages(files, chunk_size):
+    db_path, full_id, delta_id = files
+    full = _without_am_id(iter_file_messages(db_path, full_id, chunk_size))
+    assert [message["am_local_id"] for message in full] == sorted(LOCAL_IDS)
+    assert _without_am_id(iter_file_messages(db_path, delta_id, chunk_size)) == full
+
+
+def test_iter_file_messages_with_columns(files):
+    db_path, full_id, delta_id = files
+    columns = {"jru": ["V_TRAIN", "L_CAPTION[0]"], "etcs": ["TRU_L_TEXT"]}
+    full = _without_am_id(iter_file_messages(db_path, full_id, 5, columns))
+    assert _without_am_id(iter_file_messages(db_path, delta_id, 5, columns)) == full
+    assert all(set(message) <= {"am_local_id", "jru", "etcs"} for message in full)
+
+
+def test_fetch_messages_by_id_out_of_order(files):
+    db_path, full_id, delta_id = files
+    with connect_db(db_path, read_only=True) as conn:
+        cursor = conn.cursor()
+        full_ids, delta_ids = _am_ids(cursor, full_id), _am_ids(cursor, delta_id)
+        positions = list(range(len(LOCAL_IDS)))
+        random.Random(7).shuffle(positions)
+
+        full = fetch_messages_by_id(cursor, [full_ids[p] for p in positions])
+        # Delta messages in random order, with a full row message of the other file in between
+        delta = fetch_messages_by_id(cursor, [delta_ids[p] for p in positions[:10]] + [full_ids[0]]
+                                     + [delta_ids[p] for p in positions[10:]])
+        columns = {"jru": ["BALISE_RECEPTION_ERROR"], "dru": ["Log message"]}
+        full_subset = fetch_messages_by_id(cursor, full_ids[::-1], columns)
+        delta_subset = fetch_messages_by_id(cursor, delta_ids[::-1], columns)
+    conn.close()
+
+    assert all(delta[delta_ids[p]] == full[full_ids[p]] for p in positions)
+    assert delta[full_ids[0]] == full[full_ids[0]]
+    assert [delta_subset[am_id] for am_id in delta_ids] == [full_subset[am_id] for am_id in full_ids]